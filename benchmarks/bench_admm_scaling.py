@@ -0,0 +1,52 @@
+## Scaling of Jacobi ADMM with the number of workers, for a feeder with many
+## household solar sources and one aggregate load source.
+##
+## Usage: python benchmarks/bench_admm_scaling.py [homes] [days] [iterations]
+import os
+import sys
+import time
+import numpy as np
+
+## csss from the checkout this script is in
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import csss
+from synthetic import feederData
+
+def buildFeeder(netloads, solarregressors, loadregressors):
+    ## CSSS model of a feeder, with the solar bounds of SolarDisagg_IndvHome
+    model = csss.CSSS(np.sum(netloads, axis = 1))
+    for i in range(netloads.shape[1]):
+        model.addSource(solarregressors, name = str(i), ub = np.minimum(netloads[:, i], 0))
+    model.addSource(loadregressors, name = 'AggregateLoad', lb = 0)
+    return(model)
+
+def run(M = 200, days = 30, iterations = 20):
+    data = feederData(96 * days, M, order = 2)
+    netloads, solarregressors, loadregressors = data['netloads'], data['solarregressors'], data['loadregressors']
+    cores   = os.cpu_count() or 1
+    workers = [w for w in [1, 2, 4, 8, 16, 32] if w <= cores]
+
+    ## Gauss-Seidel baseline
+    model = buildFeeder(netloads, solarregressors, loadregressors)
+    model.admmSolve(1.0, MaxIter = iterations + 1, ABSTOL = 0, RELTOL = 0)
+    print('gauss-seidel: {:.4f}s per iteration'.format(np.mean(model.admmTiming)))
+
+    for schedule in ['static', 'dynamic']:
+        for executor in ['process', 'thread']:
+            if executor == 'process' and schedule == 'dynamic':
+                continue
+            base = None
+            for w in workers:
+                model = buildFeeder(netloads, solarregressors, loadregressors)
+                t0 = time.time()
+                model.admmSolve(1.0, MaxIter = iterations + 1, ABSTOL = 0, RELTOL = 0, method = 'jacobi',
+                                workers = w, executor = executor, schedule = schedule)
+                total = time.time() - t0
+                per_iter = np.median(model.admmTiming)
+                base = per_iter if base is None else base
+                print('jacobi {:7s} {:7s} workers {:2d}: {:.4f}s per iteration, speedup {:.2f}, total {:.2f}s'.format(
+                    executor, schedule, w, per_iter, base / per_iter, total))
+
+if __name__ == '__main__':
+    args = [int(a) for a in sys.argv[1:]]
+    run(*args)
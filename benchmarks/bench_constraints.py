@@ -0,0 +1,44 @@
+## Regression benchmark for repeated re-solves of a SolarDisagg_IndvHome model.
+## Solve time and the number of constraint rows sent to the solver should stay
+## flat across consecutive re-solves.
+##
+## Usage: python benchmarks/bench_constraints.py [homes] [days] [resolves]
+import os
+import sys
+import time
+import numpy as np
+
+## csss from the checkout this script is in
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from csss.SolarDisagg import SolarDisagg_IndvHome
+from synthetic import feederData
+
+def run(M = 20, days = 3, resolves = 20):
+    data = feederData(96 * days, M, order = 2)
+    netloads, solarregressors, loadregressors = data['netloads'], data['solarregressors'], data['loadregressors']
+    rng = np.random.RandomState(1)
+
+    for parameterize in [False, True]:
+        sd = SolarDisagg_IndvHome(netloads, solarregressors, loadregressors, parameterize = parameterize)
+        print('parameterize = {}: M = {}, N = {}'.format(parameterize, M, sd.N))
+        times = []
+        for i in range(resolves):
+            for name, m in sd.models.items():
+                m['alpha'] = rng.uniform(.5, 1.5, sd.N)
+            sd.scaleAlphas()
+            sd.updateSourceObj('all')
+
+            t0 = time.time()
+            sd.constructSolve()
+            times.append(time.time() - t0)
+            summary = sd.constraintSummary()
+            print('  resolve {:2d}: {:.3f}s, {} constraints, {} rows'.format(
+                i, times[-1], summary['total']['constraints'], summary['total']['rows']))
+
+        half = int(resolves / 2)
+        print('  mean solve time, first half {:.3f}s, second half {:.3f}s'.format(
+            np.mean(times[:half]), np.mean(times[half:])))
+
+if __name__ == '__main__':
+    args = [int(a) for a in sys.argv[1:]]
+    run(*args)
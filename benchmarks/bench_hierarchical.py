@@ -0,0 +1,74 @@
+## Scaling benchmark of hierarchical vs. monolithic solar disaggregation.
+##
+## Solves synthetic feeders of 100 to 5,000 homes with SolarDisagg_IndvHome's
+## constructSolve (monolithic, up to --max-monolithic homes) and hierarchicalSolve,
+## and reports wall time, peak traced memory of the parent process, objective
+## value, the largest violation of the sum of sources equality, and the RMSE of the
+## solar of each home against the synthetic truth.
+##
+## Usage: python benchmarks/bench_hierarchical.py [--homes 100 500 1000 2000 5000]
+##                                                [--days 1] [--workers N]
+##                                                [--max-monolithic 1000] [--out results.json]
+import argparse
+import json
+import os
+import sys
+import time
+import tracemalloc
+import numpy as np
+
+## csss from the checkout this script is in
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from csss.SolarDisagg import SolarDisagg_IndvHome
+from synthetic import feederData
+
+def measure(step):
+    ## Run step() and return its result, wall time and peak traced memory in MB
+    tracemalloc.start()
+    t0 = time.time()
+    result = step()
+    wall = time.time() - t0
+    peak = tracemalloc.get_traced_memory()[1] / 1e6
+    tracemalloc.stop()
+    return(result, wall, peak)
+
+def accuracy(sd, data):
+    ## Largest violation of the sum of sources equality, and RMSE of the homes' solar
+    solar = np.column_stack([np.ravel(np.array(sd.models[name]['source'].value)) for name in sd.names])
+    total = np.sum(solar, axis = 1) + np.ravel(np.array(sd.models['AggregateLoad']['source'].value))
+    return(float(np.max(np.abs(total - sd.aggregateSignal))), float(np.sqrt(np.mean((solar - data['solar']) ** 2))))
+
+def runCase(M, days, workers, maxMonolithic):
+    data    = feederData(96 * days, M)
+    records = []
+    modes   = ['hierarchical'] if M > maxMonolithic else ['monolithic', 'hierarchical']
+    for mode in modes:
+        def solve():
+            sd = SolarDisagg_IndvHome(data['netloads'], data['solarregressors'], data['loadregressors'])
+            if mode == 'monolithic':
+                return(sd, sd.constructSolve())
+            return(sd, sd.hierarchicalSolve(workers = workers))
+        (sd, value), wall, peak = measure(solve)
+        equality, rmse = accuracy(sd, data)
+        records.append({'M': M, 'N': sd.N, 'mode': mode, 'wall': wall, 'peak_mb': peak, 'objective': float(value),
+                        'equality': equality, 'rmse': rmse,
+                        'groups': len(sd.homeGroups) if mode == 'hierarchical' else 1})
+        print('{:6d} {:<13s} {:9.2f}s {:9.1f} MB  objective {:12.4f}  equality {:.1e}  rmse {:.4f}'.format(
+            M, mode, wall, peak, value, equality, rmse))
+    return(records)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--homes', type = int, nargs = '+', default = [100, 500, 1000, 2000, 5000])
+    parser.add_argument('--days', type = int, default = 1)
+    parser.add_argument('--workers', type = int, default = None)
+    parser.add_argument('--max-monolithic', type = int, default = 1000)
+    parser.add_argument('--out', default = None)
+    args = parser.parse_args()
+
+    results = []
+    for M in args.homes:
+        results.extend(runCase(M, args.days, args.workers, args.max_monolithic))
+    if args.out is not None:
+        with open(args.out, 'w') as f:
+            json.dump(results, f, indent = 1)
@@ -0,0 +1,66 @@
+## Benchmark of the import time of csss.
+##
+## Times each import statement in fresh interpreters, and lists the heavy
+## dependencies (cvxpy, scipy, pandas, sklearn) it imports, from the checkout this
+## script is in. --path runs against another checkout of the package, e.g. a
+## previous version, to compare:
+##
+##   git worktree add /tmp/csss-before <revision>
+##   python benchmarks/bench_import.py --path /tmp/csss-before --out before.json
+##   python benchmarks/bench_import.py --out after.json --compare before.json
+import argparse
+import json
+import os
+import subprocess
+import sys
+import numpy as np
+
+STATEMENTS = ['import csss',
+              'import csss.SolarDisagg',
+              'from csss.Storage import loadFitted; from csss.SolarDisagg import SolarDisagg_IndvHome_Realtime']
+HEAVY = ['cvxpy', 'scipy', 'pandas', 'sklearn']
+ROOT  = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PROBE = '''
+import sys, time, json
+t0 = time.time()
+exec(sys.argv[1])
+wall = time.time() - t0
+print(json.dumps({'wall': wall, 'modules': [m for m in sys.argv[2:] if m in sys.modules]}))
+'''
+
+def timeImport(statement, path = None, repeats = 5):
+    ## Median wall time of statement in fresh interpreters, and the heavy modules it imports
+    env = dict(os.environ)
+    env['PYTHONPATH'] = (ROOT if path is None else path) + os.pathsep + env.get('PYTHONPATH', '')
+    walls = []
+    for i in range(repeats):
+        out = subprocess.check_output([sys.executable, '-c', PROBE, statement] + HEAVY, env = env,
+                                      stderr = subprocess.DEVNULL)
+        result = json.loads(out.decode().strip().splitlines()[-1])
+        walls.append(result['wall'])
+    return({'statement': statement, 'wall': float(np.median(walls)), 'modules': result['modules']})
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--path', default = None)
+    parser.add_argument('--repeats', type = int, default = 5)
+    parser.add_argument('--out', default = None)
+    parser.add_argument('--compare', default = None)
+    args = parser.parse_args()
+
+    previous = {}
+    if args.compare is not None:
+        with open(args.compare) as f:
+            previous = dict([(r['statement'], r) for r in json.load(f)])
+    results = []
+    for statement in STATEMENTS:
+        r = timeImport(statement, args.path, args.repeats)
+        results.append(r)
+        line = '{:8.3f}s  {:<40s} {}'.format(r['wall'], ', '.join(r['modules']), statement)
+        if statement in previous:
+            line = line + '  (before {:.3f}s)'.format(previous[statement]['wall'])
+        print(line)
+    if args.out is not None:
+        with open(args.out, 'w') as f:
+            json.dump(results, f, indent = 1)
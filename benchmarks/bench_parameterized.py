@@ -0,0 +1,57 @@
+## Benchmark of compile vs. solve time for repeated re-solves of a
+## SolarDisagg_IndvHome model, with and without the parameterized mode.
+##
+## Usage: python benchmarks/bench_parameterized.py [homes] [days] [resolves]
+import os
+import sys
+import time
+import numpy as np
+
+## csss from the checkout this script is in
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from csss.SolarDisagg import SolarDisagg_IndvHome
+from synthetic import feederData
+
+def timeSolve(sd):
+    ## Split the wall time of constructSolve into solver time and everything else
+    t0   = time.time()
+    sd.constructSolve()
+    wall = time.time() - t0
+    solve_time = None
+    if getattr(sd.lastProblem, 'solver_stats', None) is not None:
+        solve_time = sd.lastProblem.solver_stats.solve_time
+    return(wall, solve_time)
+
+def run(M = 50, days = 7, resolves = 5):
+    data = feederData(96 * days, M, order = 2)
+    netloads, solarregressors, loadregressors = data['netloads'], data['solarregressors'], data['loadregressors']
+    rng = np.random.RandomState(1)
+
+    for parameterize in [False, True]:
+        t0 = time.time()
+        sd = SolarDisagg_IndvHome(netloads, solarregressors, loadregressors, parameterize = parameterize)
+        build = time.time() - t0
+
+        times = []
+        for i in range(resolves):
+            ## Mimic a retune: new alphas, rescale and rebuild objectives.
+            for name, m in sd.models.items():
+                m['alpha'] = rng.uniform(.5, 1.5, sd.N)
+            t0 = time.time()
+            sd.scaleAlphas()
+            sd.updateSourceObj('all')
+            update = time.time() - t0
+            wall, solve_time = timeSolve(sd)
+            times.append((update, wall, solve_time))
+
+        print('parameterize = {}: M = {}, N = {}, build {:.3f}s'.format(parameterize, M, sd.N, build))
+        for i, (update, wall, solve_time) in enumerate(times):
+            if solve_time is None:
+                print('  resolve {:2d}: update {:.3f}s, constructSolve {:.3f}s'.format(i, update, wall))
+            else:
+                print('  resolve {:2d}: update {:.3f}s, compile {:.3f}s, solve {:.3f}s'.format(
+                    i, update, wall - solve_time, solve_time))
+
+if __name__ == '__main__':
+    args = [int(a) for a in sys.argv[1:]]
+    run(*args)
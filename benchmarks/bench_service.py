@@ -0,0 +1,60 @@
+## Benchmark of the realtime disaggregation service (csss.Service) with a local
+## stand-in producer: throughput and end-to-end latency percentiles of many feeders
+## streaming one reading at a time, solved per reading vs. in micro-batches.
+##
+## Usage: python benchmarks/bench_service.py [feeders] [readings] [workers] [interval ms]
+import os
+import sys
+import time
+import asyncio
+import numpy as np
+
+## csss from the checkout this script is in
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from csss import Service
+from csss.SolarDisagg import SolarDisagg_IndvHome, SolarDisagg_IndvHome_Realtime
+from synthetic import feederData
+
+def fittedFeeder(data, N):
+    ## SolarDisagg_IndvHome fitted on the first N samples of a feeder
+    sd = SolarDisagg_IndvHome(data['netloads'][:N], data['solarregressors'][:N], data['loadregressors'][:N],
+                              tuningregressors = data['tuningregressors'][:N])
+    for i in range(sd.M):
+        sd.addTrueValue(data['solar'][:N, i], sd.names[i])
+    sd.constructSolve()
+    sd.fitTuneModels()
+    sd.tuneAlphas()
+    sd.constructSolve()
+    return(sd)
+
+async def stream(sd, data, feeders, readings, workers, batchWindow, interval):
+    N   = 96
+    agg = np.sum(data['netloads'], axis = 1)
+    models = {}
+    for f in range(feeders):
+        models[f] = SolarDisagg_IndvHome_Realtime(sd, agg[:N], data['solarregressors'][:N], data['loadregressors'][:N],
+                                                  data['tuningregressors'][:N])
+        models[f].constructSolve()
+    window = slice(N, N + readings)
+    feeds  = dict([(f, (agg[window], data['solarregressors'][window], data['loadregressors'][window],
+                        data['tuningregressors'][window])) for f in range(feeders)])
+
+    service = Service.RealtimeService(models, workers = workers, batchWindow = batchWindow, publish = lambda result: None)
+    t0 = time.time()
+    async with service:
+        await Service.replay(service, feeds, interval = interval)
+    return(time.time() - t0, service.stats())
+
+def run(feeders = 20, readings = 48, workers = 4, interval = 10):
+    ## A reading of every feeder each interval milliseconds
+    data = feederData(96 * 3, 5)
+    sd   = fittedFeeder(data, 96 * 2)
+    for batchWindow in [0.0, 0.05, 0.2]:
+        wall, stats = asyncio.run(stream(sd, data, feeders, readings, workers, batchWindow, interval / 1000.0))
+        print('batchWindow {:.2f}s: {} readings in {:.2f}s ({:.0f}/s), {} solves, latency p50 {:.3f}s p90 {:.3f}s p99 {:.3f}s'.format(
+            batchWindow, stats['received'], wall, stats['received'] / wall, stats['solves'],
+            stats['latencyP50'], stats['latencyP90'], stats['latencyP99']))
+
+if __name__ == '__main__':
+    args = [int(a) for a in sys.argv[1:]]
+    run(*args)
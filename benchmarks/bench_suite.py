@@ -0,0 +1,168 @@
+## Benchmark suite for the hot paths of CSSS and SolarDisagg.
+##
+## Times each step on synthetic feeders over a grid of sample counts N, home
+## counts M and solar regressor orders, and writes the results as JSON with wall
+## time, peak traced memory and, for constructSolve, the compile vs. solve split.
+## Runs entirely offline.
+##
+## Usage: python benchmarks/bench_suite.py [--grid quick|full] [--out results.json]
+##                                         [--compare previous.json]
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+import numpy as np
+
+import cvxpy as cvp
+
+## csss from the checkout this script is in
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import csss
+from csss.SolarDisagg import SolarDisagg_IndvHome
+from synthetic import feederData
+
+GRIDS = {
+    'quick': {'N': [96, 96 * 7], 'M': [1, 10], 'order': [1, 2]},
+    'full':  {'N': [96, 96 * 7, 96 * 30, 96 * 365], 'M': [1, 10, 100, 1000], 'order': [1, 2, 4]},
+}
+
+def measure(step, memory = True):
+    ## Run step() and return its result, wall time and peak traced memory in MB
+    if memory:
+        tracemalloc.start()
+    t0 = time.time()
+    result = step()
+    wall = time.time() - t0
+    peak = None
+    if memory:
+        peak = tracemalloc.get_traced_memory()[1] / 1e6
+        tracemalloc.stop()
+    return(result, wall, peak)
+
+def feederModel(data):
+    ## CSSS model of a feeder with addSource, as SolarDisagg_IndvHome builds it
+    netloads = data['netloads']
+    model = csss.CSSS(np.sum(netloads, axis = 1))
+    for i in range(netloads.shape[1]):
+        model.addSource(data['solarregressors'], name = str(i), ub = np.minimum(netloads[:, i], 0))
+    model.addSource(data['loadregressors'], name = 'AggregateLoad', lb = 0)
+    return(model)
+
+def solveSplit(model):
+    ## Split constructSolve into compile and solve time, from the solver statistics
+    model.lastProblem = None
+    t0 = time.time()
+    model.constructSolve()
+    wall  = time.time() - t0
+    split = {'path': 'native' if model.lastProblem is None else 'cvxpy'}
+    stats = getattr(model.lastProblem, 'solver_stats', None)
+    if stats is not None and stats.solve_time is not None:
+        split['solve']   = stats.solve_time
+        split['compile'] = wall - stats.solve_time
+    return(split)
+
+def runCase(N, M, order, memory = True, maxSolveSize = 2e6, admmIterations = 10, tuneHomes = 3):
+    ## Time every step for one grid point, returns a list of result records
+    data    = feederData(N, M, order)
+    records = []
+    solve   = N * (M + 1) <= maxSolveSize
+
+    def record(step, wall, peak, **extra):
+        rec = {'N': N, 'M': M, 'order': order, 'step': step, 'wall': wall, 'peak_mb': peak}
+        rec.update(extra)
+        records.append(rec)
+        if wall is None:
+            print('  {:<24s} skipped, {}'.format(step, extra.get('skipped')))
+            return
+        line = '  {:<24s} {:8.3f}s'.format(step, wall)
+        if peak is not None:
+            line = line + ' {:8.1f} MB'.format(peak)
+        if 'compile' in extra:
+            line = line + ', compile {:.3f}s, solve {:.3f}s'.format(extra['compile'], extra['solve'])
+        print(line)
+
+    print('N = {}, M = {}, order = {}'.format(N, M, order))
+    model, wall, peak = measure(lambda: feederModel(data), memory)
+    record('CSSS.addSource', wall, peak, sources = M + 1)
+    _, wall, peak = measure(lambda: model.updateSourceObj('all'), memory)
+    record('updateSourceObj', wall, peak)
+    if solve:
+        split, wall, peak = measure(lambda: solveSplit(model), memory)
+        record('constructSolve', wall, peak, **split)
+        _, wall, peak = measure(lambda: model.admmSolve(1.0, MaxIter = admmIterations + 1, ABSTOL = 0, RELTOL = 0), memory)
+        record('admmSolve', wall, peak, iterations = admmIterations, per_iteration = float(np.mean(model.admmTiming)))
+    else:
+        for step in ['constructSolve', 'admmSolve']:
+            record(step, None, None, skipped = 'N x (M + 1) > %g' % maxSolveSize)
+
+    sd, wall, peak = measure(lambda: SolarDisagg_IndvHome(data['netloads'], data['solarregressors'], data['loadregressors'],
+                                                          tuningregressors = data['tuningregressors']), memory)
+    record('SolarDisagg_IndvHome', wall, peak)
+    names = sd.names[:tuneHomes]
+    for i, name in enumerate(sd.names):
+        sd.addTrueValue(data['solar'][:, i], name)
+    sd.addTrueValue(np.sum(data['load'], axis = 1), 'AggregateLoad')
+
+    _, wall, peak = measure(lambda: sd.fitTuneModels(tuneSys = names), memory)
+    record('fitTuneModels', wall, peak)
+    if solve:
+        sd.constructSolve()
+    else:
+        ## tuneAlphas and the metrics need a solution, use the true signals
+        thetas = {}
+        for i, name in enumerate(sd.names):
+            thetas[name] = np.linalg.lstsq(data['solarregressors'], data['solar'][:, i], rcond = None)[0]
+        thetas['AggregateLoad'] = np.linalg.lstsq(data['loadregressors'], np.sum(data['load'], axis = 1), rcond = None)[0]
+        sources = dict([(name, sd.trueValues[name]) for name in sd.models.keys()])
+        sd._storeSolutions(sources, thetas)
+    _, wall, peak = measure(lambda: sd.tuneAlphas(), memory)
+    record('tuneAlphas', wall, peak)
+    _, wall, peak = measure(lambda: sd.calcPerformanceMetrics(), memory)
+    record('calcPerformanceMetrics', wall, peak)
+    return(records)
+
+def compare(results, previous):
+    ## Print the ratio of wall times and peak memory to a previous run
+    key  = lambda r: (r['N'], r['M'], r['order'], r['step'])
+    prev = dict([(key(r), r) for r in previous['results']])
+    print('{:>6s} {:>5s} {:>5s} {:<24s} {:>8s} {:>8s}'.format('N', 'M', 'order', 'step', 'time', 'memory'))
+    for r in results['results']:
+        p = prev.get(key(r))
+        if p is None or r['wall'] is None or p['wall'] is None:
+            continue
+        mem = '' if r['peak_mb'] is None or not p['peak_mb'] else '{:8.2f}'.format(r['peak_mb'] / p['peak_mb'])
+        print('{:6d} {:5d} {:5d} {:<24s} {:8.2f} {}'.format(r['N'], r['M'], r['order'], r['step'],
+                                                          r['wall'] / max(p['wall'], 1e-9), mem))
+
+def run(grid = 'quick', out = None, memory = True, maxSolveSize = 2e6, previous = None):
+    results = {'meta': {'time': time.strftime('%Y-%m-%dT%H:%M:%S'), 'grid': grid,
+                        'python': platform.python_version(), 'platform': platform.platform(),
+                        'numpy': np.__version__, 'cvxpy': getattr(cvp, '__version__', None),
+                        'memory': memory, 'maxSolveSize': maxSolveSize},
+               'results': []}
+    g = GRIDS[grid]
+    for N in g['N']:
+        for M in g['M']:
+            for order in g['order']:
+                results['results'] += runCase(N, M, order, memory, maxSolveSize)
+
+    if out is not None:
+        with open(out, 'w') as f:
+            json.dump(results, f, indent = 1)
+    if previous is not None:
+        with open(previous) as f:
+            compare(results, json.load(f))
+    return(results)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = 'CSSS benchmark suite')
+    parser.add_argument('--grid', default = 'quick', choices = sorted(GRIDS.keys()))
+    parser.add_argument('--out', default = 'bench_results.json')
+    parser.add_argument('--compare', default = None, help = 'previous results to compare to')
+    parser.add_argument('--no-memory', action = 'store_true', help = 'do not trace memory, which slows down the steps')
+    parser.add_argument('--max-solve-size', type = float, default = 2e6, help = 'skip solves with more than this many source samples')
+    args = parser.parse_args()
+    run(args.grid, args.out, not args.no_memory, args.max_solve_size, args.compare)
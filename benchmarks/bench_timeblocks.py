@@ -0,0 +1,57 @@
+## Parallel speedup of CSSS.timeBlockSolve on a feeder with fixed thetas.
+##
+## Fits the thetas of a synthetic feeder once, fixes them, and solves the banded
+## problem (diff1_ss on the aggregate load) as one cvxpy problem and in time blocks
+## with 1, 2, 4, ... worker processes, up to the number of cpus. Reports wall time,
+## speedup over one worker, and the largest difference of the sources to the
+## monolithic solution.
+##
+## Usage: python benchmarks/bench_timeblocks.py [homes] [days] [block days] [reconcile]
+import os
+import sys
+import time
+import numpy as np
+
+## csss from the checkout this script is in
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from csss.SolarDisagg import SolarDisagg_IndvHome
+from synthetic import feederData
+
+def fixedModel(data, fitDays = 7):
+    ## Feeder model with the thetas fitted on the first fitDays days, then fixed,
+    # over the whole horizon
+    n   = 96 * fitDays
+    fit = SolarDisagg_IndvHome(data['netloads'][:n], data['solarregressors'][:n], data['loadregressors'][:n])
+    fit.constructSolve()
+    model = SolarDisagg_IndvHome(data['netloads'], data['solarregressors'], data['loadregressors'])
+    for name, m in model.models.items():
+        m['theta'] = np.array(fit.models[name]['theta'].value)
+    model.models['AggregateLoad']['regularizeSource'] = 'diff1_ss'
+    model.models['AggregateLoad']['gamma'] = 0.1
+    model.updateSourceObj('all')
+    return(model)
+
+def run(M = 20, days = 56, blockDays = 7, reconcile = 1):
+    data  = feederData(96 * days, M)
+    model = fixedModel(data)
+    t0 = time.time()
+    model.constructSolve(backend = 'cvxpy')
+    print('monolithic cvxpy: {:.2f}s'.format(time.time() - t0))
+    reference = np.array(model.solutionArray())
+
+    cores   = os.cpu_count() or 1
+    workers = [w for w in [1, 2, 4, 8, 16, 32] if w <= cores]
+    base    = None
+    for w in workers:
+        model = fixedModel(data)
+        t0 = time.time()
+        model.timeBlockSolve(96 * blockDays, reconcile = reconcile, workers = w)
+        wall = time.time() - t0
+        base = wall if base is None else base
+        error = np.max(np.abs(np.array(model.solutionArray()) - reference))
+        print('time blocks, {:2d} workers: {:.2f}s, speedup {:.2f}, max difference {:.1e}'.format(w, wall, base / wall, error))
+    print('{} cpus available'.format(cores))
+
+if __name__ == '__main__':
+    args = [int(a) for a in sys.argv[1:]]
+    run(*args)
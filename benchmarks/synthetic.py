@@ -0,0 +1,50 @@
+## Synthetic feeder data for the benchmarks, shaped like the tutorial data:
+## 15 minute net loads of M homes, solar proxies, and load regressors built from
+## hour of day dummies and a piecewise linear temperature input.
+import numpy as np
+
+def temperatureInput(temp, size):
+    ## Piecewise linear temperature regressors, one column per temperature range of
+    # width size, as createTempInput in the tutorial notebook.
+    lower  = np.floor(np.min(temp) / size) * size
+    ranges = int(np.floor(np.max(temp) / size) * size + size - lower) // size
+    edges  = lower + size * np.arange(ranges)
+    return(np.clip(temp[:, None] - edges[None, :], 0, size))
+
+def hourOfDay(N, perHour = 4):
+    ## Hour of day dummies for N samples at perHour samples per hour
+    hod = (np.arange(N) // perHour) % 24
+    return(np.eye(24)[hod])
+
+def feederData(N, M, order = 1, seed = 0):
+    ## Synthetic data for a feeder of M homes over N 15 minute samples.
+    # order is the number of solar proxy columns. Returns a dict with netloads,
+    # solar and load (N x M), and solar, load and tuning regressors.
+    rng  = np.random.RandomState(seed)
+    hour = (np.arange(N) % 96) / 4.0
+    day  = np.arange(N) // 96
+    sun  = np.clip(np.sin((hour - 6) / 12.0 * np.pi), 0, None)
+
+    ## Daily cloudiness and temperature
+    clouds = rng.uniform(.4, 1, day[-1] + 1)[day]
+    temp   = 15 + 10 * np.sin((hour - 9) / 24.0 * 2 * np.pi) + 5 * rng.randn(day[-1] + 1)[day] + rng.randn(N)
+
+    ## Solar proxies, e.g. nearby reference systems, with their own noise
+    proxies = sun[:, None] * clouds[:, None] * rng.uniform(.8, 1.2, (N, order))
+
+    ## Solar of each home is a mix of the proxies, load follows time of day and temperature
+    capacity = rng.uniform(2, 6, M)
+    mix      = rng.dirichlet(np.ones(order), M)
+    solar    = -np.dot(proxies, (mix * capacity[:, None]).T) * rng.uniform(.9, 1, (N, M))
+    daily    = 1 + .5 * np.sin((hour - 12) / 24.0 * 2 * np.pi)
+    load     = daily[:, None] + .05 * np.clip(temp - 22, 0, None)[:, None] + .3 * rng.rand(N, M)
+
+    hod = hourOfDay(N)
+    data = {}
+    data['netloads']         = load + solar
+    data['solar']            = solar
+    data['load']             = load
+    data['solarregressors']  = proxies
+    data['loadregressors']   = np.hstack([hod, temperatureInput(temp, 10)])
+    data['tuningregressors'] = hod
+    return(data)
@@ -0,0 +1,556 @@
+import os
+import time
+import concurrent.futures
+import multiprocessing
+import numpy as np
+import scipy.linalg as sla
+import cvxpy as cvp
+from csss import LeastSquares
+from csss import Profiling
+from csss.Registry import boundArrays
+
+## Native ADMM engine for CSSS.admmSolve.
+#
+# Each ADMM iteration updates every source with the proximal step
+#
+#   min  f_i(s, theta) + rho/2 || s - v ||^2   s.t.  lb <= s <= ub
+#
+# where v is the aggregate signal minus the other sources and the scaled dual u.
+# For the sse cost (with optional diff1_ss and 'ss' regularizers) this is a linear
+# system whose matrices only depend on alpha, gamma, beta and rho, so they are
+# factorized once per source and each update is a banded solve plus a small dense
+# one. With bounds the update is a box constrained QP, solved exactly with a
+# primal-dual active set method (see SourceProx.boundedUpdate). Sources that cannot
+# be updated in closed form fall back to a cvxpy problem that is built once and
+# re-solved with v as a parameter.
+
+def sourceConstraints(csssobj, name):
+    ## Custom constraints that involve the variables of a source, split into those
+    # that only involve this source and those shared with other sources.
+    model = csssobj.models[name]
+    ids   = set([model['source'].id])
+    if isinstance(model['theta'], cvp.Variable):
+        ids.add(model['theta'].id)
+    local  = []
+    shared = []
+    for con in csssobj.constraints:
+        conIds = set([v.id for v in con.variables()])
+        if conIds <= ids:
+            local.append(con)
+        elif conIds & ids:
+            shared.append(con)
+    return(local, shared)
+
+def isNative(csssobj, name):
+    ## Check whether the proximal update of a source has a closed form.
+    model = csssobj.models[name]
+    local, shared = sourceConstraints(csssobj, name)
+    if len(local) + len(shared) > 0:
+        return(False)
+    if callable(model['regularizeTheta']) or str(model['regularizeTheta']).lower() not in ['none', 'ss']:
+        return(False)
+    if np.any(np.array(model['alpha']) < 0):
+        return(False)
+    fixed = isinstance(model['theta'], np.ndarray)
+    if model['costFunction'].lower() == 'sse':
+        return(not callable(model['regularizeSource']) and str(model['regularizeSource']).lower() in ['none', 'diff1_ss'])
+    if model['costFunction'].lower() == 'l1':
+        return(fixed and model['regularizeSource'] is None)
+    return(False)
+
+class SourceProx:
+    ## Closed form proximal update of a single source, with cached factorizations.
+
+    def __init__(self, terms, costFunction, lb, ub, rho, innerIter = 50):
+        self.terms   = terms
+        self.cost    = costFunction.lower()
+        self.lb      = lb
+        self.ub      = ub
+        self.rho     = rho
+        self.bounded = np.any(np.isfinite(lb)) or np.any(np.isfinite(ub))
+        self.innerIter = innerIter
+        self.N       = len(terms['alpha'])
+        self.order   = terms['regressor'].shape[1]
+        self.theta   = np.zeros(self.order)
+        self.active  = None
+        if self.cost != 'sse':
+            return
+
+        alpha = terms['alpha']
+        X     = terms['regressor']
+
+        ## M = diag(alpha) + gamma D'D + rho/2 I, tridiagonal and positive definite,
+        # with diagonal mDiag and off-diagonal mOff
+        self.diag  = alpha + rho / 2.0
+        self.mDiag = self.diag
+        self.mOff  = np.zeros(self.N - 1)
+        if terms['gamma'] > 0:
+            L  = LeastSquares.diffGram(self.N)
+            self.mDiag = self.diag + terms['gamma'] * L.diagonal()
+            self.mOff  = terms['gamma'] * L.diagonal(1)
+            ab = np.zeros((2, self.N))
+            ab[0, 1:] = self.mOff
+            ab[1, :]  = self.mDiag
+            self.banded = sla.cholesky_banded(ab)
+        else:
+            self.banded = None
+
+        if self.order > 0:
+            self.AX  = alpha[:, None] * X
+            self.XAX = np.dot(X.T, self.AX) + np.diag(terms['beta'])
+            self.G   = self.solveM(self.AX)
+            self.S   = sla.cho_factor(self.XAX - np.dot(self.AX.T, self.G))
+
+    def solveM(self, b):
+        ## Solve M x = b
+        if self.banded is None:
+            if b.ndim > 1:
+                return(b / self.diag[:, None])
+            return(b / self.diag)
+        return(sla.cho_solve_banded((self.banded, False), b))
+
+    def update(self, v):
+        ## Proximal step towards v, returns the new source, theta and the value
+        # of f(s, theta) + rho/2 || s - v ||^2.
+        t = self.terms
+        if self.cost == 'l1':
+            ## Soft thresholding around the fixed model estimate, separable in time
+            w = v - t['baseline']
+            k = t['alpha'] / self.rho
+            s = t['baseline'] + np.sign(w) * np.maximum(np.abs(w) - k, 0)
+            s = np.clip(s, self.lb, self.ub)
+            return(s, self.theta, self.objective(s, self.theta) + self.rho / 2.0 * np.sum((s - v) ** 2))
+
+        q = self.solveM(t['alpha'] * t['baseline'] + self.rho / 2.0 * v)
+        if self.order > 0:
+            theta = sla.cho_solve(self.S, np.dot(self.AX.T, q - t['baseline']))
+            s     = np.dot(self.G, theta) + q
+        else:
+            theta = self.theta
+            s     = q
+
+        if self.bounded and (self.order > 0 or self.banded is not None):
+            theta, s = self.boundedUpdate(s, theta, v)
+        elif self.bounded:
+            ## Separable in time, the projection is exact
+            s = np.clip(s, self.lb, self.ub)
+
+        self.theta = theta
+        return(s, theta, self.objective(s, theta) + self.rho / 2.0 * np.sum((s - v) ** 2))
+
+    def multiplyM(self, x):
+        ## M x for the tridiagonal M
+        y = self.mDiag * x
+        y[:-1] = y[:-1] + self.mOff * x[1:]
+        y[1:]  = y[1:] + self.mOff * x[:-1]
+        return(y)
+
+    def solveFree(self, free, b):
+        ## Solve M[free, free] x = b. Free samples that are not neighbours in time
+        # are not coupled, so the submatrix is tridiagonal as well.
+        idx = np.flatnonzero(free)
+        if len(idx) == 1:
+            return(b / self.mDiag[idx[0]])
+        ab  = np.zeros((2, len(idx)))
+        ab[0, 1:] = np.where(np.diff(idx) == 1, self.mOff[idx[:-1]], 0)
+        ab[1, :]  = self.mDiag[idx]
+        return(sla.solveh_banded(ab, b))
+
+    def boundedUpdate(self, s, theta, v):
+        ## Exact bounded update, the box constrained QP
+        #   min  s'Ms/2 - s'(alpha b + rho/2 v) - s'AX theta + theta'XAX theta/2
+        # solved with a primal-dual active set method (Hintermueller, Ito and Kunisch
+        # 2002). Samples outside the bounds at the last iterate are fixed to them,
+        # the others and theta solve the KKT system with those fixed, until the
+        # active set repeats; the solution is then exact. The active set is warm
+        # started from the previous update (or s, the unconstrained update), so this
+        # takes few iterations once ADMM settles. After innerIter iterations the
+        # last iterate is projected onto the bounds.
+        t   = self.terms
+        b   = t['baseline']
+        rs  = t['alpha'] * b + self.rho / 2.0 * v
+        if self.active is None:
+            low, upp = s < self.lb, s > self.ub
+        else:
+            low, upp = self.active
+        for i in range(self.innerIter):
+            clip = low | upp
+            free = ~clip
+            s    = np.where(low, self.lb, np.where(upp, self.ub, 0.0))
+            r    = rs - self.multiplyM(s)
+            if self.order > 0:
+                H   = self.XAX
+                rhs = np.dot(self.AX[clip].T, s[clip] - b[clip])
+                if np.any(free):
+                    Y   = self.solveFree(free, np.column_stack([r[free], self.AX[free]]))
+                    H   = H - np.dot(self.AX[free].T, Y[:, 1:])
+                    rhs = rhs + np.dot(self.AX[free].T, Y[:, 0] - b[free])
+                theta = np.linalg.solve(H, rhs)
+                if np.any(free):
+                    s[free] = Y[:, 0] + np.dot(Y[:, 1:], theta)
+                grad = self.multiplyM(s) - rs - np.dot(self.AX, theta)
+            else:
+                if np.any(free):
+                    s[free] = self.solveFree(free, r[free])
+                grad = self.multiplyM(s) - rs
+
+            ## Next active set: samples whose scaled gradient step leaves the box
+            z = s - grad / self.mDiag
+            newLow, newUpp = z < self.lb, z > self.ub
+            if np.array_equal(newLow, low) and np.array_equal(newUpp, upp):
+                break
+            low, upp = newLow, newUpp
+        self.active = (low, upp)
+        return(theta, np.clip(s, self.lb, self.ub))
+
+    def objective(self, s, theta):
+        ## Value of the source objective f(s, theta)
+        t = self.terms
+        resid = s - t['baseline'] - np.dot(t['regressor'], theta)
+        if self.cost == 'l1':
+            return(np.sum(t['alpha'] * np.abs(resid)) + t['constant'])
+        obj = np.sum(t['alpha'] * resid ** 2) + t['gamma'] * np.sum(np.diff(s) ** 2)
+        return(obj + np.sum(t['beta'] * theta ** 2) + t['constant'])
+
+class CvxpyProx:
+    ## Proximal update of a source through cvxpy, built once with v as a parameter.
+
+    def __init__(self, csssobj, name, rho):
+        self.model = csssobj.models[name]
+        self.N     = csssobj.N
+        self.v     = cvp.Parameter(self.N, 1)
+        obj = self.model['obj'] + (rho / 2.0) * cvp.sum_squares(self.model['source'] - self.v)
+
+        ## Keep bounds and the custom constraints that only involve this source
+        con = sourceConstraints(csssobj, name)[0]
+        if self.model['lb'] is not None:
+            con.append(self.model['source'] >= self.model['lb'])
+        if self.model['ub'] is not None:
+            con.append(self.model['source'] <= self.model['ub'])
+        self.problem = cvp.Problem(cvp.Minimize(obj), con)
+
+    def update(self, v):
+        self.v.value = np.reshape(v, (self.N, 1))
+        value = self.problem.solve()
+        s = np.ravel(np.array(self.model['source'].value))
+        if isinstance(self.model['theta'], cvp.Variable):
+            theta = np.ravel(np.array(self.model['theta'].value))
+        else:
+            theta = None
+        return(s, theta, value)
+
+def sourceProx(csssobj, name, rho, innerIter = 50):
+    ## Build the proximal operator for a source, closed form when possible.
+    model = csssobj.models[name]
+    if isNative(csssobj, name):
+        lb, ub = boundArrays(model, csssobj.N)
+        return(SourceProx(LeastSquares.sourceTerms(csssobj, name), model['costFunction'], lb, ub, rho, innerIter))
+    if 'group' in model:
+        ## The objective of a group member is held by the group
+        raise ValueError('Source {} of group {} has no closed form ADMM update'.format(name, model['group']))
+    return(CvxpyProx(csssobj, name, rho))
+
+def admmSolve(csssobj, rho, MaxIter = 500, ABSTOL = 1e-4, RELTOL = 1e-1, verbose = False, innerIter = 50):
+    ## Gauss-Seidel ADMM over the sources of a CSSS object.
+    # Returns the objective of the last proximal step of each iteration, the norm
+    # of the equality residual at each iteration, and the scaled dual variable u.
+    # Progress is reported as profiling events, printed if verbose is True.
+    # innerIter caps the active set iterations of bounded updates.
+    with Profiling.verbose(csssobj, verbose), Profiling.phase(csssobj, 'admmSolve'):
+        return(_admmSolve(csssobj, rho, MaxIter, ABSTOL, RELTOL, innerIter))
+
+def _admmSolve(csssobj, rho, MaxIter, ABSTOL, RELTOL, innerIter):
+    csssobj._refreshSources()
+    N     = csssobj.N
+    names = list(csssobj.models.keys())
+    y     = np.ravel(np.array(csssobj.aggregateSignal, dtype = float))
+
+    dual_objective      = []
+    norm_resid_equality = []
+    overall_complexity  = np.sum([csssobj.models[name]['order'] for name in names])
+    Profiling.event(csssobj, 'admmStart', method = 'gauss-seidel', rho = rho, sources = len(names))
+
+    ## Initialize sources to zeros and factorize each proximal update once
+    with Profiling.phase(csssobj, 'admmSetup'):
+        prox = dict([(name, sourceProx(csssobj, name, rho, innerIter)) for name in names])
+    sources = dict([(name, np.zeros(N)) for name in names])
+    thetas  = dict([(name, None) for name in names])
+    total   = np.zeros(N)
+    u       = np.zeros(N)
+    Profiling.event(csssobj, 'admmInitialized')
+
+    timing = []
+    for k in range(1, MaxIter):
+        t0 = time.time()
+        for name in names:
+            ## Update each source keeping the other sources constant
+            v = y - (total - sources[name]) - u
+            s, theta, last_obj = prox[name].update(v)
+            source_update_diff = s - sources[name]
+            total         = total + source_update_diff
+            sources[name] = s
+            thetas[name]  = theta
+
+        dual_objective.append(last_obj)
+        resid = total - y
+        u     = u + resid
+
+        norm_resid = np.linalg.norm(resid)
+        eps_pri    = np.sqrt(overall_complexity) * ABSTOL + RELTOL * max(np.linalg.norm(total), np.linalg.norm(y))
+        norm_resid_equality.append(norm_resid)
+
+        s_norm   = np.linalg.norm(-rho * source_update_diff)
+        eps_dual = np.sqrt(overall_complexity) * ABSTOL + RELTOL * np.linalg.norm(rho * u)
+        timing.append(time.time() - t0)
+        Profiling.event(csssobj, 'admmIteration', iteration = k, s_norm = s_norm, eps_dual = eps_dual,
+                        r_norm = norm_resid, eps_pri = eps_pri, wall = timing[-1])
+
+        if (s_norm < eps_dual) and (norm_resid < eps_pri):
+            break
+
+    csssobj.admmTiming = timing
+    storeSolution(csssobj, sources, thetas)
+    return(dual_objective, norm_resid_equality, np.reshape(u, (N, 1)))
+
+def isAdmm(csssobj):
+    ## Check whether ADMM can solve a CSSS problem, see csss/Backends.py
+    return(len(csssobj.models) > 0 and len(csssobj.groups) == 0)
+
+## Keyword arguments of CSSS.admmSolve. The backend drops other arguments of
+# constructSolve, e.g. the cvxpy solver, which ADMM does not use.
+ADMM_ARGS = ['MaxIter', 'ABSTOL', 'RELTOL', 'verbose', 'innerIter', 'method', 'workers', 'executor', 'schedule']
+
+def solveAdmm(csssobj, rho = 1.0, **solverArgs):
+    ## ADMM backend: solve with csssobj.admmSolve and return the objective value
+    admmArgs = dict([(key, value) for key, value in solverArgs.items() if key in ADMM_ARGS])
+    csssobj.admmSolve(rho, **admmArgs)
+    return(csssobj._problemObjective().value)
+
+def storeSolution(csssobj, sources, thetas):
+    ## Store an ADMM solution in admmSource/admmTheta and in the model variables
+    for name in sources.keys():
+        model = csssobj.models[name]
+        model['admmSource'] = np.reshape(sources[name], (csssobj.N, 1))
+        if thetas[name] is not None and not isinstance(model['theta'], np.ndarray):
+            model['admmTheta'] = np.reshape(thetas[name], (-1, 1))
+    csssobj._storeSolutions(sources, thetas)
+
+## Jacobi ADMM. Every source is updated from the same previous iterate, so the
+# updates of an iteration are independent and run concurrently. This is the
+# sharing form of ADMM (Boyd et al. 2011, section 7.3): each source steps towards
+# its previous value minus the mean equality residual and the scaled dual, so it
+# converges without damping and u has the same meaning as in admmSolve.
+#
+# The sources are split into chunks (see scheduleChunks). A chunk owns the state of
+# its sources, their previous iterate and the theta warm starts of their proximal
+# updates, and keeps it in the worker that runs it: with processes each chunk is
+# pinned to one worker process for the whole solve. Each iteration only the shared
+# residual base goes out, and only the sum of the chunk's sources and the size of
+# their change come back; the sources are collected once at the end.
+
+class JacobiChunk:
+    ## Sources of one Jacobi task and their state
+
+    def __init__(self, names, prox, N):
+        self.names   = names
+        self.prox    = dict([(name, prox[name]) for name in names])
+        self.sources = dict([(name, np.zeros(N)) for name in names])
+        self.thetas  = dict([(name, None) for name in names])
+        self.N       = N
+
+    def step(self, base):
+        ## Update each source towards base + its previous value. Returns the sum of
+        # the sources, the squared norm of their change and the objective of each.
+        total  = np.zeros(self.N)
+        change = 0.0
+        objs   = {}
+        for name in self.names:
+            s, theta, objs[name] = self.prox[name].update(base + self.sources[name])
+            change = change + np.sum((s - self.sources[name]) ** 2)
+            total  = total + s
+            self.sources[name] = s
+            self.thetas[name]  = theta
+        return(total, change, objs)
+
+    def solution(self):
+        return(self.sources, self.thetas)
+
+def _jacobiWorker(chunk, conn):
+    ## Worker process of a pinned chunk: step for each base received, until None,
+    # then send the solution. Exceptions are sent back and end the worker.
+    try:
+        while True:
+            base = conn.recv()
+            if base is None:
+                conn.send(chunk.solution())
+                break
+            conn.send(chunk.step(base))
+    except Exception as e:
+        conn.send(e)
+    finally:
+        conn.close()
+
+class ProcessChunks:
+    ## Chunks pinned to one worker process each, connected by pipes
+
+    def __init__(self, chunks):
+        ctx = multiprocessing.get_context()
+        self.conns     = []
+        self.processes = []
+        for chunk in chunks:
+            parent, child = ctx.Pipe()
+            process = ctx.Process(target = _jacobiWorker, args = (chunk, child), daemon = True)
+            process.start()
+            child.close()
+            self.conns.append(parent)
+            self.processes.append(process)
+
+    def _gather(self, message):
+        for conn in self.conns:
+            conn.send(message)
+        results = [conn.recv() for conn in self.conns]
+        for r in results:
+            if isinstance(r, Exception):
+                raise r
+        return(results)
+
+    def step(self, base):
+        return(self._gather(base))
+
+    def solution(self):
+        return(self._gather(None))
+
+    def close(self):
+        for conn in self.conns:
+            conn.close()
+        for process in self.processes:
+            process.join(timeout = 1)
+            if process.is_alive():
+                process.terminate()
+                process.join()
+
+def sourceCost(csssobj, name, prox):
+    ## Rough relative cost of a source update, for scheduling
+    if isinstance(prox, SourceProx):
+        return(csssobj.N * (1 + prox.order + (prox.terms['gamma'] > 0)))
+    return(100 * csssobj.N * (1 + csssobj.models[name]['order']))
+
+def scheduleChunks(csssobj, names, prox, workers, schedule):
+    ## Split the sources into tasks.
+    # 'static':  one chunk per worker, balanced by estimated cost.
+    # 'dynamic': one task per source, largest first, so idle workers take the next
+    #            source from the shared queue.
+    costs = dict([(name, sourceCost(csssobj, name, prox[name])) for name in names])
+    order = sorted(names, key = lambda name: -costs[name])
+    if schedule == 'dynamic':
+        return([[name] for name in order])
+    if schedule != 'static':
+        raise ValueError('schedule must be "static" or "dynamic"')
+    chunks = [[] for i in range(workers)]
+    loads  = np.zeros(workers)
+    for name in order:
+        i = int(np.argmin(loads))
+        chunks[i].append(name)
+        loads[i] = loads[i] + costs[name]
+    return([c for c in chunks if len(c) > 0])
+
+def admmSolveJacobi(csssobj, rho, MaxIter = 500, ABSTOL = 1e-4, RELTOL = 1e-1, verbose = False,
+                    workers = None, executor = 'process', schedule = 'static', innerIter = 50):
+    ## Jacobi ADMM over the sources of a CSSS object, with source updates of each
+    # iteration run concurrently in a process or thread pool of `workers` workers.
+    # Returns the same values as admmSolve; per iteration wall times are stored in
+    # csssobj.admmTiming.
+    with Profiling.verbose(csssobj, verbose), Profiling.phase(csssobj, 'admmSolve'):
+        return(_admmSolveJacobi(csssobj, rho, MaxIter, ABSTOL, RELTOL, workers, executor, schedule, innerIter))
+
+def _admmSolveJacobi(csssobj, rho, MaxIter, ABSTOL, RELTOL, workers, executor, schedule, innerIter):
+    csssobj._refreshSources()
+    N     = csssobj.N
+    names = list(csssobj.models.keys())
+    K     = len(names)
+    y     = np.ravel(np.array(csssobj.aggregateSignal, dtype = float))
+    if workers is None:
+        workers = os.cpu_count() or 1
+
+    dual_objective      = []
+    norm_resid_equality = []
+    overall_complexity  = np.sum([csssobj.models[name]['order'] for name in names])
+    Profiling.event(csssobj, 'admmStart', method = 'jacobi', rho = rho, sources = K,
+                    workers = workers, executor = executor, schedule = schedule)
+
+    ## Factorize each proximal update once
+    with Profiling.phase(csssobj, 'admmSetup'):
+        prox = dict([(name, sourceProx(csssobj, name, rho, innerIter)) for name in names])
+    if executor == 'process' and workers > 1 and not all([isinstance(p, SourceProx) for p in prox.values()]):
+        raise ValueError('Process pools need closed form updates for every source, use executor = "thread"')
+    if executor == 'process' and schedule == 'dynamic':
+        ## Chunks are pinned to processes, so there is no shared queue to balance
+        raise ValueError('schedule = "dynamic" needs executor = "thread", process pools use schedule = "static"')
+    chunks = [JacobiChunk(chunk, prox, N) for chunk in scheduleChunks(csssobj, names, prox, workers, schedule)]
+
+    if workers == 1:
+        pool = None
+    elif executor == 'process':
+        pool = ProcessChunks(chunks)
+    elif executor == 'thread':
+        pool = concurrent.futures.ThreadPoolExecutor(max_workers = workers)
+    else:
+        raise ValueError('executor must be "process" or "thread"')
+
+    total   = np.zeros(N)
+    u       = np.zeros(N)
+    timing  = []
+    Profiling.event(csssobj, 'admmInitialized')
+
+    try:
+        for k in range(1, MaxIter):
+            t0 = time.time()
+            ## Shared residual: the target of each source is its previous value plus base
+            base = -(total - y) / K - u
+            if pool is None:
+                results = [chunk.step(base) for chunk in chunks]
+            elif executor == 'thread':
+                results = list(pool.map(lambda chunk: chunk.step(base), chunks))
+            else:
+                results = pool.step(base)
+
+            total    = np.sum([r[0] for r in results], axis = 0)
+            change   = np.sum([r[1] for r in results])
+            objs     = dict([(name, obj) for r in results for name, obj in r[2].items()])
+            last_obj = objs[names[-1]]
+
+            dual_objective.append(last_obj)
+            resid = total - y
+            u     = u + resid / K
+
+            norm_resid = np.linalg.norm(resid)
+            eps_pri    = np.sqrt(overall_complexity) * ABSTOL + RELTOL * max(np.linalg.norm(total), np.linalg.norm(y))
+            norm_resid_equality.append(norm_resid)
+
+            s_norm   = rho * np.sqrt(change)
+            eps_dual = np.sqrt(overall_complexity) * ABSTOL + RELTOL * np.linalg.norm(rho * u)
+            timing.append(time.time() - t0)
+            Profiling.event(csssobj, 'admmIteration', iteration = k, s_norm = s_norm, eps_dual = eps_dual,
+                            r_norm = norm_resid, eps_pri = eps_pri, wall = timing[-1])
+
+            if (s_norm < eps_dual) and (norm_resid < eps_pri):
+                break
+
+        if executor == 'process' and pool is not None:
+            solutions = pool.solution()
+        else:
+            solutions = [chunk.solution() for chunk in chunks]
+    finally:
+        if executor == 'thread' and pool is not None:
+            pool.shutdown()
+        elif pool is not None:
+            pool.close()
+
+    sources = {}
+    thetas  = {}
+    for chunkSources, chunkThetas in solutions:
+        sources.update(chunkSources)
+        thetas.update(chunkThetas)
+    csssobj.admmTiming = timing
+    storeSolution(csssobj, sources, thetas)
+    return(dual_objective, norm_resid_equality, np.reshape(u, (N, 1)))
@@ -0,0 +1,77 @@
+import importlib
+from csss import Profiling
+
+## Solver backends of CSSS.constructSolve.
+#
+# A backend solves CSSS problems of some structure. Each is registered with
+#   - the module implementing it, imported only when the backend is considered,
+#     so its dependencies (e.g. scipy.sparse for the least squares solver) are not
+#     imported with csss,
+#   - the names of two functions of that module: applicable(csssobj), whether the
+#     backend solves the problem exactly, and solve(csssobj, **solverArgs), which
+#     stores the solution in the model and returns the objective value, or None if
+#     it could not solve it (e.g. infeasible), so the next backend is tried,
+#   - a priority: with backend='auto' the applicable backends are tried from the
+#     lowest priority, the fastest, to the generic cvxpy backend,
+#   - auto: whether 'auto' may pick it. ADMM is approximate and time blocks need a
+#     block length, so both are only used when asked for by name.
+# Other packages can register their own backends with register.
+
+BACKENDS = {}
+
+def register(name, module, applicable, solve, priority = 50, auto = True, phase = None):
+    ## Register a backend, replacing any backend of the same name. phase is the
+    # profiler phase its solves are recorded in, default the backend name.
+    BACKENDS[name] = {'name': name, 'module': module, 'applicable': applicable, 'solve': solve,
+                      'priority': priority, 'auto': auto, 'phase': name if phase is None else phase}
+
+def _function(backend, key):
+    return(getattr(importlib.import_module(backend['module']), backend[key]))
+
+def backends():
+    ## Names of the registered backends, by priority
+    return([b['name'] for b in sorted(BACKENDS.values(), key = lambda b: b['priority'])])
+
+def isApplicable(csssobj, name):
+    if name not in BACKENDS:
+        raise ValueError('Unknown backend %s, use one of %s' % (name, ', '.join(backends())))
+    return(bool(_function(BACKENDS[name], 'applicable')(csssobj)))
+
+def applicable(csssobj, auto = True):
+    ## Names of the backends that can solve a problem, fastest first. With auto,
+    # only those that backend='auto' may pick.
+    return([name for name in backends() if (BACKENDS[name]['auto'] or not auto) and isApplicable(csssobj, name)])
+
+def select(csssobj):
+    ## Backend that backend='auto' tries first
+    return(applicable(csssobj)[0])
+
+def solve(csssobj, backend = 'auto', **solverArgs):
+    ## Solve a problem with a backend, or the applicable backends in turn for 'auto'.
+    # The backend that solved it is stored in csssobj.lastBackend.
+    if backend == 'auto':
+        names = applicable(csssobj)
+    elif isApplicable(csssobj, backend):
+        names = [backend]
+    else:
+        raise ValueError('Backend %s cannot solve this problem, applicable backends are %s'
+                         % (backend, ', '.join(applicable(csssobj, auto = False))))
+    for name in names:
+        solver = _function(BACKENDS[name], 'solve')
+        if not BACKENDS[name]['phase']:
+            value = solver(csssobj, **solverArgs)
+        else:
+            with Profiling.phase(csssobj, BACKENDS[name]['phase']):
+                value = solver(csssobj, **solverArgs)
+        if value is not None:
+            csssobj.lastBackend = name
+            return(value)
+    raise ValueError('No backend could solve this problem')
+
+## Backends of this package. The cvxpy backend records its own phases (buildProblem,
+# compile, solver).
+register('leastSquares', 'csss.LeastSquares', 'isLeastSquares', 'solveLeastSquares', priority = 10, phase = 'leastSquares')
+register('separable',    'csss.Separable',    'isSeparable',    'solveSeparable',    priority = 20)
+register('cvxpy',        'csss.CSSS',         'isCvxpy',        'solveCvxpy',        priority = 100, phase = False)
+register('admm',         'csss.ADMM',         'isAdmm',         'solveAdmm',         priority = 200, auto = False)
+register('timeBlocks',   'csss.TimeBlocks',   'isTimeBlocks',   'solveTimeBlocks',   priority = 300, auto = False)
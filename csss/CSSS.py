@@ -1,16 +1,48 @@
+import time
 import numpy as np
 import cvxpy as cvp
+from csss import Cache
+from csss import Registry
+from csss import Profiling
+from csss import Backends
+
+## Only the CSSS class is exported to the csss namespace. The solver backends
+# (LeastSquares, Separable, TimeBlocks, ADMM) are imported on first use, see
+# csss/Backends.py.
+__all__ = ['CSSS']
+
+def isCvxpy(csssobj):
+    ## cvxpy solves any CSSS problem, see csss/Backends.py
+    return(True)
+
+def solveCvxpy(csssobj, **solverArgs):
+    return(csssobj._solveCvxpy(**solverArgs))
 
 class CSSS:
 ### Contextually Supervised Source Seperation Class
 
-    def __init__(self, aggregateSignal):
+    def __init__(self, aggregateSignal, parameterize = False):
         self.aggregateSignal  = aggregateSignal
         self.modelcounter     = 0   # Number of source signals
         self.models           = {}  # Model for each source signal, this is a list but could be a dict
         self.constraints      = []  # Additional constraints
         self.N                = len(aggregateSignal) # Length of aggregate signal
 
+        ## Parameterized mode: the problem is compiled once and alpha, beta, gamma,
+        # lb, ub and the aggregate signal are cvxpy parameters rebound on re-solve.
+        self.parameterize     = parameterize
+        self.problem          = None  # Compiled problem, only cached in parameterized mode
+        self.lastProblem      = None  # Last problem solved, kept for solver statistics
+        self.admmTiming       = []    # Wall time of each iteration of the last admmSolve
+        self.boundConstraints   = {}   # Cached lb/ub constraints of each source
+        self.couplingConstraint = None # Cached constraint that the sources sum to the aggregate signal
+        self.aggregateParam   = cvp.Parameter(self.N, 1) if parameterize else None
+        self.solutionCache    = None  # Optional Cache.SolutionCache, see enableCache
+        self.registry         = Registry.ModelRegistry(self.N)  # Shared regressors, alphas and solutions
+        self.groups           = {}    # Source groups, see addSourceGroup
+        self.profiler         = None  # Optional Profiling.Profiler, see enableProfiling
+        self.lastBackend      = None  # Backend of the last constructSolve, see csss/Backends.py
+
     def addSource(self, regressor, name = None,
                   costFunction='sse',alpha = 1,      # Cost function for fit to regressors, alpha is a scalar multiplier or a vector multiplier of length N
                   regularizeTheta=None, beta = 1,    # Cost function for parameter regularization, beta is a scalar multiplier
@@ -25,32 +57,16 @@ class CSSS:
         if name is None:
             name = str(self.modelcounter)
 
-        ## Instantiate a dictionary of model terms
-        model = {}
+        ## Instantiate a dictionary of model terms, its alpha is stored in the registry
+        model = Registry.SourceModel()
         model['name']  = name
         model['alpha'] = alpha
         model['lb']    = lb
         model['ub']    = ub
 
-        ## Check regressor shape
-        regressor = np.array(regressor)
-        if regressor.ndim == 0: ## If no regressors are included, set them an empty array
-            regressor = np.zeros((self.N,0))
-        if regressor.ndim == 1:
-            regressor = np.expand_dims(regressor,1)
-        if regressor.ndim > 2:
-            raise NameError('Regressors cannot have more than 2 dimensions')
-
-
-        ## Check that regressors have the correct shape (Nobs, Nregressors)
-        if regressor.shape[0] != self.N:
-            if regressor.shape[1] == self.N:
-                regressor = regressor.transpose()
-            else:
-                raise NameError('Lengths of regressors and aggregate signal must match')
-
-        ## Define model regressors and order
-        model['regressor'] = regressor
+        ## Define model regressors and order, regressors with identical content are shared
+        regressor = self._checkRegressor(regressor)
+        model['regressor'] = self.registry.shareRegressor(regressor)
         model['order']     = regressor.shape[1]
 
         ## Define decision variables and cost function style
@@ -63,123 +79,861 @@ class CSSS:
         model['gamma'] = gamma
 
         ## Append model to models list
+        self.registry.add(model)
         self.models[name]= model
+        self.problem = None
         self.updateSourceObj(name)
 
+    def _checkRegressor(self, regressor):
+        ## Check regressor shape
+        regressor = np.asarray(regressor)
+        if regressor.ndim == 0: ## If no regressors are included, set them an empty array
+            regressor = np.zeros((self.N,0))
+        if regressor.ndim == 1:
+            regressor = np.expand_dims(regressor,1)
+        if regressor.ndim > 2:
+            raise NameError('Regressors cannot have more than 2 dimensions')
+
+
+        ## Check that regressors have the correct shape (Nobs, Nregressors)
+        if regressor.shape[0] != self.N:
+            if regressor.shape[1] == self.N:
+                regressor = regressor.transpose()
+            else:
+                raise NameError('Lengths of regressors and aggregate signal must match')
+        return(regressor)
+
+    def addSourceGroup(self, regressor, names, groupName = None,
+                       costFunction='sse', alpha = 1,
+                       regularizeTheta=None, beta = 1,
+                       regularizeSource=None, gamma = 1,
+                       lb = None, ub = None):
+        ### This is a method to add M sources that share a regressor as one group.
+        # The sources of the group are one N x M variable and their thetas one
+        # order x M variable, so costs and bounds are single matrix expressions.
+        # alpha, lb and ub are scalars, length N vectors or N x M arrays with one
+        # column per source, the other options are as in addSource and apply to
+        # the whole group. Each name still gets a model in self.models, whose
+        # 'source' and 'theta' are column views of the group variables.
+        if groupName is None:
+            groupName = 'group%d' % (len(self.groups) + 1)
+        if costFunction.lower() not in ['sse', 'l1', 'l2']:
+            raise ValueError('{} wrong option, use "sse","l2" or "l1"'.format(costFunction))
+        names = [str(name) for name in names]
+        M     = len(names)
+
+        ## Instantiate a dictionary of group terms
+        group = {}
+        group['name']      = groupName
+        group['names']     = names
+        regressor = self._checkRegressor(regressor)
+        group['regressor'] = self.registry.shareRegressor(regressor)
+        group['order']     = regressor.shape[1]
+        group['source']    = cvp.Variable(self.N, M)
+        group['theta']     = cvp.Variable(group['order'], M)
+        group['costFunction']     = costFunction
+        group['regularizeTheta']  = regularizeTheta
+        group['beta']             = np.array(beta)
+        group['regularizeSource'] = regularizeSource
+        group['gamma']            = np.array(gamma)
+        group['lb']    = None if lb is None else self._groupColumns(lb, M)
+        group['ub']    = None if ub is None else self._groupColumns(ub, M)
+        group['dirty'] = True  # The objective is rebuilt on the next solve
+        if group['beta'].size not in [1, group['order']]:
+            raise ValueError('Beta must be scalar or vector with one element for each regressor')
+        if group['gamma'].size != 1:
+            raise NameError('Gamma must be scalar')
+
+        ## Member models, with views of the group variables and bounds. A constant
+        # alpha is stored as a scalar by the registry, without an N x M array.
+        if np.size(alpha) > 1:
+            alpha = self._groupColumns(alpha, M)
+        for j, name in enumerate(names):
+            self.modelcounter += 1
+            model = Registry.SourceModel()
+            model['name']   = name
+            model['alpha']  = alpha[:, j] if np.ndim(alpha) == 2 else alpha
+            model['lb']     = None if lb is None else group['lb'][:, j]
+            model['ub']     = None if ub is None else group['ub'][:, j]
+            model['regressor'] = group['regressor']
+            model['order']  = group['order']
+            model['source'] = group['source'][:, j]
+            model['theta']  = group['theta'][:, j]
+            model['costFunction']     = costFunction
+            model['regularizeTheta']  = regularizeTheta
+            model['beta']             = group['beta']
+            model['regularizeSource'] = regularizeSource
+            model['gamma']            = group['gamma']
+            model['group']  = groupName
+            model['column'] = j
+            model['obj']    = 0  # The objective is held by the group
+            self.registry.add(model)
+            self.models[name] = model
+
+        self.groups[groupName] = group
+        self.problem = None
+
+    def _groupColumns(self, value, M):
+        ## Broadcast a scalar, a length N vector or an N x M array to N x M. An
+        # N x M array is used as is, like the bounds of addSource.
+        value = np.asarray(value, dtype = float)
+        if value.ndim == 1:
+            value = value[:, None]
+        if value.shape == (self.N, M):
+            return(value)
+        return(np.array(np.broadcast_to(value, (self.N, M))))
+
+    @Profiling.timed('updateSourceObj')
     def updateSourceObj(self, sourcename):
+        ## Mark the objective of a source as out of date after changing its
+        # hyperparameters. Objectives are updated lazily at the next solve, and only
+        # the terms (or, in parameterized mode, the parameters) of the hyperparameters
+        # assigned since the last update; see _refreshSources.
         if sourcename.lower() == 'all':
             for name in self.models.keys():
                 self.updateSourceObj(name)
+        elif 'group' in self.models[sourcename]:
+            ## Members of a group share one objective, rebuilt on the next solve
+            self.groups[self.models[sourcename]['group']]['dirty'] = True
         else:
             model = self.models[sourcename]
+            self._checkSource(model)
+            model.stale = True
+
+    def _checkSource(self, model):
+        ## Check the options of a source model
+        ## **CHANGE MT: I moved the alpha variable to be inside the norms so that
+        ## it can be time varying.  I'm adding a check above to ensure that alpha is
+        ## a scalar or a vector of length N.
+        if model['costFunction'].lower() not in ['sse', 'l1', 'l2']:
+            raise ValueError('{} wrong option, use "sse","l2" or "l1"'.format(model['costFunction']))
+
+        # Check that beta is scalar or of length of number of parameters.
+        if not isinstance(model['beta'], np.ndarray):
+            model['beta'] = np.array(model['beta'])
+        if model['beta'].size not in [1, model['order']]:
+            raise ValueError('Beta must be scalar or vector with one element for each regressor')
+
+        # Check that gamma is scalar
+        if not isinstance(model['gamma'], np.ndarray):
+            model['gamma'] = np.array(model['gamma'])
+        if model['gamma'].size != 1:
+            raise NameError('Gamma must be scalar')
 
-            ## Define objective function to fit model to regressors
-            ## **CHANGE MT: I moved the alpha variable to be inside the norms so that
-            ## it can be time varying.  I'm adding a check above to ensure that alpha is
-            ## a scalar or a vector of length N.
+    @Profiling.timed('refreshSources')
+    def _refreshSources(self):
+        ## Update the objectives of the sources and source groups marked by updateSourceObj
+        for name, model in self.models.items():
+            if model.stale:
+                self._buildSourceObj(model)
+        for groupName in self.groups.keys():
+            self._groupObjective(groupName)
+
+    def _buildSourceObj(self, model):
+        ## Update the objective of a source for the hyperparameters assigned since
+        # the last update (model.changed), or all of them if none were tracked.
+        # The objective is the sum of three terms, each rebuilt only if one of the
+        # hyperparameters it depends on changed. In parameterized mode the parameters
+        # of the changed hyperparameters are rebound, and terms are only rebuilt when
+        # the structure of the source changes.
+        changed = set(model.changed) if len(model.changed) > 0 else set(['all'])
+        terms   = model.get('terms', {})
+        if self.parameterize:
+            structure = self._sourceStructure(model)
+            rebuild   = model.get('structure') != structure or \
+                        ('regressor' in changed and isinstance(model['theta'], cvp.Variable))
+            if rebuild:
+                model['structure'] = structure
+                model['params']    = self._sourceParameters(model)
+                self._bindSourceParameters(model)
+                self.problem = None
+                changed = set(['all'])
+            else:
+                self._bindSourceParameters(model, None if 'all' in changed else changed)
+                changed = set()
+        elif len(changed & set(['lb', 'ub'])) == len(changed):
+            ## Bounds are constraints, the objective is unchanged
+            changed = set()
+
+        ## Rebuild the affected terms
+        if len(changed & set(['all', 'alpha', 'costFunction', 'regressor', 'theta'])) > 0:
+            terms['fit'] = self._fitTerm(model)
+        if len(changed & set(['all', 'beta', 'regularizeTheta', 'theta'])) > 0:
+            terms['theta'] = self._thetaTerm(model)
+        if len(changed & set(['all', 'gamma', 'regularizeSource'])) > 0:
+            terms['source'] = self._sourceTerm(model)
+
+        ## Sum total model objective
+        model['terms'] = terms
+        model['obj']   = terms['fit'] + terms['theta'] + terms['source']
+        model.changed.clear()
+        model.stale = False
+
+    def _fitTerm(self, model):
+        ## Define objective function to fit model to regressors
+        if self.parameterize:
+            params = model['params']
+            alpha  = params['alpha']
+            if 'baseline' in params:
+                modelEst = params['baseline']
+            else:
+                modelEst = model['regressor'] * model['theta']
+        else:
+            alpha = model['alpha']
+            if np.all(alpha == alpha[0]):
+                ## Constant alpha as a scalar, for a smaller objective
+                alpha = alpha[0]
             if model['costFunction'].lower() == 'sse':
-                residuals = (model['source'] - model['regressor'] * model['theta'])
-                modelObj =  cvp.sum_squares( cvp.mul_elemwise( model['alpha'] ** .5 , residuals ) )
-            elif model['costFunction'].lower() == 'l1':
-                residuals = (model['source'] - model['regressor'] * model['theta'])
-                modelObj =  cvp.norm( cvp.mul_elemwise( model['alpha'] , residuals ) ,1)
-            elif model['costFunction'].lower()=='l2':
-                residuals = (model['source'] - model['regressor'] * model['theta'])
-                modelObj =  cvp.norm( cvp.mul_elemwise( model['alpha'] , residuals ) ,2)
+                alpha = alpha ** .5
+            if isinstance(model['theta'], np.ndarray):
+                ## Fixed thetas, as a matrix or a 2-D array
+                modelEst = np.dot(model['regressor'], model['theta'])
             else:
-                raise ValueError('{} wrong option, use "sse","l2" or "l1"'.format(costFunction))
-            ## Define cost function to regularize theta ****************
-            # ***** ***** ***** ***** ***** ***** ***** ***** ***** ***** ***** *
-            # Check that beta is scalar or of length of number of parameters.
-            model['beta'] = np.array(model['beta'])
-            if model['beta'].size not in [1, model['order']]:
-                raise ValueError('Beta must be scalar or vector with one element for each regressor')
-
-            if model['regularizeTheta'] is not None:
-                if callable(model['regularizeTheta']):
-                    ## User can input their own function to regularize theta.
-                    # Must input a cvxpy variable vector and output a scalar
-                    # or a vector with one element for each parameter.
-
-                    ## TODO: TRY CATCH TO ENSURE regularizeTheta WORKS AND RETURNS SCALAR
-                    try:
-                        regThetaObj = model['regularizeTheta'](model['theta']) * model['beta']
-                    except:
-                        raise ValueError('Check custom regularizer for model {}'.format(model['name']))
-                    if regThetaObj.size[0]* regThetaObj.size[1] != 1:
-                        raise ValueError('Check custom regularizer for model {}, make sure it returns a scalar'.format(model['name']))
-
-                elif model['regularizeTheta'].lower() == 'l2':
-                    ## Sum square errors.
-                    regThetaObj = cvp.norm(model['theta'] * model['beta'])
-                elif model['regularizeTheta'].lower() == 'l1':
-                    regThetaObj = cvp.norm(model['theta'] * model['beta'], 1)
+                modelEst = model['regressor'] * model['theta']
+
+        residuals = (model['source'] - modelEst)
+        if model['costFunction'].lower() == 'sse':
+            modelObj =  cvp.sum_squares( cvp.mul_elemwise( alpha , residuals ) )
+        elif model['costFunction'].lower() == 'l1':
+            modelObj =  cvp.norm( cvp.mul_elemwise( alpha , residuals ) ,1)
+        elif model['costFunction'].lower()=='l2':
+            modelObj =  cvp.norm( cvp.mul_elemwise( alpha , residuals ) ,2)
+        return(modelObj)
+
+    def _thetaTerm(self, model):
+        ## Define cost function to regularize theta ****************
+        # ***** ***** ***** ***** ***** ***** ***** ***** ***** ***** ***** *
+        if self.parameterize:
+            beta = model['params']['beta']
+        else:
+            beta = model['beta']
+
+        if model['regularizeTheta'] is not None:
+            if callable(model['regularizeTheta']):
+                ## User can input their own function to regularize theta.
+                # Must input a cvxpy variable vector and output a scalar
+                # or a vector with one element for each parameter.
+
+                ## TODO: TRY CATCH TO ENSURE regularizeTheta WORKS AND RETURNS SCALAR
+                try:
+                    regThetaObj = model['regularizeTheta'](model['theta']) * beta
+                except:
+                    raise ValueError('Check custom regularizer for model {}'.format(model['name']))
+                if regThetaObj.size[0]* regThetaObj.size[1] != 1:
+                    raise ValueError('Check custom regularizer for model {}, make sure it returns a scalar'.format(model['name']))
+
+            elif model['regularizeTheta'].lower() == 'l2':
+                ## Sum square errors.
+                regThetaObj = cvp.norm(self._scaleTheta(model, beta))
+            elif model['regularizeTheta'].lower() == 'l1':
+                regThetaObj = cvp.norm(self._scaleTheta(model, beta), 1)
+            elif model['regularizeTheta'].lower() == 'ss':
+                ## Sum of squares, beta scales each squared parameter.
+                if not self.parameterize:
+                    beta = np.array(beta, dtype = float) ** .5
+                regThetaObj = cvp.sum_squares(self._scaleTheta(model, beta))
+            else:
+                raise ValueError('regularizeTheta must be a callable method, "ss", "l1", "l2" or None')
+        else:
+            regThetaObj = 0
+        return(regThetaObj)
+
+    def _sourceTerm(self, model):
+        ## Define cost function to regularize source signal ****************
+        # ***** ***** ***** ***** ***** ***** ***** ***** ***** ***** ***** *
+        if self.parameterize:
+            gamma = model['params']['gamma']
+        else:
+            gamma = model['gamma']
+
+        ## Calculate regularization.
+        if model['regularizeSource'] is not None:
+            if callable(model['regularizeSource']):
+                ## User can input their own function to regularize the source signal.
+                # Must input a cvxpy variable vector and output a scalar.
+                regSourceObj = model['regularizeSource'](model['source']) * gamma
+            elif model['regularizeSource'].lower() == 'diff1_ss':
+                regSourceObj = cvp.sum_squares(cvp.diff(model['source'])) * gamma
             else:
-                regThetaObj = 0
+                raise Exception('regularizeSource must be a callable method, \`diff1_ss\`, or None')
+        else:
+            regSourceObj = 0
+        return(regSourceObj)
+
+    def parameterizeProblem(self):
+        ## Switch an existing model to parameterized mode
+        if self.parameterize:
+            return
+        self.parameterize   = True
+        self.problem        = None
+        self.aggregateParam = cvp.Parameter(self.N, 1)
+        for name, model in self.models.items():
+            model.pop('structure', None)
+        for groupName, group in self.groups.items():
+            group.pop('structure', None)
+        self.updateSourceObj('all')
 
-            ## Define cost function to regularize source signal ****************
-            # ***** ***** ***** ***** ***** ***** ***** ***** ***** ***** ***** *
-            # Check that gamma is scalar
-            model['gamma'] = np.array(model['gamma'])
-            if model['gamma'].size != 1:
-                raise NameError('Gamma must be scalar')
-
-            ## Calculate regularization.
-            if model['regularizeSource'] is not None:
-                if callable(model['regularizeSource']):
-                    ## User can input their own function to regularize the source signal.
-                    # Must input a cvxpy variable vector and output a scalar.
-                    regSourceObj = model['regularizeSource'](model['source']) * model['gamma']
-                elif model['regularizeSource'].lower() == 'diff1_ss':
-                    regSourceObj = cvp.sum_squares(cvp.diff(model['source'])) * model['gamma']
-                else:
-                    raise Exception('regularizeSource must be a callable method, \`diff1_ss\`, or None')
+    def _groupObjective(self, groupName):
+        ## Objective of a source group as matrix expressions over its N x M source
+        # and order x M theta variables. Rebuilt only if a member changed; in
+        # parameterized mode only the parameters are rebound unless the structure changed.
+        group = self.groups[groupName]
+        if not group['dirty']:
+            return(group['obj'])
+        group['dirty'] = False
+        members = [self.models[name] for name in group['names']]
+        M       = len(members)
+        sse     = group['costFunction'].lower() == 'sse'
+        ss      = str(group['regularizeTheta']).lower() == 'ss'
+        fixed   = isinstance(group['theta'], np.ndarray)
+        alpha   = np.column_stack([m['alpha'] for m in members])
+        beta    = np.array(group['beta'], dtype = float)
+        if beta.size > 1:
+            beta = np.tile(np.reshape(beta, (-1,1)), (1, M))
+
+        if self.parameterize:
+            structure = (group['costFunction'].lower(),
+                         group['regularizeTheta'] if callable(group['regularizeTheta']) else str(group['regularizeTheta']).lower(),
+                         group['regularizeSource'] if callable(group['regularizeSource']) else str(group['regularizeSource']).lower(),
+                         group['beta'].size, group['lb'] is None, group['ub'] is None, fixed)
+            rebuild = group.get('structure') != structure
+            if rebuild:
+                params = {}
+                params['alpha'] = cvp.Parameter(self.N, M)
+                params['beta']  = cvp.Parameter(1, 1, sign = 'positive') if beta.size == 1 else cvp.Parameter(group['order'], M)
+                params['gamma'] = cvp.Parameter(1, 1, sign = 'positive')
+                for key in ['lb', 'ub']:
+                    if group[key] is not None:
+                        params[key] = cvp.Parameter(self.N, M)
+                if fixed:
+                    params['baseline'] = cvp.Parameter(self.N, M)
+                group['structure'] = structure
+                group['params']    = params
+                self.problem       = None
+            params = group['params']
+            params['alpha'].value = alpha ** .5 if sse else alpha
+            beta = beta ** .5 if ss else beta
+            params['beta'].value  = float(beta) if beta.size == 1 else beta
+            params['gamma'].value = float(group['gamma'])
+            for key in ['lb', 'ub']:
+                if key in params:
+                    params[key].value = group[key]
+            if fixed:
+                params['baseline'].value = np.dot(group['regressor'], group['theta'])
+            if not rebuild:
+                return(group['obj'])
+            alpha, beta, gamma = params['alpha'], params['beta'], params['gamma']
+            modelEst = params['baseline'] if fixed else group['regressor'] * group['theta']
+        else:
+            if sse:
+                alpha = alpha ** .5
+            if ss:
+                beta = beta ** .5
+            if beta.size == 1:
+                beta = float(beta)
+            gamma = float(group['gamma'])
+            if fixed:
+                modelEst = np.dot(group['regressor'], group['theta'])
             else:
-                regSourceObj = 0
+                modelEst = group['regressor'] * group['theta']
+
+        ## Fit to regressors, summed over the sources of the group
+        residuals = cvp.mul_elemwise(alpha, group['source'] - modelEst)
+        if sse:
+            modelObj = cvp.sum_squares(residuals)
+        elif group['costFunction'].lower() == 'l1':
+            modelObj = cvp.sum_entries(cvp.abs(residuals))
+        else:
+            modelObj = sum([cvp.norm(residuals[:, j], 2) for j in range(M)])
 
+        ## Regularize theta
+        theta = group['theta']
+        if group['beta'].size > 1:
+            scaled = cvp.mul_elemwise(beta, theta)
+        else:
+            scaled = theta * beta
+        if group['regularizeTheta'] is None:
+            regThetaObj = 0
+        elif callable(group['regularizeTheta']):
+            regThetaObj = sum([group['regularizeTheta'](theta[:, j]) for j in range(M)]) * beta
+        elif group['regularizeTheta'].lower() == 'l2':
+            regThetaObj = sum([cvp.norm(scaled[:, j]) for j in range(M)])
+        elif group['regularizeTheta'].lower() == 'l1':
+            regThetaObj = cvp.sum_entries(cvp.abs(scaled))
+        elif ss:
+            regThetaObj = cvp.sum_squares(scaled)
+        else:
+            raise ValueError('regularizeTheta must be a callable method, "ss", "l1", "l2" or None')
+
+        ## Regularize the source signals
+        source = group['source']
+        if group['regularizeSource'] is None:
+            regSourceObj = 0
+        elif callable(group['regularizeSource']):
+            regSourceObj = sum([group['regularizeSource'](source[:, j]) for j in range(M)]) * gamma
+        elif group['regularizeSource'].lower() == 'diff1_ss':
+            regSourceObj = cvp.sum_squares(source[1:, :] - source[:-1, :]) * gamma
+        else:
+            raise Exception('regularizeSource must be a callable method, \`diff1_ss\`, or None')
 
-            ## Sum total model objective
-            model['obj'] = modelObj + regThetaObj + regSourceObj
+        group['obj'] = modelObj + regThetaObj + regSourceObj
+        return(group['obj'])
 
-            ## Append model to models list
-            self.models[sourcename] = model
+    def _problemObjective(self):
+        ## Sum of the objectives of all sources and source groups
+        self._refreshSources()
+        obj = 0
+        for name, model in self.models.items():
+            obj = obj + model['obj']
+        for groupName in self.groups.keys():
+            obj = obj + self._groupObjective(groupName)
+        return(obj)
+
+    def _scaleTheta(self, model, beta):
+        ## Scale theta by beta, elementwise if beta is a vector
+        if np.size(model['beta']) > 1:
+            if not isinstance(beta, cvp.Parameter):
+                beta = np.reshape(beta, (-1,1))
+            return cvp.mul_elemwise(beta, model['theta'])
+        return model['theta'] * beta
+
+    def _sourceStructure(self, model):
+        ## Everything about a source model that changes the structure of its
+        # objective or constraints. Parameter values are not included.
+        return (model['costFunction'].lower(),
+                model['regularizeTheta'] if callable(model['regularizeTheta']) else str(model['regularizeTheta']).lower(),
+                model['regularizeSource'] if callable(model['regularizeSource']) else str(model['regularizeSource']).lower(),
+                np.array(model['beta']).size,
+                model['lb'] is None,
+                model['ub'] is None,
+                isinstance(model['theta'], cvp.Variable))
+
+    def _sourceParameters(self, model):
+        ## Create the cvxpy parameters for a source model. For the sse cost the
+        # alpha parameter holds alpha ** .5 so the objective stays a sum of squares,
+        # and likewise beta ** .5 for the 'ss' theta regularizer.
+        params = {}
+        params['alpha'] = cvp.Parameter(self.N, 1)
+        if np.array(model['beta']).size == 1:
+            params['beta'] = cvp.Parameter(1, 1, sign = 'positive')
+        else:
+            params['beta'] = cvp.Parameter(model['order'], 1)
+        params['gamma'] = cvp.Parameter(1, 1, sign = 'positive')
+        if model['lb'] is not None:
+            params['lb'] = cvp.Parameter(self.N, 1)
+        if model['ub'] is not None:
+            params['ub'] = cvp.Parameter(self.N, 1)
+        if not isinstance(model['theta'], cvp.Variable):
+            ## Thetas are fixed, the model estimate is a constant
+            params['baseline'] = cvp.Parameter(self.N, 1)
+        return params
+
+    def _bindSourceParameters(self, model, keys = None):
+        ## Write the current hyperparameter values of a source model into its parameters,
+        # all of them or only those of the hyperparameters in keys
+        params = model['params']
+        if keys is None:
+            keys = set(['alpha', 'beta', 'gamma', 'lb', 'ub', 'theta'])
+        if 'alpha' in keys:
+            alpha  = np.array(model['alpha'], dtype = float)
+            if model['costFunction'].lower() == 'sse':
+                alpha = alpha ** .5
+            params['alpha'].value = self._columnValue(alpha, self.N)
+        if 'beta' in keys:
+            beta = np.array(model['beta'], dtype = float)
+            if str(model['regularizeTheta']).lower() == 'ss':
+                beta = beta ** .5
+            if np.size(beta) == 1:
+                params['beta'].value = float(beta.squeeze())
+            else:
+                params['beta'].value = self._columnValue(beta, model['order'])
+        if 'gamma' in keys:
+            params['gamma'].value = float(np.array(model['gamma']).squeeze())
+        if 'lb' in params and 'lb' in keys:
+            params['lb'].value = self._columnValue(model['lb'], self.N)
+        if 'ub' in params and 'ub' in keys:
+            params['ub'].value = self._columnValue(model['ub'], self.N)
+        if 'baseline' in params and len(set(['theta', 'regressor']) & set(keys)) > 0:
+            params['baseline'].value = self._columnValue(np.dot(model['regressor'], model['theta']), self.N)
+
+    def _columnValue(self, value, n):
+        ## Broadcast a scalar or vector to an (n,1) column for a parameter value
+        value = np.reshape(np.array(value, dtype = float), (-1,1))
+        return np.array(np.broadcast_to(value, (n,1)))
 
     def addConstraint(self, constraint):
         ### This is a method to add a new source
         self.constraints.append(constraint)
-
-    def constructSolve(self):
-        ## This method constructs and solves the optimization
-
-        ## Initialize objective function and modeled aggregate signal as 0
-        obj = 0
-        sum_sources = np.zeros((self.N,1))
-
-        ## Initialize constraints as those custom created
-        con = self.constraints
-
-        ## For each model
-        #    - Add cost to objective function
-        #    - Add source to sum of sources
-        #    - (TODO) Add custom constraints for each source
+        self.problem = None
+
+    def _storeSolution(self, name, source, theta = None):
+        ## Write a solution computed outside of cvxpy into the solution buffer and the model variables
+        model = self.models[name]
+        if 'group' in model:
+            self._storeSolutions({name: source}, {name: theta})
+            return
+        self.registry.setSolution(model.row, source)
+        model['source'].value = np.reshape(self.registry.solution[model.row], (self.N,1))
+        if theta is not None and isinstance(model['theta'], cvp.Variable) and model['order'] > 0:
+            model['theta'].value = np.reshape(np.array(theta, dtype = float), (model['order'],1))
+
+    def enableCache(self, maxsize = 128, cache = None):
+        ## Cache solutions of constructSolve in memory, keyed on a hash of the
+        # aggregate signal, regressors, hyperparameters and solver options.
+        # Pass an existing Cache.SolutionCache as cache to share it between models.
+        if cache is None:
+            cache = Cache.SolutionCache(maxsize)
+        self.solutionCache = cache
+        return(cache)
+
+    def disableCache(self):
+        self.solutionCache = None
+
+    def cacheStats(self):
+        ## Hits, misses, size and solve time saved by the solution cache
+        if self.solutionCache is None:
+            return(None)
+        return(self.solutionCache.stats())
+
+    def _storeSolutions(self, sources, thetas):
+        ## Write solutions of several sources, dicts by name, as _storeSolution. The
+        # variables of a source group are written once for all of its members.
+        groups = {}
+        for name in sources.keys():
+            model = self.models[name]
+            if 'group' in model:
+                groups.setdefault(model['group'], []).append(name)
+            else:
+                self._storeSolution(name, sources[name], thetas.get(name))
+
+        for groupName, names in groups.items():
+            group = self.groups[groupName]
+            M     = len(group['names'])
+            value = np.zeros((self.N, M)) if group['source'].value is None else np.array(group['source'].value)
+            free  = isinstance(group['theta'], cvp.Variable) and group['order'] > 0
+            if free:
+                theta = np.zeros((group['order'], M)) if group['theta'].value is None else np.array(group['theta'].value)
+            for name in names:
+                model = self.models[name]
+                self.registry.setSolution(model.row, sources[name])
+                value[:, model['column']] = self.registry.solution[model.row]
+                if free and thetas.get(name) is not None:
+                    theta[:, model['column']] = np.ravel(thetas[name])
+            group['source'].value = value
+            if free:
+                group['theta'].value = theta
+
+    def _collectSolution(self):
+        ## Copy the source values found by cvxpy into the solution buffer
         for name, model in self.models.items():
-            obj = obj + model['obj']
-            sum_sources = sum_sources + model['source']
-            ### ADD lb and ub constraints on individual source signal.
-            if model['lb'] is not None:
-                con.append(model['source'] >= model['lb'])
-            if model['ub'] is not None:
-                con.append(model['source'] <= model['ub'])
-
-
-        ## Append the constraint that the sum of sources must equal aggergate signal
-        con.append(self.aggregateSignal == sum_sources)
+            if 'group' not in model and model['source'].value is not None:
+                self.registry.setSolution(model.row, model['source'].value)
+        for groupName, group in self.groups.items():
+            if group['source'].value is not None:
+                rows = [self.models[name].row for name in group['names']]
+                self.registry.solution[rows] = np.array(group['source'].value).T
+
+    def solutionArray(self):
+        ## Solution of each source as a (sources x N) array, in the order of self.models.
+        # This is a view of the registry solution buffer, rows are NaN until solved.
+        return(self.registry.sources())
+
+    def enableProfiling(self, hooks = None, memory = False, problemData = False):
+        ## Record per phase wall times, solver statistics and problem sizes in a
+        # Profiling.Profiler, returned and stored in self.profiler. hooks are callables
+        # hook(name, data) called for every phase and event. memory traces peak memory
+        # per phase, problemData also counts nonzeros of the problem data after each
+        # solve at the cost of an extra canonicalization.
+        self.profiler = Profiling.Profiler(hooks, memory, problemData)
+        return(self.profiler)
+
+    def disableProfiling(self):
+        self.profiler = None
+
+    def profileStats(self):
+        ## Summary of the recorded phases and events
+        if self.profiler is None:
+            return(None)
+        return(self.profiler.summary())
+
+    @Profiling.timed('constructSolve')
+    def constructSolve(self, native = True, warmStart = False, backend = 'auto', **solverArgs):
+        ## This method constructs and solves the optimization
+        # backend picks the solver backend (see csss/Backends.py and solverBackends):
+        # 'auto' uses the fastest one that applies to the structure of the problem,
+        # e.g. a sparse factorization for equality constrained least squares, and
+        # falls back to cvxpy. native = False is the same as backend = 'cvxpy'.
+        # If warmStart is True the solver starts from the previous solution: the
+        # model is switched to parameterized mode so the compiled problem, and with
+        # it the previous primal and dual solution, is reused (for solvers that
+        # support warm starts, e.g. SCS). Other keyword arguments (solver, ...) are
+        # passed to cvxpy. With a solution cache enabled, identical solves return
+        # the cached solution.
+        if warmStart:
+            self.parameterizeProblem()
+            solverArgs['warm_start'] = True
+
+        if backend == 'auto' and not native:
+            backend = 'cvxpy'
+        if self.solutionCache is None:
+            return self._solve(backend, **solverArgs)
+
+        options = dict(solverArgs)
+        options.pop('warm_start', None)
+        options['backend'] = backend
+        key   = Cache.solutionKey(self, options)
+        entry = self.solutionCache.get(key)
+        if entry is not None:
+            Profiling.event(self, 'cacheHit', saved = entry['seconds'])
+            self._storeSolutions(entry['sources'], entry['thetas'])
+            return(entry['value'])
+        Profiling.event(self, 'cacheMiss')
+
+        t0 = time.time()
+        value = self._solve(backend, **solverArgs)
+        Cache.storeEntry(self, self.solutionCache, key, value, time.time() - t0)
+        return(value)
+
+    def _solve(self, backend, **solverArgs):
+        return Backends.solve(self, backend, **solverArgs)
+
+    def solverBackends(self):
+        ## Backends that can solve this problem, fastest first; constructSolve with
+        # backend = 'auto' tries the ones other than 'admm' and 'timeBlocks' in turn
+        return(Backends.applicable(self, auto = False))
+
+    def _solveCvxpy(self, **solverArgs):
+        ## Generic backend, solve the problem with cvxpy
+        if self.parameterize:
+            return self._solveParameterized(**solverArgs)
+
+        with Profiling.phase(self, 'buildProblem'):
+            ## For each model and source group
+            #    - Add cost to objective function
+            #    - (TODO) Add custom constraints for each source
+            obj = self._problemObjective()
+
+            ## Constraints: custom, bounds on each source and the coupling constraint
+            # that the sum of sources must equal the aggregate signal. Bound and coupling
+            # constraints are cached and only rebuilt when their values change.
+            con = self.problemConstraints()
+            prob = cvp.Problem(cvp.Minimize(obj), con)
 
         ## Solve problem
-        prob = cvp.Problem(cvp.Minimize(obj), con)
-        return prob.solve()
+        return self._solveProblem(prob, **solverArgs)
+
+    def _solveProblem(self, prob, **solverArgs):
+        ## Solve a cvxpy problem and collect its solution. When profiling, the wall
+        # time is split into canonicalization ('compile') and 'solver' time, and the
+        # solver statistics and problem size are recorded as a 'solve' event.
+        self.lastProblem = prob
+        t0 = time.time()
+        value = prob.solve(**solverArgs)
+        wall = time.time() - t0
+        self._collectSolution()
+
+        if self.profiler is not None:
+            stats  = getattr(prob, 'solver_stats', None)
+            solver = getattr(stats, 'solver_name', None) or solverArgs.get('solver')
+            solve_time = getattr(stats, 'solve_time', None)
+            if solve_time is not None:
+                self.profiler.record('compile', wall - solve_time)
+                self.profiler.record('solver', solve_time)
+            size = Profiling.problemSize(prob, solver if self.profiler.problemData else None)
+            self.profiler.event('solve', status = prob.status, value = value, wall = wall, solver = solver,
+                                iterations = getattr(stats, 'num_iters', None), **size)
+        return(value)
+
+    def problemConstraints(self):
+        ## All constraints passed to the solver, as a new list: the bound and
+        # coupling constraints must not be appended to self.constraints, or every
+        # solve would add another copy, and a re-solve with a new aggregate signal
+        # would keep the coupling constraint of the old one and be infeasible
+        con = list(self.constraints)
+        for name in self._boundNames():
+            con = con + self._boundConstraints(name)
+        con.append(self._couplingConstraint())
+        return(con)
+
+    def constraintSummary(self):
+        ## Number of constraints and of scalar constraint rows passed to the solver, by kind
+        kinds = {}
+        kinds['user']     = list(self.constraints)
+        kinds['bounds']   = [c for name in self._boundNames() for c in self._boundConstraints(name)]
+        kinds['coupling'] = [self._couplingConstraint()]
+        summary = {}
+        for kind, cons in kinds.items():
+            summary[kind] = {'constraints': len(cons),
+                             'rows': int(np.sum([np.prod(c.size) for c in cons]))}
+        summary['total'] = {'constraints': int(np.sum([v['constraints'] for v in summary.values()])),
+                            'rows': int(np.sum([v['rows'] for v in summary.values()]))}
+        return(summary)
+
+    def _boundNames(self):
+        ## Sources with their own bound constraints, and ('group', name) of each source group
+        names = [name for name, model in self.models.items() if 'group' not in model]
+        return(names + [('group', groupName) for groupName in self.groups.keys()])
+
+    def _boundConstraints(self, name):
+        ## lb and ub constraints of a source or source group, built once and reused while
+        # the source variable and the bounds (or, in parameterized mode, their parameters)
+        # are unchanged.
+        if isinstance(name, tuple):
+            model = self.groups[name[1]]
+        else:
+            model = self.models[name]
+        if self.parameterize:
+            key = (model['source'], model['params'].get('lb'), model['params'].get('ub'))
+        else:
+            key = (model['source'], model['lb'], model['ub'])
+        cached = self.boundConstraints.get(name)
+        if cached is not None and all([self._sameValue(a, b) for a, b in zip(cached['key'], key)]):
+            return(cached['constraints'])
+
+        con = []
+        lb, ub = key[1], key[2]
+        if lb is not None:
+            con.append(model['source'] >= lb)
+        if ub is not None:
+            con.append(model['source'] <= ub)
+        key = tuple([k if k is None or hasattr(k, 'id') else np.array(k, copy = True) for k in key])
+        self.boundConstraints[name] = {'key': key, 'constraints': con}
+        return(con)
+
+    def _couplingConstraint(self):
+        ## Constraint that the sum of sources equals the aggregate signal, built once
+        # and reused while the sources and the aggregate signal are unchanged.
+        sources = [model['source'] for model in self.models.values() if 'group' not in model]
+        sources = tuple(sources + [group['source'] for group in self.groups.values()])
+        columns = [len(group['names']) for group in self.groups.values()]
+        if self.parameterize:
+            aggregate = self.aggregateParam
+        else:
+            aggregate = self.aggregateSignal
+        cached = self.couplingConstraint
+        if cached is not None and len(cached['sources']) == len(sources) \
+                and all([a is b for a, b in zip(cached['sources'], sources)]) \
+                and self._sameValue(cached['aggregate'], aggregate):
+            return(cached['constraint'])
 
-    def admmSolve(self,rho, MaxIter=500,ABSTOL= 1e-4,RELTOL=1e-1, verbose=False):
+        sum_sources = np.zeros((self.N,1))
+        for source in sources[:len(sources) - len(columns)]:
+            sum_sources = sum_sources + source
+        for source, M in zip(sources[len(sources) - len(columns):], columns):
+            ## Sum the columns of a source group
+            sum_sources = sum_sources + source * np.ones((M,1))
+        con = (aggregate == sum_sources)
+        if not hasattr(aggregate, 'id'):
+            aggregate = np.array(aggregate, copy = True)
+        self.couplingConstraint = {'sources': sources, 'aggregate': aggregate, 'constraint': con}
+        return(con)
+
+    def _sameValue(self, a, b):
+        ## Compare cached constraint data, cvxpy objects by identity and arrays by value
+        if a is None or b is None or hasattr(a, 'id') or hasattr(b, 'id'):
+            return(a is b)
+        return(np.shape(a) == np.shape(b) and np.array_equal(a, b))
+
+    @Profiling.timed('batchSolve')
+    def batchSolve(self, aggregateSignals, regressors = None, native = True, **solverArgs):
+        ## Solve the same model structure for a batch of aggregate signals.
+        # aggregateSignals: (B x N) array, one aggregate signal per row.
+        # regressors:       optional dict of per batch regressors for some sources,
+        #                   each a (B x N x order) array. Other sources keep their own.
+        # Returns a (B x sources x N) array of sources, in the order of self.models.
+        # Least squares problems are solved natively with one factorization of the
+        # shared part; other problems compile the parameterized problem once and
+        # re-solve it for each batch. The models hold the last solution afterwards.
+        Y = np.array(aggregateSignals, dtype = float)
+        if Y.ndim == 1:
+            Y = Y[None, :]
+        if Y.shape[1] != self.N:
+            raise ValueError('Aggregate signals must be a (batch x N) array with N = %d' % self.N)
+        if regressors is None:
+            regressors = {}
+        for name in regressors.keys():
+            if 'group' in self.models[name]:
+                raise ValueError('Per batch regressors are not supported for source {} of a source group'.format(name))
+        names   = list(self.models.keys())
+        B       = Y.shape[0]
+        sources = np.zeros((B, len(names), self.N))
+
+        from csss import LeastSquares
+        if native and LeastSquares.isLeastSquares(self):
+            ## A singular KKT system, e.g. collinear regressors without a theta
+            # regularizer, falls back to cvxpy below
+            try:
+                solver = LeastSquares.LeastSquaresSolver(self, names)
+                if len(regressors) == 0:
+                    z, theta = solver.solve(Y.T)
+                    sources  = np.transpose(z, (2, 0, 1))
+                    thetas   = np.split(theta[:, -1], np.cumsum(solver.orders)[:-1])
+                else:
+                    for b in range(B):
+                        solver.setRegressors(dict([(name, r[b]) for name, r in regressors.items()]))
+                        z, thetas = solver.solve(Y[b])
+                        sources[b] = z
+            except (RuntimeError, np.linalg.LinAlgError):
+                solver = None
+            if solver is not None and np.all(np.isfinite(sources)):
+                self._storeSolutions(dict(zip(names, sources[-1])), dict(zip(names, thetas)))
+                return(sources)
+            sources = np.zeros((B, len(names), self.N))
+
+        ## Compile once and swap the aggregate signal (and regressors) per batch
+        self.parameterizeProblem()
+        aggregateSignal = self.aggregateSignal
+        original = dict([(name, self.models[name]['regressor']) for name in regressors.keys()])
+        try:
+            for b in range(B):
+                for name, r in regressors.items():
+                    self.models[name]['regressor'] = np.array(r[b], dtype = float).reshape(self.N, -1)
+                    if isinstance(self.models[name]['theta'], cvp.Variable):
+                        ## The regressor is part of the compiled expression
+                        self.models[name].pop('structure', None)
+                    self.updateSourceObj(name)
+                self.aggregateSignal = Y[b]
+                self.constructSolve(native = False, **solverArgs)
+                for i, name in enumerate(names):
+                    sources[b, i] = np.ravel(np.array(self.models[name]['source'].value))
+        finally:
+            self.aggregateSignal = aggregateSignal
+            for name, r in original.items():
+                self.models[name]['regressor'] = r
+                self.models[name].pop('structure', None)
+                self.updateSourceObj(name)
+        return(sources)
+
+    def _solveParameterized(self, **solverArgs):
+        ## Compile the problem once, then only rebind the aggregate signal and
+        # re-solve. Hyperparameters are rebound by updateSourceObj.
+        ## Rebind the parameters of changed sources and source groups, this may
+        # require a recompile if their structure changed
+        self._refreshSources()
+        if self.problem is None:
+            with Profiling.phase(self, 'buildProblem'):
+                obj = self._problemObjective()
+                self.problem = cvp.Problem(cvp.Minimize(obj), self.problemConstraints())
+
+        self.aggregateParam.value = self._columnValue(self.aggregateSignal, self.N)
+        return self._solveProblem(self.problem, **solverArgs)
+
+    def temporalStructure(self):
+        ## 'separable' or 'banded' if the problem decomposes in time, None otherwise, see csss/TimeBlocks.py
+        from csss import TimeBlocks
+        return(TimeBlocks.temporalStructure(self))
+
+    def timeBlockSolve(self, blockLength, overlap = None, reconcile = 0, workers = None, executor = 'process', **solverArgs):
+        ### Solve a problem with fixed thetas in blocks of blockLength samples, in parallel
+        #  across `workers` processes (or threads). Blocks of banded problems, with
+        #  diff1_ss source regularizers, overlap by `overlap` samples on each side, and
+        #  `reconcile` passes re-solve them coupled to their neighbours' solution.
+        #  Returns the objective value of the stitched solution, see csss/TimeBlocks.py.
+        from csss import TimeBlocks
+        return(TimeBlocks.timeBlockSolve(self, blockLength, overlap, reconcile, workers, executor, **solverArgs))
+
+    def admmSolve(self,rho, MaxIter=500,ABSTOL= 1e-4,RELTOL=1e-1, verbose=False,
+                  method='gauss-seidel', workers=None, executor='process', schedule='static', innerIter=50):
         ### This method constructs and solves the optimization using ADMM
 
         ### Add the coupling constraint using lagrangian
@@ -189,92 +943,34 @@ class CSSS:
         #    - For each source, set the price and the remaining sources constant,
         #       - Add individual constraints to individual source updates,
         #       - Solve and update the source.
-        dual_objective=[]
-        norm_resid_equality=[]
-        aggregateSignalVector=np.array([[elem] for elem in self.aggregateSignal])
-        overall_complexity=0
-        if verbose:
-            print('Verbose on')
-        u=np.zeros((self.N,1))
-        for k in range(0, MaxIter):
-            for name, model in self.models.items():
-                if k==0:
-                    ### Initialize sources and old sources to zeros
-                    model['admmSource']=np.zeros((self.N,1))
-                    #model['admmTheta']=np.zeros((model['order'],1))
-                    overall_complexity=overall_complexity+model['order']
-                else:
-                    ### Update each source by keeping the other sources constant
-                    obj=0
-                    con=[]
-                    sum_sources = np.zeros((self.N,1))
-                    for name_sub, model_sub in self.models.items():
-                        ### For all the other sources, assume values constant
-                        if name_sub!=name:
-                            # residuals = (model['admmSource']
-                            #     - (model['regressor'].dot( model['admmTheta'])))
-                            sum_sources = sum_sources + model_sub['admmSource']
-                        else:
-                            ### This is the only source
-                            ### we are solving for at each update
-                            theta_update=cvp.Variable(model['order'],1)
-                            source_update=cvp.Variable(self.N,1)
-
-                            residuals = (source_update
-                            - (model['regressor'] * theta_update))
-
-                            if model['lb'] is not None:
-                                con.append(source_update >= model['lb'])
-                            if model['ub'] is not None:
-                                con.append(source_update <= model['ub'])
-
-                            sum_sources = sum_sources + source_update
-
-                            ## MT TODO
-                            # Why redefine the objective here?  Each source already has an
-                            # objective defiend in the class, model_sub.obj.
-                            obj=cvp.sum_squares(residuals) * model['alpha']
-
-                    obj=obj+(rho/2)*cvp.sum_squares(sum_sources-aggregateSignalVector+u)
-                    prob = cvp.Problem(cvp.Minimize(obj),con)
-                    last_obj=prob.solve()
-                    ### Update source
-                    ## keep diff for tolerance
-                    source_update_diff=source_update.value-self.models[name]['admmSource']
-                    self.models[name]['admmSource']=source_update.value
-                    #self.models[name]['admmTheta']=theta_update.value
-
-            if k==0:
-                if verbose:
-                    print('Initialized all sources')
-                    print("iter_num","s_norm","eps_dual","r_norm","eps_pri")
-
-            else:
-                dual_objective.append(last_obj)
-                u=u+(sum_sources-aggregateSignalVector).value
-
-                norm_resid=cvp.norm(sum_sources-aggregateSignalVector).value
-                eps_pri = np.sqrt(overall_complexity)*ABSTOL
-                + RELTOL*max(np.linalg.norm(sum_sources.value),np.linalg.norm(-aggregateSignalVector));
-                norm_resid_equality.append(norm_resid)
-
-                s_norm=np.linalg.norm(-rho*source_update_diff)
-                eps_dual= np.sqrt(overall_complexity)*ABSTOL + RELTOL*np.linalg.norm(rho*u);
-
-
-                if (verbose):
-                    print(k, s_norm,eps_dual,norm_resid,eps_pri)
-
-
-                if (s_norm<eps_dual) and (norm_resid<eps_pri):
-                    break
-                #print(np.transpose(y))
-                #print(k, dual_objective)
-        return dual_objective,norm_resid_equality,u
+        #  Source updates are closed form with cached factorizations where possible,
+        #  see csss/ADMM.py. Updates of bounded sources solve a box constrained QP
+        #  with an active set method, exact once the active set repeats; innerIter
+        #  caps its iterations per update.
+        ##  With method='jacobi' all sources are updated from the previous iterate
+        #  concurrently in a pool of `workers` processes or threads (`executor`).
+        #  `schedule` is 'static' (one balanced chunk of sources per worker) or
+        #  'dynamic' (one task per source, largest first, taken by the next free
+        #  thread). Dynamic scheduling needs executor='thread' and raises a
+        #  ValueError with processes: there every chunk and its state is pinned to
+        #  one worker, and only the shared residual is exchanged per iteration.
+        #  Per iteration wall times are stored in self.admmTiming.
+        ##  Residuals and timings of each iteration are recorded as 'admmIteration'
+        #  events of the profiler (see enableProfiling), and printed if verbose is True.
+        from csss import ADMM
+        if method == 'jacobi':
+            return ADMM.admmSolveJacobi(self, rho, MaxIter = MaxIter, ABSTOL = ABSTOL, RELTOL = RELTOL, verbose = verbose,
+                                        workers = workers, executor = executor, schedule = schedule, innerIter = innerIter)
+        elif method != 'gauss-seidel':
+            raise ValueError('method must be "gauss-seidel" or "jacobi"')
+        return ADMM.admmSolve(self, rho, MaxIter = MaxIter, ABSTOL = ABSTOL, RELTOL = RELTOL, verbose = verbose,
+                              innerIter = innerIter)
 
     def fixThetas(self):
         ## Fixes theta to current value and removes it as a decision variable
         ## This is creates the "real time problem.""
         for name, m in self.models.items():
             m['theta'] = m['theta'].value
+        for groupName, group in self.groups.items():
+            group['theta'] = np.array(group['theta'].value)
         self.updateSourceObj('all')
@@ -0,0 +1,100 @@
+import hashlib
+from collections import OrderedDict
+import numpy as np
+
+## In-memory cache of CSSS solutions.
+#
+# A solution is keyed on a hash of everything that determines it: the aggregate
+# signal, and for each source its regressor, hyperparameters, bounds, cost function,
+# regularizers and fixed thetas, plus the user constraints and the solver options.
+# Identical solves, e.g. repeated points of a sensitivity sweep, then return the
+# stored sources and thetas without calling the solver. A cache can be shared
+# between CSSS objects, since model names are part of the key.
+
+class SolutionCache:
+    ## Least recently used cache of solutions, with hit and miss statistics.
+
+    def __init__(self, maxsize = 128):
+        self.maxsize   = maxsize
+        self.entries   = OrderedDict()
+        self.hits      = 0
+        self.misses    = 0
+        self.timeSaved = 0.0  # Solve time of the original solves of all hits, in seconds
+
+    def get(self, key):
+        ## Return the entry for key and mark it as recently used, or None
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return(None)
+        self.entries.move_to_end(key)
+        self.hits += 1
+        self.timeSaved += entry['seconds']
+        return(entry)
+
+    def put(self, key, value, sources, thetas, seconds):
+        ## Store a solution, evicting the least recently used entries beyond maxsize
+        self.entries[key] = {'value': value, 'sources': sources, 'thetas': thetas, 'seconds': seconds}
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.maxsize:
+            self.entries.popitem(last = False)
+
+    def clear(self):
+        ## Drop all entries and reset the statistics
+        self.entries.clear()
+        self.hits      = 0
+        self.misses    = 0
+        self.timeSaved = 0.0
+
+    def stats(self):
+        return({'hits': self.hits, 'misses': self.misses, 'size': len(self.entries),
+                'maxsize': self.maxsize, 'timeSaved': self.timeSaved})
+
+def _update(h, value):
+    ## Add a value to a hash: arrays by shape and content, the rest by repr
+    if value is None or isinstance(value, str):
+        h.update(repr(value).encode())
+    elif callable(value):
+        ## Custom regularizers are only equal to themselves
+        h.update(('callable %d' % id(value)).encode())
+    elif hasattr(value, 'id'):
+        ## cvxpy objects, e.g. the theta variable when thetas are not fixed
+        h.update(('cvxpy %s' % type(value).__name__).encode())
+    else:
+        value = np.ascontiguousarray(value)
+        if value.dtype.kind in 'biuf':
+            ## Numbers hash equal regardless of their type, e.g. alpha = 1 and 1.0
+            value = value.astype(float)
+        h.update(str(value.dtype).encode())
+        h.update(repr(value.shape).encode())
+        h.update(value.tobytes())
+
+def solutionKey(csssobj, options = None):
+    ## Hash of the problem data of a CSSS object and the solver options
+    h = hashlib.sha1()
+    _update(h, csssobj.aggregateSignal)
+    for name, model in csssobj.models.items():
+        _update(h, name)
+        for field in ['regressor', 'alpha', 'beta', 'gamma', 'lb', 'ub',
+                      'costFunction', 'regularizeTheta', 'regularizeSource', 'theta']:
+            _update(h, model[field])
+    for constraint in csssobj.constraints:
+        ## User constraints hold their own data, they are only equal to themselves
+        h.update(('constraint %d' % id(constraint)).encode())
+    if options is not None:
+        h.update(repr(sorted(options.items())).encode())
+    return(h.hexdigest())
+
+def storeEntry(csssobj, cache, key, value, seconds):
+    ## Copy the current solution of a CSSS object into the cache, if there is one
+    if any([model['source'].value is None for model in csssobj.models.values()]):
+        return
+    sources = {}
+    thetas  = {}
+    for name, model in csssobj.models.items():
+        sources[name] = np.ravel(np.array(model['source'].value, dtype = float))
+        if hasattr(model['theta'], 'id') and model['theta'].value is not None:
+            thetas[name] = np.ravel(np.array(model['theta'].value, dtype = float))
+        else:
+            thetas[name] = None
+    cache.put(key, value, sources, thetas, seconds)
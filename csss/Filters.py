@@ -0,0 +1,88 @@
+import numpy as np
+
+## Cyclic and streaming FIR filters, e.g. to smooth squared residuals into a
+## variance estimate when tuning alphas.
+#
+# cyclicConvolve filters the last axis of a 1-D signal or a 2-D (series x N) batch
+# in one call, treating each series as periodic. Short filters are applied
+# directly with np.convolve on a cyclically padded copy, long filters with FFTs
+# in O(N log N) instead of O(N K). StreamingFilter applies a filter to samples as they arrive,
+# keeping only the last K - 1 samples as state.
+
+FFT_MIN_TAPS = 192  # Filters with at least this many taps are applied with FFTs
+
+def _padding(K, left = True):
+    ## Samples before and after each output sample covered by a filter of K taps.
+    # Even filters are centered half a sample to the left, or to the right.
+    if (K % 2) == 1:
+        pad_l = (K - 1) // 2
+        pad_r = pad_l
+    elif left:
+        pad_l = K // 2
+        pad_r = pad_l - 1
+    else:
+        pad_r = K // 2
+        pad_l = pad_r - 1
+    return(pad_l, pad_r)
+
+def cyclicConvolve(x, filt, left = True, method = 'auto'):
+    ## Cyclic convolution of the last axis of x with filt, centered as convolve_cyc.
+    # method: 'direct', 'fft', or 'auto' to use FFTs for filters of at least
+    #         FFT_MIN_TAPS taps
+    x    = np.asarray(x, dtype = float)
+    filt = np.ravel(np.asarray(filt, dtype = float))
+    K    = len(filt)
+    pad_l, pad_r = _padding(K, left)
+    if method == 'auto':
+        method = 'fft' if K >= FFT_MIN_TAPS else 'direct'
+    if method == 'fft':
+        return(_fftConvolve(x, filt, pad_r))
+    elif method == 'direct':
+        return(_directConvolve(x, filt, pad_l, pad_r))
+    raise ValueError('method must be "auto", "direct" or "fft"')
+
+def _validConvolve(xp, filt):
+    ## np.convolve(mode = 'valid') of each series along the last axis
+    rows = xp.reshape(-1, xp.shape[-1])
+    y    = np.empty((rows.shape[0], rows.shape[1] - len(filt) + 1))
+    for i in range(rows.shape[0]):
+        y[i] = np.convolve(rows[i], filt, mode = 'valid')
+    return(y.reshape(xp.shape[:-1] + (y.shape[1],)))
+
+def _directConvolve(x, filt, pad_l, pad_r):
+    ## Pad each series cyclically once, then convolve
+    N  = x.shape[-1]
+    xp = np.take(x, np.arange(-pad_l, N + pad_r) % N, axis = -1)
+    return(_validConvolve(xp, filt))
+
+def _fftConvolve(x, filt, pad_r):
+    ## Wrap the filter onto the period of the series: y[n] = sum_k filt[k] x[n + pad_r - k]
+    N = x.shape[-1]
+    h = np.zeros(N)
+    np.add.at(h, (np.arange(len(filt)) - pad_r) % N, filt)
+    return(np.fft.irfft(np.fft.rfft(x, axis = -1) * np.fft.rfft(h), n = N, axis = -1))
+
+class StreamingFilter:
+    ## Causal FIR filter of a stream of samples: y[n] = sum_k filt[k] x[n - k].
+    # The state is the last K - 1 input samples of each series, so filtering n new
+    # samples costs O(n K) regardless of the length of the history. Series are
+    # along the last axis, so a (series x n) batch is filtered at once.
+
+    def __init__(self, filt, history = None):
+        ## history: previous samples of the stream. Without history the state is
+        #           zeros, which biases the first K - 1 outputs towards zero.
+        self.filt  = np.ravel(np.asarray(filt, dtype = float))
+        self.state = None
+        if history is not None:
+            self.update(history)
+
+    def update(self, x):
+        ## Filter the new samples x and return the filtered samples
+        x = np.asarray(x, dtype = float)
+        K = len(self.filt)
+        if self.state is None:
+            self.state = np.zeros(x.shape[:-1] + (K - 1,))
+        xp = np.concatenate([self.state, x], axis = -1)
+        y  = _validConvolve(xp, self.filt)
+        self.state = xp[..., xp.shape[-1] - (K - 1):]
+        return(y)
@@ -0,0 +1,151 @@
+import os
+import concurrent.futures
+import numpy as np
+from csss.Separable import waterFill
+
+## Hierarchical solar disaggregation for feeders with many homes.
+#
+# The monolithic SolarDisagg_IndvHome problem has one solar source per home and
+# grows with the number of homes M. The hierarchical mode splits it in two levels:
+#   1. homes are partitioned into groups (e.g. by transformer, or by the similarity
+#      of their net loads' response to the regressors), and a group-level problem
+#      disaggregates the aggregate net load into the solar of each group and the
+#      aggregate load. The solar of a group of independent homes has variance the
+#      sum of theirs, so its alpha is 1 / sum(1 / alpha_i), and its upper bound is
+#      the sum of the homes' bounds.
+#   2. the solar of each group is disaggregated into the solar of its homes, one
+#      small problem per group, solved in parallel in a process or thread pool.
+# Reconciliation then projects the homes' solar of each group onto the exact sum
+# of the group's solar within the homes' bounds (alpha weighted water-filling), and
+# the aggregate load is the aggregate net load minus all solar, so the sum of the
+# sources equals the aggregate net load exactly.
+
+def partition(netloads, groups = None, solarregressors = None, loadregressors = None):
+    ## Partition the M homes of an (N x M) net load array into groups, as a list of
+    # arrays of home indices. groups is
+    #   - None, for about sqrt(M) groups by similarity,
+    #   - a number of groups, by similarity: homes are ordered by the first principal
+    #     component of the standardized coefficients of a regression of their net
+    #     load on the regressors, and cut into groups of equal size,
+    #   - a label per home, e.g. its transformer, for one group per label,
+    #   - a list of lists of home indices, used as is.
+    netloads = np.asarray(netloads, dtype = float)
+    N, M = netloads.shape
+    if groups is None:
+        groups = int(np.ceil(np.sqrt(M)))
+    if np.isscalar(groups):
+        groups = max(1, min(int(groups), M))
+        X = np.column_stack([np.ones(N)] + [np.asarray(r, dtype = float) for r in [solarregressors, loadregressors] if r is not None])
+        coef     = np.linalg.lstsq(X, netloads, rcond = None)[0].T
+        coef     = (coef - np.mean(coef, axis = 0)) / np.maximum(np.std(coef, axis = 0), 1e-12)
+        u, s, vt = np.linalg.svd(coef, full_matrices = False)
+        order    = np.argsort(u[:, 0] * s[0], kind = 'mergesort')
+        return([np.sort(g) for g in np.array_split(order, groups)])
+    if len(groups) == M and not any([np.ndim(g) > 0 for g in groups]):
+        labels = np.asarray(groups)
+        return([np.flatnonzero(labels == label) for label in sorted(set(labels.tolist()))])
+    return([np.asarray(g, dtype = int) for g in groups])
+
+def _columns(value, N, M):
+    ## (N x M) array of a scalar, length N or (N x M) hyperparameter of M sources
+    value = np.asarray(value, dtype = float)
+    if value.ndim == 2 and value.shape == (N, M):
+        return(value)
+    if value.ndim == 1 and value.shape[0] == M and M != N:
+        return(np.array(np.broadcast_to(value, (N, M))))
+    if value.size == 1:
+        return(np.full((N, M), float(value)))
+    return(np.array(np.broadcast_to(np.reshape(value, (N, 1)), (N, M))))
+
+def solveGroup(spec, solverArgs = None):
+    ## Disaggregate the solar of a group into its homes. Returns the (homes x N)
+    # solar and the (homes x order) thetas.
+    from csss.CSSS import CSSS
+    group = CSSS(spec['solar'])
+    names = [str(i) for i in range(spec['alpha'].shape[1])]
+    for i, name in enumerate(names):
+        group.addSource(spec['regressor'], name = name, alpha = spec['alpha'][:, i], ub = spec['ub'][:, i])
+    group.constructSolve(**(solverArgs or {}))
+    sources = np.array([np.ravel(np.array(group.models[name]['source'].value)) for name in names])
+    thetas  = np.array([np.ravel(np.array(group.models[name]['theta'].value)) for name in names])
+    return(sources, thetas)
+
+def _pool(workers, executor):
+    if workers == 1:
+        return(None)
+    elif executor == 'process':
+        return(concurrent.futures.ProcessPoolExecutor(max_workers = workers))
+    elif executor == 'thread':
+        return(concurrent.futures.ThreadPoolExecutor(max_workers = workers))
+    raise ValueError('executor must be "process" or "thread"')
+
+def hierarchicalDisaggregate(netloads, solarregressors, loadregressors, groups = None, alpha = 1, loadAlpha = 1,
+                             ub = None, workers = None, executor = 'process', **solverArgs):
+    ## Disaggregate the net loads of M homes hierarchically. Returns a dict with
+    #   'solar':      (N x M) solar of each home,
+    #   'load':       aggregate load, the aggregate net load minus all solar,
+    #   'thetas':     (M x order) solar thetas of each home,
+    #   'loadTheta':  load theta of the group-level problem,
+    #   'groups':     the home indices of each group (see partition),
+    #   'groupSolar': (N x groups) solar of each group,
+    #   'objective':  value of the SolarDisagg_IndvHome objective at the solution.
+    # alpha, ub:    solar alphas and upper bounds, scalars, length N or (N x M) arrays;
+    #               ub defaults to min(net load, 0) as in SolarDisagg_IndvHome
+    # loadAlpha:    alpha of the aggregate load
+    # workers:      processes or threads for the group problems, default one per cpu
+    # solverArgs:   arguments of constructSolve
+    from csss.CSSS import CSSS
+    netloads        = np.asarray(netloads, dtype = float)
+    solarregressors = np.asarray(solarregressors, dtype = float)
+    loadregressors  = np.asarray(loadregressors, dtype = float)
+    N, M = netloads.shape
+    groups = partition(netloads, groups, solarregressors, loadregressors)
+    alpha  = _columns(alpha, N, M)
+    ub     = np.minimum(netloads, 0) if ub is None else _columns(ub, N, M)
+    aggregate = np.sum(netloads, axis = 1)
+
+    ## Group-level problem, the solar of each group and the aggregate load
+    top = CSSS(aggregate)
+    for g, homes in enumerate(groups):
+        top.addSource(solarregressors, name = str(g), alpha = 1.0 / np.sum(1.0 / alpha[:, homes], axis = 1),
+                      ub = np.sum(ub[:, homes], axis = 1))
+    top.addSource(loadregressors, name = 'AggregateLoad', alpha = loadAlpha, lb = 0)
+    top.constructSolve(**solverArgs)
+
+    ## Within the group bounds exactly, rather than to the solver tolerance, so the
+    # homes' bounds can add up to it
+    groupSolar = np.column_stack([np.ravel(np.array(top.models[str(g)]['source'].value)) for g in range(len(groups))])
+    groupSolar = np.minimum(groupSolar, np.column_stack([np.sum(ub[:, homes], axis = 1) for homes in groups]))
+
+    ## Homes within each group, in parallel
+    specs = [{'solar': groupSolar[:, g], 'regressor': solarregressors, 'alpha': alpha[:, homes], 'ub': ub[:, homes]}
+             for g, homes in enumerate(groups)]
+    if workers is None:
+        workers = os.cpu_count() or 1
+    workers = max(1, min(workers, len(groups)))
+    pool    = _pool(workers, executor)
+    try:
+        if pool is None:
+            results = [solveGroup(spec, solverArgs) for spec in specs]
+        else:
+            results = list(pool.map(solveGroup, specs, [solverArgs] * len(specs)))
+    finally:
+        if pool is not None:
+            pool.shutdown()
+
+    ## Reconcile: the homes of each group add up to the group's solar exactly
+    solar  = np.empty((N, M))
+    thetas = np.empty((M, solarregressors.shape[1]))
+    for g, ((sources, groupThetas), homes, spec) in enumerate(zip(results, groups, specs)):
+        reconciled = waterFill(sources, spec['alpha'].T, -np.inf * np.ones(sources.shape), spec['ub'].T, spec['solar'])
+        if reconciled is None:
+            raise ValueError('The solar of group %d exceeds the sum of its homes\' upper bounds' % g)
+        solar[:, homes] = reconciled.T
+        thetas[homes]   = groupThetas
+    load = aggregate - np.sum(solar, axis = 1)
+
+    loadTheta = np.ravel(np.array(top.models['AggregateLoad']['theta'].value))
+    objective = np.sum(alpha * (solar - np.dot(solarregressors, thetas.T)) ** 2) + \
+                np.sum(_columns(loadAlpha, N, 1)[:, 0] * (load - np.dot(loadregressors, loadTheta)) ** 2)
+    return({'solar': solar, 'load': load, 'thetas': thetas, 'loadTheta': loadTheta, 'groups': groups,
+            'groupSolar': groupSolar, 'objective': objective})
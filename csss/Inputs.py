@@ -0,0 +1,134 @@
+import numpy as np
+
+## Out-of-core inputs for long histories.
+#
+# Net loads and regressors can be given as in-memory arrays, memory-mapped .npy
+# files, or HDF5 datasets (with h5py installed). Nothing is read until a slice
+# is taken, so disaggregateBlocks solves a history in time blocks, e.g. one month
+# at a time, with memory bounded by the block length rather than the history.
+# The sources of each block are written into one (N x sources) output array,
+# which can itself be a memory-mapped .npy file. Slices of memory-mapped arrays
+# are views, slices of HDF5 datasets are read into new arrays.
+
+def openArray(source, mode = 'r'):
+    ## Array-like view of source without reading it:
+    #   - a path to a .npy file is memory-mapped,
+    #   - a path 'file.h5:dataset' (or .hdf5) opens the HDF5 dataset,
+    #   - anything else, e.g. an array, memmap or h5py dataset, is returned as is.
+    # The HDF5 file of a dataset opened from a path stays open until closeArray.
+    if not isinstance(source, str):
+        return(source)
+    path, _, dataset = source.partition(':')
+    if path.lower().endswith('.npy'):
+        return(np.load(path, mmap_mode = mode))
+    elif path.lower().endswith(('.h5', '.hdf5')):
+        try:
+            import h5py
+        except ImportError:
+            raise ImportError('h5py is required to read HDF5 inputs')
+        if dataset == '':
+            raise ValueError('Give the HDF5 dataset as "file.h5:dataset"')
+        return(h5py.File(path, mode)[dataset])
+    raise ValueError('Unsupported input file %s, use .npy or .h5' % source)
+
+def closeArray(array):
+    ## Close the HDF5 file of a dataset returned by openArray. Memory-mapped arrays
+    # are unmapped when they are no longer referenced.
+    f = getattr(array, 'file', None)
+    if f is not None and hasattr(f, 'close'):
+        f.close()
+
+def loadArray(source):
+    ## Array of source for a model that holds its inputs: .npy paths and memmaps
+    # stay memory-mapped, HDF5 datasets are read into memory, and the file of one
+    # opened from a path is closed.
+    array = openArray(source)
+    if getattr(array, 'file', None) is None:
+        return(array)
+    values = np.asarray(array[...], dtype = float)
+    if isinstance(source, str):
+        closeArray(array)
+    return(values)
+
+def readBlock(array, start, stop):
+    ## Read rows start:stop of an array-like into memory
+    return(np.asarray(array[start:stop], dtype = float))
+
+def blockRanges(N, blockLength):
+    ## (start, stop) of consecutive blocks of blockLength samples covering N samples.
+    # The last block is shorter if blockLength does not divide N.
+    return([(start, min(start + blockLength, N)) for start in range(0, N, blockLength)])
+
+def outputArray(shape, out = None):
+    ## Output array for stitched results: a new array, a new memory-mapped .npy
+    # file if out is a path, or out itself.
+    if out is None:
+        return(np.empty(shape))
+    elif isinstance(out, str):
+        return(np.lib.format.open_memmap(out, mode = 'w+', dtype = float, shape = shape))
+    if tuple(out.shape) != tuple(shape):
+        raise ValueError('Output array must have shape {}'.format(shape))
+    return(out)
+
+def fixThetas(model, thetas):
+    ## Fix the thetas of the sources of a model to given values, a dict of name to
+    # theta, as CSSS.fixThetas does with the solved values
+    for name, theta in thetas.items():
+        model.models[name]['theta'] = np.reshape(np.asarray(theta, dtype = float), (-1, 1))
+    for groupName, group in model.groups.items():
+        group['theta'] = np.column_stack([np.ravel(model.models[name]['theta']) for name in group['names']])
+    model.updateSourceObj('all')
+
+def disaggregateBlocks(netloads, solarregressors, loadregressors, blockLength, tuningregressors = None,
+                       names = None, out = None, setup = None, modelArgs = None, thetas = None, **solverArgs):
+    ## Disaggregate the net loads of a SolarDisagg_IndvHome problem one time block
+    # at a time, and stitch the sources into an (N x M + 1) array with one column
+    # per home and AggregateLoad last.
+    # netloads, regressors: arrays, memmaps, HDF5 datasets or paths (see openArray)
+    # blockLength:          samples per block, e.g. 96 * 30 for months of 15 minute data
+    # out:                  output array or .npy path to write to, see outputArray
+    # setup:                optional setup(model, start, stop), called before each
+    #                       solve, e.g. to add true values and tune alphas
+    # modelArgs:            keyword arguments of SolarDisagg_IndvHome, e.g. stacked
+    # thetas:               optional dict of source name to theta, e.g. fitted on a
+    #                       training period, fixed in every block
+    # solverArgs:           arguments of constructSolve
+    # Without thetas each block estimates its own thetas, so the result differs from
+    # one solve of the whole history, whose thetas are shared by all samples. With
+    # them fixed the problem separates in time and the blocks give the same sources.
+    inputs = [netloads, solarregressors, loadregressors, tuningregressors]
+    opened = [openArray(source) for source in inputs]
+    try:
+        return(_disaggregateBlocks(opened[0], opened[1], opened[2], blockLength, opened[3], names, out, setup,
+                                   modelArgs, thetas, **solverArgs))
+    finally:
+        ## Close the HDF5 files opened here from paths
+        for source, array in zip(inputs, opened):
+            if isinstance(source, str):
+                closeArray(array)
+
+def _disaggregateBlocks(netloads, solarregressors, loadregressors, blockLength, tuningregressors, names, out, setup,
+                        modelArgs, thetas, **solverArgs):
+    from csss.SolarDisagg import SolarDisagg_IndvHome
+    if modelArgs is None:
+        modelArgs = {}
+
+    N, M = netloads.shape
+    if names is None:
+        names = [str(i) for i in np.arange(M)]
+    out = outputArray((N, M + 1), out)
+    for start, stop in blockRanges(N, blockLength):
+        tuning = None if tuningregressors is None else readBlock(tuningregressors, start, stop)
+        model  = SolarDisagg_IndvHome(readBlock(netloads, start, stop), readBlock(solarregressors, start, stop),
+                                      readBlock(loadregressors, start, stop), tuningregressors = tuning,
+                                      names = names, **modelArgs)
+        if thetas is not None:
+            fixThetas(model, thetas)
+        if setup is not None:
+            setup(model, start, stop)
+        model.constructSolve(**solverArgs)
+        for j, name in enumerate(list(names) + ['AggregateLoad']):
+            out[start:stop, j] = np.ravel(np.array(model.models[name]['source'].value))
+    if hasattr(out, 'flush'):
+        out.flush()
+    return(out)
@@ -0,0 +1,187 @@
+import numpy as np
+import scipy.sparse as sp
+import scipy.sparse.linalg as spla
+
+## Native sparse solver for CSSS problems that are equality constrained least squares.
+#
+# When every source uses the 'sse' cost, has no source regularizer or 'diff1_ss',
+# no theta regularizer or 'ss', no bounds, and there are no custom constraints,
+# constructSolve reduces to
+#
+#   min  sum_i || alpha_i^.5 (s_i - X_i theta_i) ||^2 + gamma_i ||D s_i||^2 + theta_i' B_i theta_i
+#   s.t. sum_i s_i = y
+#
+# The KKT system is sparse in the sources and the coupling multiplier, and dense only
+# in the few regressor columns. The sparse part is factorized once with a sparse LU,
+# and theta is recovered from a small dense Schur complement, so the cost is linear
+# in N and the factorization can be reused for new aggregate signals.
+
+def isLeastSquares(csssobj):
+    ## Check whether a CSSS problem can be solved by solveLeastSquares.
+    if len(csssobj.constraints) > 0:
+        return(False)
+    for name, model in csssobj.models.items():
+        if model['costFunction'].lower() != 'sse':
+            return(False)
+        if model['lb'] is not None or model['ub'] is not None:
+            return(False)
+        if callable(model['regularizeSource']) or str(model['regularizeSource']).lower() not in ['none', 'diff1_ss']:
+            return(False)
+        if callable(model['regularizeTheta']) or str(model['regularizeTheta']).lower() not in ['none', 'ss']:
+            return(False)
+        ## alpha == 0 leaves a source unpenalized and the KKT system singular
+        if np.any(np.array(model['alpha']) <= 0) or np.any(np.array(model['gamma']) < 0):
+            return(False)
+    return(len(csssobj.models) > 0)
+
+def sourceTerms(csssobj, name, regressor = None):
+    ## Collect the numeric terms of a least squares source model as plain arrays.
+    # regressor optionally replaces the regressor of the model.
+    model = csssobj.models[name]
+    N     = csssobj.N
+    if regressor is None:
+        regressor = model['regressor']
+    terms = {}
+    terms['constant'] = 0.0
+    terms['alpha'] = np.array(np.broadcast_to(np.ravel(np.array(model['alpha'], dtype = float)), (N,)))
+    if model['regularizeSource'] is None:
+        terms['gamma'] = 0.0
+    else:
+        terms['gamma'] = float(np.array(model['gamma']).squeeze())
+
+    if isinstance(model['theta'], np.ndarray):
+        ## Thetas have been fixed, the model estimate is a constant
+        terms['regressor'] = np.zeros((N,0))
+        terms['baseline']  = np.ravel(np.dot(regressor, model['theta']))
+        terms['beta']      = np.zeros(0)
+        if model['regularizeTheta'] is not None:
+            ## Constant theta regularization, only needed for the objective value
+            terms['constant'] = np.sum(np.ravel(model['beta']) * np.ravel(model['theta']) ** 2)
+    else:
+        terms['regressor'] = np.asarray(regressor, dtype = float)
+        terms['baseline']  = np.zeros(N)
+        if model['regularizeTheta'] is None:
+            terms['beta'] = np.zeros(model['order'])
+        else:
+            terms['beta'] = np.array(np.broadcast_to(np.ravel(np.array(model['beta'], dtype = float)), (model['order'],)))
+    return(terms)
+
+def diffGram(N):
+    ## D'D for the first difference operator D, a tridiagonal matrix.
+    main = 2 * np.ones(N)
+    main[0] = main[-1] = 1
+    if N == 1:
+        main[0] = 0
+    off  = -np.ones(N-1)
+    return(sp.diags([off, main, off], [-1, 0, 1], format = 'csc'))
+
+class LeastSquaresSolver:
+    ## Factorization of the KKT system of a least squares CSSS problem.
+    # The factorization only depends on regressors and hyperparameters, so it can be
+    # reused to solve for any number of aggregate signals. The sparse part does not
+    # depend on the regressors either, so new regressors only refactor the small
+    # dense part (setRegressors).
+
+    def __init__(self, csssobj, names = None):
+        if names is None:
+            names = list(csssobj.models.keys())
+        self.csssobj = csssobj
+        self.names   = names
+        self.N       = csssobj.N
+        N = self.N
+        K = len(names)
+
+        ## Sparse part: sources and the multiplier of the coupling constraint,
+        #  [ blkdiag(A_i + gamma_i L)  E' ] [ s  ]
+        #  [ E                         0  ] [ nu ]
+        terms = [sourceTerms(csssobj, name) for name in names]
+        L = diffGram(N)
+        I = sp.identity(N, format = 'csc')
+        H = sp.block_diag([sp.diags(t['alpha'], 0) + t['gamma'] * L for t in terms], format = 'csc')
+        E = sp.hstack([I] * K, format = 'csc')
+        self.lu = spla.splu(sp.bmat([[H, E.T], [E, None]], format = 'csc'))
+        self.setRegressors()
+
+    def setRegressors(self, regressors = None):
+        ## Factorize the dense part for the model regressors, or for the regressors
+        # in the dict `regressors` where given.
+        if regressors is None:
+            regressors = {}
+        N = self.N
+        K = len(self.names)
+        self.terms  = [sourceTerms(self.csssobj, name, regressors.get(name)) for name in self.names]
+
+        ## Dense part: coupling of each source to its own thetas.
+        self.orders = [t['regressor'].shape[1] for t in self.terms]
+        P = int(np.sum(self.orders))
+        F = np.zeros(((K+1) * N, P))
+        T = np.zeros((P, P))
+        j = 0
+        for i, t in enumerate(self.terms):
+            p = self.orders[i]
+            if p == 0:
+                continue
+            AX = t['alpha'][:, None] * t['regressor']
+            F[i*N:(i+1)*N, j:j+p] = -AX
+            T[j:j+p, j:j+p] = np.dot(t['regressor'].T, AX) + np.diag(t['beta'])
+            j = j + p
+        self.F = F
+        if P > 0:
+            ## Schur complement of the sparse part, S = T - F' G^-1 F
+            self.W = self.lu.solve(F)
+            self.S = T - np.dot(F.T, self.W)
+            ## Collinear regressors without a theta regularizer leave theta, and S,
+            # singular; np.linalg.solve does not reliably detect it in floating point
+            if np.linalg.cond(self.S) > 1e12:
+                raise np.linalg.LinAlgError('Singular Schur complement, the thetas are not unique')
+
+        ## Constant part of the right hand side from fixed thetas.
+        self.rhs = np.concatenate([t['alpha'] * t['baseline'] for t in self.terms])
+
+    def solve(self, aggregateSignals):
+        ## Solve for one aggregate signal (N,) or a batch of them (N, B).
+        # Returns sources (K, N) and a list of thetas, or (K, N, B) and (P, B) for a batch.
+        Y = np.array(aggregateSignals, dtype = float)
+        batch = Y.ndim > 1
+        Y = np.reshape(Y, (self.N, -1))
+        K = len(self.names)
+        r = np.vstack([np.repeat(self.rhs[:, None], Y.shape[1], axis = 1), Y])
+        z = self.lu.solve(r)
+        if self.F.shape[1] > 0:
+            theta = np.linalg.solve(self.S, -np.dot(self.F.T, z))
+            z = z - np.dot(self.W, theta)
+        else:
+            theta = np.zeros((0, Y.shape[1]))
+
+        sources = np.reshape(z[:K*self.N], (K, self.N, -1))
+        if batch:
+            return(sources, theta)
+        return(sources[:, :, 0], np.split(theta[:, 0], np.cumsum(self.orders)[:-1]))
+
+def objectiveValue(csssobj, name, source, theta):
+    ## Evaluate the least squares objective of a source at a solution.
+    terms = sourceTerms(csssobj, name)
+    resid = source - terms['baseline'] - np.dot(terms['regressor'], theta)
+    obj   = np.sum(terms['alpha'] * resid ** 2)
+    obj   = obj + terms['gamma'] * np.sum(np.diff(source) ** 2)
+    obj   = obj + np.sum(terms['beta'] * theta ** 2) + terms['constant']
+    return(obj)
+
+def solveLeastSquares(csssobj, **solverArgs):
+    ## Solve a least squares CSSS problem directly and store the solution in the models.
+    # Solver arguments of the cvxpy backend are ignored. Returns None if the KKT system
+    # is singular, e.g. for collinear regressors without a theta regularizer, so that
+    # the next backend is tried.
+    try:
+        solver = LeastSquaresSolver(csssobj)
+        sources, thetas = solver.solve(np.ravel(csssobj.aggregateSignal))
+    except (RuntimeError, np.linalg.LinAlgError):
+        return(None)
+    if not np.all(np.isfinite(sources)):
+        return(None)
+
+    obj = 0
+    for i, name in enumerate(solver.names):
+        obj = obj + objectiveValue(csssobj, name, sources[i], thetas[i])
+    csssobj._storeSolutions(dict(zip(solver.names, sources)), dict(zip(solver.names, thetas)))
+    return(obj)
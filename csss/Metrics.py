@@ -0,0 +1,89 @@
+import numpy as np
+import pandas as pd
+
+## Vectorized performance metrics of disaggregated signals.
+#
+# Truths and estimates are stacked into (sources x N) arrays, or arrays with any
+# number of leading dimensions, e.g. (windows x sources x N) or (batch x sources x N),
+# and every metric is a reduction over the last axis. The "_pos" metrics only use
+# the samples where |truth| exceeds 5% of |mean(truth)|, e.g. daytime solar; they
+# are computed with the subset as a boolean mask instead of indexing each source.
+
+COLUMNS = ['rmse', 'cv', 'mae', 'pmae', 'mbe', 'mean',
+           'cv_pos', 'rmse_pos', 'mae_pos', 'pmae_pos', 'mbe_pos', 'mean_pos']
+
+def metricArrays(truth, est):
+    ## Dict of metric arrays, with the shape of truth without its last axis.
+    # Relative metrics are nan where the mean of the truth is zero.
+    truth = np.asarray(truth, dtype = float)
+    est   = np.asarray(est, dtype = float)
+    err   = truth - est
+    mean  = np.mean(truth, axis = -1)
+    m = {}
+    m['mean'] = mean
+    m['mbe']  = np.mean(err, axis = -1)
+    m['rmse'] = np.sqrt(np.mean(err ** 2, axis = -1))
+    m['mae']  = np.mean(np.abs(err), axis = -1)
+
+    valid = mean != 0
+    with np.errstate(divide = 'ignore', invalid = 'ignore'):
+        m['cv']   = np.where(valid, m['rmse'] / mean, np.nan)
+        m['pmae'] = np.where(valid, m['mae'] / mean, np.nan)
+
+        ## Positive indices only
+        pos   = np.abs(truth) > (0.05 * np.abs(mean))[..., None]
+        count = np.sum(pos, axis = -1)
+        valid = valid & (count > 0)
+        count = np.where(valid, count, 1)
+        posErr = np.where(pos, err, 0)
+        m['mean_pos'] = np.sum(np.where(pos, truth, 0), axis = -1) / count
+        m['mbe_pos']  = np.sum(posErr, axis = -1) / count
+        m['rmse_pos'] = np.sqrt(np.sum(posErr ** 2, axis = -1) / count)
+        m['mae_pos']  = np.sum(np.abs(posErr), axis = -1) / count
+        m['cv_pos']   = m['rmse_pos'] / m['mean_pos']
+        m['pmae_pos'] = m['mae_pos'] / m['mean_pos']
+    for key in ['mean_pos', 'mbe_pos', 'rmse_pos', 'mae_pos', 'cv_pos', 'pmae_pos']:
+        m[key] = np.where(valid, m[key], np.nan)
+    return(m)
+
+def metricsTable(truth, est, names, labels = None, level = 'window'):
+    ## DataFrame of metrics with one row per source, indexed by 'models'.
+    # truth and est are (sources x N), or (K x sources x N) for K windows or batch
+    # runs, in which case the index is (level, 'models') with labels for the first
+    # level, by default 0 .. K-1.
+    m = metricArrays(truth, est)
+    if np.ndim(m['mean']) == 1:
+        index = pd.Index(list(names), name = 'models')
+    else:
+        K = np.shape(m['mean'])[0]
+        if labels is None:
+            labels = np.arange(K)
+        index = pd.MultiIndex.from_product([list(labels), list(names)], names = [level, 'models'])
+    df = pd.DataFrame(index = index)
+    for col in COLUMNS:
+        df[col] = np.ravel(m[col])
+    return(df)
+
+def windows(x, length, step = None):
+    ## Strided (windows x ... x length) view of the windows of length samples of the
+    # last axis of x, every step samples. The trailing samples of an incomplete
+    # window are dropped.
+    x = np.asarray(x)
+    if step is None:
+        step = length
+    N = x.shape[-1]
+    if length > N:
+        raise ValueError('Window length %d exceeds the number of samples N = %d' % (length, N))
+    K = (N - length) // step + 1
+    shape   = (K,) + x.shape[:-1] + (length,)
+    strides = (x.strides[-1] * step,) + x.strides[:-1] + (x.strides[-1],)
+    return(np.lib.stride_tricks.as_strided(x, shape = shape, strides = strides, writeable = False))
+
+def windowMetrics(truth, est, names, length, step = None):
+    ## Metrics of (sources x N) truths and estimates over windows of length samples
+    # every step samples, indexed by ('window', 'models') with the window start
+    if step is None:
+        step = length
+    t = windows(truth, length, step)
+    e = windows(est, length, step)
+    return(metricsTable(t, e, names, labels = np.arange(t.shape[0]) * step))
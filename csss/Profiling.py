@@ -0,0 +1,184 @@
+import time
+import functools
+import tracemalloc
+from contextlib import contextmanager
+
+## Opt-in instrumentation of CSSS and SolarDisagg runs.
+#
+# A Profiler records the wall time of named phases (expression building in
+# updateSourceObj, problem assembly, cvxpy canonicalization, the solver, sklearn
+# fits, ...), and events such as solver statistics, problem sizes and ADMM
+# iterations. Hooks are called with (name, data) for every finished phase and
+# every event, so the records can be forwarded to a metrics pipeline. Enable it
+# with CSSS.enableProfiling(); when disabled, phases cost a single attribute check.
+
+class Profiler:
+
+    def __init__(self, hooks = None, memory = False, problemData = False):
+        ## hooks:       callables hook(name, data), called for each phase and event
+        ## memory:      trace memory with tracemalloc and record the peak of each phase
+        ## problemData: also count nonzeros of the problem data after each solve,
+        #               which needs an extra canonicalization
+        self.hooks       = list(hooks) if hooks is not None else []
+        self.memory      = memory
+        self.problemData = problemData
+        self.depth       = {}  # Nesting depth of each phase, only the outermost is timed
+        self.peaks       = []  # Peak memory so far of each open phase, outermost first
+        self.reset()
+        if memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    def reset(self):
+        ## Drop all recorded phases and events
+        self.phases = {}
+        self.events = []
+
+    def addHook(self, hook):
+        self.hooks.append(hook)
+
+    @contextmanager
+    def phase(self, name, **info):
+        ## Time a phase. Nested calls of the same phase are counted once.
+        depth = self.depth.get(name, 0)
+        self.depth[name] = depth + 1
+        if depth > 0:
+            try:
+                yield
+            finally:
+                self.depth[name] -= 1
+            return
+        tracing = self.memory and tracemalloc.is_tracing() and hasattr(tracemalloc, 'reset_peak')
+        if tracing:
+            ## The traced peak is reset for this phase, so first fold the peak so far
+            # into the phases it is nested in
+            peak = tracemalloc.get_traced_memory()[1]
+            self.peaks = [max(p, peak) for p in self.peaks]
+            tracemalloc.reset_peak()
+            self.peaks.append(0)
+        t0 = time.time()
+        try:
+            yield
+        finally:
+            self.depth[name] -= 1
+            wall = time.time() - t0
+            if tracing:
+                self._record(name, wall, max(self.peaks.pop(), tracemalloc.get_traced_memory()[1]), info)
+            else:
+                self.record(name, wall, **info)
+
+    def record(self, name, wall, **info):
+        ## Add the wall time of a phase measured elsewhere, e.g. the solver time
+        peak = None
+        if self.memory and tracemalloc.is_tracing():
+            peak = tracemalloc.get_traced_memory()[1]
+        self._record(name, wall, peak, info)
+
+    def _record(self, name, wall, peak, info):
+        ## Add a phase with its peak traced memory in bytes, if traced
+        stats = self.phases.setdefault(name, {'calls': 0, 'wall': 0.0})
+        stats['calls'] += 1
+        stats['wall']  += wall
+        data = {'wall': wall}
+        if peak is not None:
+            stats['peak_mb'] = max(stats.get('peak_mb', 0), peak / 1e6)
+            data['peak_mb']  = peak / 1e6
+        data.update(info)
+        self._call(name, data)
+
+    def event(self, name, **data):
+        ## Record an event, e.g. solver statistics or an ADMM iteration
+        self.events.append((name, data))
+        self._call(name, data)
+
+    def _call(self, name, data):
+        for hook in self.hooks:
+            hook(name, data)
+
+    def eventsNamed(self, name):
+        return([data for n, data in self.events if n == name])
+
+    def summary(self):
+        ## Phases sorted by total wall time, and the number of events of each kind
+        counts = {}
+        for name, data in self.events:
+            counts[name] = counts.get(name, 0) + 1
+        phases = sorted(self.phases.items(), key = lambda p: -p[1]['wall'])
+        return({'phases': [dict(name = name, **stats) for name, stats in phases], 'events': counts})
+
+    def report(self):
+        ## Print the phases sorted by total wall time
+        print('{:<24s} {:>6s} {:>10s} {:>10s}'.format('phase', 'calls', 'wall [s]', 'peak [MB]'))
+        for p in self.summary()['phases']:
+            peak = '' if 'peak_mb' not in p else '{:10.1f}'.format(p['peak_mb'])
+            print('{:<24s} {:6d} {:10.4f} {}'.format(p['name'], p['calls'], p['wall'], peak))
+
+def printHook(name, data):
+    ## Print ADMM progress, the output of admmSolve(verbose = True)
+    if name == 'admmStart':
+        print('Verbose on')
+    elif name == 'admmInitialized':
+        print('Initialized all sources')
+        print("iter_num","s_norm","eps_dual","r_norm","eps_pri","seconds")
+    elif name == 'admmIteration':
+        print(data['iteration'], data['s_norm'], data['eps_dual'], data['r_norm'], data['eps_pri'], data['wall'])
+
+@contextmanager
+def _noPhase():
+    yield
+
+@contextmanager
+def verbose(obj, enabled = True):
+    ## Print the progress events of obj with printHook while in the context,
+    # with a temporary profiler if profiling is not enabled
+    if not enabled:
+        yield
+        return
+    previous = obj.profiler
+    if previous is None:
+        obj.profiler = Profiler()
+    obj.profiler.addHook(printHook)
+    try:
+        yield
+    finally:
+        obj.profiler.hooks.remove(printHook)
+        obj.profiler = previous
+
+def timed(name):
+    ## Decorator timing a method as a phase of the profiler of its object
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            if getattr(self, 'profiler', None) is None:
+                return(method(self, *args, **kwargs))
+            with self.profiler.phase(name):
+                return(method(self, *args, **kwargs))
+        return(wrapper)
+    return(decorator)
+
+def phase(obj, name, **info):
+    ## Phase of the profiler of obj, or a no-op if profiling is not enabled
+    profiler = getattr(obj, 'profiler', None)
+    if profiler is None:
+        return(_noPhase())
+    return(profiler.phase(name, **info))
+
+def event(obj, name, **data):
+    ## Event of the profiler of obj, ignored if profiling is not enabled
+    profiler = getattr(obj, 'profiler', None)
+    if profiler is not None:
+        profiler.event(name, **data)
+
+def problemSize(problem, solver = None):
+    ## Scalar variables and constraints of a cvxpy problem, and with a solver
+    # the nonzeros of its canonicalized data
+    size = {}
+    metrics = getattr(problem, 'size_metrics', None)
+    if metrics is not None:
+        size['variables']   = metrics.num_scalar_variables
+        size['constraints'] = metrics.num_scalar_eq_constr + metrics.num_scalar_leq_constr
+    if solver is not None:
+        data = problem.get_problem_data(solver)
+        if isinstance(data, tuple):
+            data = data[0]
+        size['nonzeros'] = int(sum([data[k].nnz for k in ['A', 'G'] if k in data and hasattr(data[k], 'nnz')]))
+    return(size)
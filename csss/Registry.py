@@ -0,0 +1,170 @@
+import hashlib
+import numpy as np
+
+## Compact storage of the source models of a CSSS problem.
+#
+# Source models stay dicts (see CSSS.addSource), but their bulky numeric data is
+# held by one registry per problem:
+#   - regressors with identical content are stored once and shared by reference,
+#     e.g. the solar regressors of every home in SolarDisagg_IndvHome,
+#   - alphas that vary in time are rows of one (sources x N) array; a constant
+#     alpha is stored as a scalar and the model holds a read-only length N view
+#     of it, without memory per sample, and
+#   - solutions are written into one preallocated (sources x N) buffer.
+# Arrays grow by doubling as sources are added, so adding M sources is O(M N).
+
+class ModelRegistry:
+
+    def __init__(self, N, capacity = 4):
+        self.N          = N
+        self.index      = {}  # Row of each source name
+        self.models     = []  # Source models, in row order
+        self.regressors = {}  # Distinct regressors, by content hash
+        self.alphas     = np.zeros((0, N))  # Alphas that vary in time
+        self.alphaRows  = {}  # Row of self.alphas of each source with such an alpha
+        self.scalars    = {}  # Constant alpha of the other sources
+        self.solution   = np.zeros((capacity, N))
+
+    def __len__(self):
+        return(len(self.models))
+
+    def __setstate__(self, state):
+        ## Bind the alphas of the models to the restored arrays. Models unpickled
+        # before the registry was complete could not bind them themselves.
+        self.__dict__.update(state)
+        for i, model in enumerate(self.models):
+            dict.__setitem__(model, 'alpha', self.alpha(i))
+
+    def add(self, model):
+        ## Register a source model, replacing any source with the same name
+        name = model['name']
+        if name in self.index:
+            i = self.index[name]
+            self.models[i] = model
+        else:
+            i = len(self.models)
+            if i == self.solution.shape[0]:
+                self.reserve(2 * i)
+            self.index[name] = i
+            self.models.append(model)
+        self.solution[i] = np.nan
+        model.attach(self, i)
+        return(i)
+
+    def reserve(self, capacity):
+        ## Size the solution buffer for capacity sources, e.g. when their number is
+        # known in advance, so that adding them does not reallocate it
+        if capacity > self.solution.shape[0]:
+            solution = np.zeros((capacity, self.N))
+            solution[:len(self.models)] = self.solution[:len(self.models)]
+            self.solution = solution
+
+    def _growAlphas(self, capacity):
+        ## Reallocate the alpha array and re-point the alpha rows held by each model
+        alphas = np.zeros((capacity, self.N))
+        alphas[:len(self.alphaRows)] = self.alphas[:len(self.alphaRows)]
+        self.alphas = alphas
+        for i, j in self.alphaRows.items():
+            dict.__setitem__(self.models[i], 'alpha', self.alphas[j])
+
+    def shareRegressor(self, regressor):
+        ## Return a stored regressor with the same content, or store this one
+        regressor = np.asarray(regressor)
+        h = hashlib.sha1()
+        h.update(str(regressor.dtype).encode())
+        h.update(repr(regressor.shape).encode())
+        h.update(np.ascontiguousarray(regressor).data)
+        key = h.hexdigest()
+        if key not in self.regressors:
+            self.regressors[key] = np.array(regressor)
+        return(self.regressors[key])
+
+    def setAlpha(self, i, alpha):
+        ## Store a scalar or length N alpha of source i, returns the array the model holds
+        alpha = np.array(alpha, dtype = float)
+        if alpha.size not in [1, self.N]:
+            raise ValueError('Alpha must be a scalar or a vector of length N = %d' % self.N)
+        alpha = np.ravel(alpha)
+        if alpha.size == 1 or np.all(alpha == alpha[0]):
+            self.scalars[i] = float(alpha[0])
+            return(self.alpha(i))
+        self.scalars.pop(i, None)
+        if i not in self.alphaRows:
+            if len(self.alphaRows) == self.alphas.shape[0]:
+                self._growAlphas(max(4, 2 * len(self.alphaRows)))
+            self.alphaRows[i] = len(self.alphaRows)
+        self.alphas[self.alphaRows[i]] = alpha
+        return(self.alpha(i))
+
+    def alpha(self, i):
+        ## Alpha of source i as a length N array: its row, or a read-only view of a constant
+        if i in self.alphaRows:
+            return(self.alphas[self.alphaRows[i]])
+        return(np.broadcast_to(self.scalars.get(i, 1.0), (self.N,)))
+
+    def setSolution(self, i, source):
+        self.solution[i] = np.ravel(source)
+
+    def sources(self):
+        ## View of the solution buffer, one row per source in order of addition
+        return(self.solution[:len(self.models)])
+
+    def nbytes(self):
+        ## Memory held by the registry arrays and the distinct regressors
+        return(int(self.alphas.nbytes + self.solution.nbytes +
+                   np.sum([r.nbytes for r in self.regressors.values()])))
+
+## Hyperparameters of a source model whose assignment is tracked
+HYPERPARAMETERS = set(['alpha', 'beta', 'gamma', 'lb', 'ub', 'theta', 'regressor',
+                       'costFunction', 'regularizeTheta', 'regularizeSource'])
+
+class SourceModel(dict):
+    ## Dict of a source model whose alpha is held by the registry, see
+    # ModelRegistry.setAlpha. Assigning model['alpha'] stores the value there.
+    # Assignments of hyperparameters are tracked in `changed`, so that CSSS only
+    # updates the affected terms of the objective; `stale` marks an objective to update.
+    __slots__ = ('registry', 'row', 'changed', 'stale')
+
+    def __init__(self, *args, **kwargs):
+        self.registry = None
+        self.changed  = set()
+        self.stale    = False
+        dict.__init__(self, *args, **kwargs)
+
+    def attach(self, registry, row):
+        self.registry = registry
+        self.row      = row
+        self['alpha'] = dict.get(self, 'alpha', 1)
+
+    def __reduce__(self):
+        ## Pickle the slots with the items, so they are restored first and alpha is
+        # bound to the registry again rather than restored as a copy
+        items = dict(self)
+        if self.registry is not None:
+            items.pop('alpha', None)
+        return(SourceModel, (), (self.registry, getattr(self, 'row', None), self.changed, self.stale, items))
+
+    def __setstate__(self, state):
+        registry, row, changed, stale, items = state
+        self.registry = registry
+        self.row      = row
+        self.changed  = set()
+        self.stale    = stale
+        for key, value in items.items():
+            dict.__setitem__(self, key, value)
+        if registry is not None and 'alphaRows' in registry.__dict__:
+            dict.__setitem__(self, 'alpha', registry.alpha(row))
+        self.changed  = changed
+
+    def __setitem__(self, key, value):
+        if key == 'alpha' and getattr(self, 'registry', None) is not None:
+            value = self.registry.setAlpha(self.row, value)
+        if key in HYPERPARAMETERS and getattr(self, 'changed', None) is not None:
+            self.changed.add(key)
+        dict.__setitem__(self, key, value)
+
+def boundArrays(model, N):
+    ## Lower and upper bounds of a source as length N arrays, infinite if absent
+    lb = -np.inf * np.ones(N) if model['lb'] is None else np.array(np.broadcast_to(np.ravel(np.array(model['lb'], dtype = float)), (N,)))
+    ub =  np.inf * np.ones(N) if model['ub'] is None else np.array(np.broadcast_to(np.ravel(np.array(model['ub'], dtype = float)), (N,)))
+    return(lb, ub)
@@ -0,0 +1,115 @@
+import numpy as np
+from csss.Registry import boundArrays
+
+## Native solver for CSSS problems with fixed thetas that separate across time.
+#
+# After fixThetas, the model estimate b_i = X_i theta_i of each source is a constant.
+# When every source also uses the 'sse' cost without source regularization, and
+# there are no custom constraints, constructSolve reduces to one small problem per
+# timestep t:
+#
+#   min  sum_i alpha_i[t] (s_i[t] - b_i[t])^2
+#   s.t. sum_i s_i[t] = y[t],  lb_i[t] <= s_i[t] <= ub_i[t]
+#
+# Its solution is s_i = clip(b_i + lambda / alpha_i, lb_i, ub_i) for the multiplier
+# lambda at which the sources add up to y, found by water-filling: bisection on
+# lambda for all timesteps at once, then an exact solve on the final active set.
+# This is the realtime problem of SolarDisagg_IndvHome_Realtime.
+
+BISECTION_STEPS = 64
+
+def isSeparable(csssobj):
+    ## Check whether a CSSS problem can be solved by solveSeparable.
+    if len(csssobj.constraints) > 0 or len(csssobj.models) == 0:
+        return(False)
+    for name, model in csssobj.models.items():
+        if 'group' in model or not isinstance(model['theta'], np.ndarray):
+            return(False)
+        if model['costFunction'].lower() != 'sse' or model['regularizeSource'] is not None:
+            return(False)
+        if callable(model['regularizeTheta']) or str(model['regularizeTheta']).lower() not in ['none', 'ss']:
+            return(False)
+        if np.any(np.array(model['alpha']) <= 0):
+            return(False)
+    return(True)
+
+def baselines(csssobj, names):
+    ## Model estimates X_i theta_i of the sources as an (M x N) array, with one
+    # matrix product per distinct regressor, e.g. one for all solar sources
+    B = np.empty((len(names), csssobj.N))
+    shared = {}
+    for i, name in enumerate(names):
+        regressor = csssobj.models[name]['regressor']
+        shared.setdefault(id(regressor), (regressor, []))[1].append(i)
+    for regressor, rows in shared.values():
+        thetas  = np.column_stack([np.ravel(csssobj.models[names[i]]['theta']) for i in rows])
+        B[rows] = np.dot(np.asarray(regressor, dtype = float), thetas).T
+    return(B)
+
+def waterFill(b, alpha, lb, ub, y):
+    ## Solve min sum_i alpha_i (s_i - b_i)^2 s.t. sum_i s_i = y, lb <= s <= ub for
+    # each column of the (M x N) arrays b, alpha, lb and ub. Returns the (M x N)
+    # sources, or None if the bounds cannot add up to y at some timestep.
+    y = np.ravel(y)
+    if np.any(np.sum(lb, axis = 0) > y) or np.any(np.sum(ub, axis = 0) < y):
+        return(None)
+    c = 1.0 / alpha
+    g = lambda lam: np.sum(np.clip(b + c * lam, lb, ub), axis = 0)
+
+    ## Bracket lambda, doubling until the sources add up to less / more than y
+    lo = -np.ones(len(y))
+    hi =  np.ones(len(y))
+    for i in range(1100):
+        low  = g(lo) > y
+        high = g(hi) < y
+        if not (np.any(low) or np.any(high)):
+            break
+        lo[low]  *= 2
+        hi[high] *= 2
+
+    ## Bisection
+    for i in range(BISECTION_STEPS):
+        mid   = (lo + hi) / 2
+        below = g(mid) < y
+        lo = np.where(below, mid, lo)
+        hi = np.where(below, hi, mid)
+    lam = (lo + hi) / 2
+
+    ## Exact multiplier for the active set at lambda
+    s       = b + c * lam
+    atLower = s <= lb
+    atUpper = s >= ub
+    free    = ~(atLower | atUpper)
+    fixed   = np.sum(np.where(atLower, lb, 0), axis = 0) + np.sum(np.where(atUpper, ub, 0), axis = 0)
+    cFree   = np.sum(np.where(free, c, 0), axis = 0)
+    bFree   = np.sum(np.where(free, b, 0), axis = 0)
+    exact   = cFree > 0
+    lam[exact] = (y[exact] - fixed[exact] - bFree[exact]) / cFree[exact]
+    return(np.clip(b + c * lam, lb, ub))
+
+def solveSeparable(csssobj, **solverArgs):
+    ## Solve a separable CSSS problem and store the solution in the models.
+    # Returns the objective value, or None if the problem is infeasible. Solver
+    # arguments of the cvxpy backend are ignored.
+    names = list(csssobj.models.keys())
+    N     = csssobj.N
+    b     = baselines(csssobj, names)
+    alpha = np.empty((len(names), N))
+    lb    = np.empty((len(names), N))
+    ub    = np.empty((len(names), N))
+    for i, name in enumerate(names):
+        alpha[i] = np.broadcast_to(np.ravel(np.array(csssobj.models[name]['alpha'], dtype = float)), (N,))
+        lb[i], ub[i] = boundArrays(csssobj.models[name], N)
+
+    sources = waterFill(b, alpha, lb, ub, csssobj.aggregateSignal)
+    if sources is None:
+        return(None)
+
+    obj = np.sum(alpha * (sources - b) ** 2)
+    for name in names:
+        model = csssobj.models[name]
+        if model['regularizeTheta'] is not None:
+            ## Constant theta regularization, as in the least squares objective
+            obj = obj + np.sum(np.ravel(model['beta']) * np.ravel(model['theta']) ** 2)
+    csssobj._storeSolutions(dict(zip(names, sources)), {})
+    return(obj)
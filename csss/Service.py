@@ -0,0 +1,280 @@
+import os
+import json
+import time
+import asyncio
+import functools
+import collections
+import concurrent.futures
+import numpy as np
+
+## Asyncio service for realtime disaggregation of many feeders.
+#
+# Producers put messages of new samples on a bounded queue: an in-process producer
+# with submit, a JSON lines file being appended to (tailFile), a socket (serveSocket),
+# or the local stand-in producer replay. Each message holds the new aggregate net
+# load of one feeder and the matching rows of its regressors.
+#
+# The service collects the messages that arrive within batchWindow seconds of each
+# other into a micro-batch, merges the messages of each feeder, and pushes them to
+# the feeder's SolarDisagg_IndvHome_Realtime model with one solve, instead of one
+# solve per reading. Solves run in a bounded executor pool (threads by default, as
+# the models live in the service), at most `workers` at a time and one at a time per
+# feeder, in arrival order. While all workers are busy the service stops taking
+# messages off the queue, and once the queue is full producers wait on it
+# (backpressure). Results, the disaggregated new samples of every source, are
+# published to a callback or to the results queue. stats() reports the queue depth
+# and the percentiles of the end-to-end latency from a message's time to its result.
+
+def message(feeder, aggregate, solar, load, tuning = None, sent = None):
+    ## Message of new samples of a feeder: the aggregate net load, and one row of the
+    # solar, load and (optional) tuning regressors per sample. sent is the time the
+    # samples were produced, from which latency is measured (default now).
+    return({'feeder': feeder,
+            'aggregate': np.atleast_1d(np.ravel(np.array(aggregate, dtype = float))),
+            'solar': np.atleast_2d(np.array(solar, dtype = float)),
+            'load': np.atleast_2d(np.array(load, dtype = float)),
+            'tuning': None if tuning is None else np.atleast_2d(np.array(tuning, dtype = float)),
+            'sent': time.time() if sent is None else float(sent)})
+
+def decode(line):
+    ## Message from a JSON line with the fields of message
+    return(message(**json.loads(line)))
+
+def encode(result):
+    ## JSON line of a result
+    result = dict(result)
+    if result['sources'] is not None:
+        result['sources'] = dict([(name, np.ravel(value).tolist()) for name, value in result['sources'].items()])
+    return(json.dumps(result))
+
+def merge(messages):
+    ## Samples of a feeder's messages, in arrival order, as one batch
+    tuning = [m['tuning'] for m in messages]
+    if all([t is None for t in tuning]):
+        tuning = None
+    elif any([t is None for t in tuning]):
+        raise ValueError('Tuning regressors are given for some samples of a batch only')
+    else:
+        tuning = np.vstack(tuning)
+    return({'aggregate': np.concatenate([m['aggregate'] for m in messages]),
+            'solar': np.vstack([m['solar'] for m in messages]),
+            'load': np.vstack([m['load'] for m in messages]),
+            'tuning': tuning})
+
+def pushBatch(model, batch, tune = True, solverArgs = None):
+    ## Push a batch to a realtime model, at most N samples per solve, and return the
+    # new samples of each source
+    n   = len(batch['aggregate'])
+    out = []
+    for start in range(0, n, model.N):
+        stop   = min(start + model.N, n)
+        tuning = None if batch['tuning'] is None else batch['tuning'][start:stop]
+        out.append(model.push(batch['aggregate'][start:stop], batch['solar'][start:stop],
+                              batch['load'][start:stop], tuning, tune = tune, **dict(solverArgs or {})))
+    return(dict([(name, np.concatenate([o[name] for o in out])) for name in out[0].keys()]))
+
+class RealtimeService:
+    def __init__(self, models, workers = None, executor = None, batchWindow = 0.05, maxBatch = 1000,
+                 maxQueue = 10000, publish = None, tune = True, latencyWindow = 10000, **solverArgs):
+        ## Inputs
+        # models:        {feeder: SolarDisagg_IndvHome_Realtime}
+        # workers:       solves in flight at a time, default one per cpu
+        # executor:      concurrent.futures executor to solve in, default a thread pool of workers
+        # batchWindow:   seconds to collect messages into a micro-batch after the first arrives
+        # maxBatch:      most messages in a micro-batch
+        # maxQueue:      size of the message queue, producers wait when it is full
+        # publish:       publish(result) function or coroutine, default the results queue
+        # tune:          retune alphas on each push
+        # latencyWindow: number of latest latencies the percentiles are computed over
+        # solverArgs:    arguments of push / constructSolve
+        self.models        = models
+        self.workers       = workers or os.cpu_count() or 1
+        self.executor      = executor
+        self.ownExecutor   = executor is None
+        self.batchWindow   = batchWindow
+        self.maxBatch      = maxBatch
+        self.maxQueue      = maxQueue
+        self.publish       = publish
+        self.tune          = tune
+        self.solverArgs    = solverArgs
+        self.latencies     = collections.deque(maxlen = latencyWindow)
+        self.counts        = {'received': 0, 'published': 0, 'batches': 0, 'solves': 0, 'errors': 0}
+        self.queue         = None
+        self.results       = None
+        self.batcher       = None
+        self.pending       = set()
+
+    async def start(self):
+        ## Start taking messages off the queue. Queues are created here, in the running loop.
+        self.queue   = asyncio.Queue(maxsize = self.maxQueue)
+        self.results = asyncio.Queue()
+        self.slots   = asyncio.Semaphore(self.workers)
+        self.locks   = dict([(feeder, asyncio.Lock()) for feeder in self.models.keys()])
+        if self.executor is None:
+            self.executor = concurrent.futures.ThreadPoolExecutor(max_workers = self.workers)
+        self.batcher = asyncio.ensure_future(self._batchLoop())
+        return(self)
+
+    async def stop(self):
+        ## Finish the messages on the queue, then stop
+        await self.queue.join()
+        self.batcher.cancel()
+        try:
+            await self.batcher
+        except asyncio.CancelledError:
+            pass
+        if self.pending:
+            await asyncio.gather(*list(self.pending))
+        if self.ownExecutor:
+            self.executor.shutdown()
+            self.executor = None
+
+    async def __aenter__(self):
+        return(await self.start())
+
+    async def __aexit__(self, *args):
+        await self.stop()
+
+    async def submit(self, feeder, aggregate, solar, load, tuning = None, sent = None):
+        ## Put new samples of a feeder on the queue, waiting while it is full
+        await self.put(message(feeder, aggregate, solar, load, tuning, sent))
+
+    async def put(self, msg):
+        ## Put a message on the queue, waiting while it is full
+        await self.queue.put(msg)
+        self.counts['received'] += 1
+
+    def stats(self):
+        ## Counts of messages, batches, solves and errors, the queue depth, solves in
+        # flight, and the 50th, 90th and 99th percentiles of the latency in seconds
+        out = dict(self.counts)
+        out['queueDepth'] = 0 if self.queue is None else self.queue.qsize()
+        out['inFlight']   = len(self.pending)
+        latencies = np.array(self.latencies)
+        for q in [50, 90, 99]:
+            out['latencyP%d' % q] = float(np.percentile(latencies, q)) if len(latencies) > 0 else None
+        return(out)
+
+    async def _batchLoop(self):
+        while True:
+            messages = [await self.queue.get()]
+            if self.batchWindow > 0:
+                await asyncio.sleep(self.batchWindow)
+            while len(messages) < self.maxBatch and not self.queue.empty():
+                messages.append(self.queue.get_nowait())
+            self.counts['batches'] += 1
+
+            ## Merge the messages of each feeder, keeping their order
+            feeders = collections.OrderedDict()
+            for msg in messages:
+                feeders.setdefault(msg['feeder'], []).append(msg)
+            for feeder, msgs in feeders.items():
+                ## Wait for a free worker, so a full pool holds messages on the queue
+                await self.slots.acquire()
+                task = asyncio.ensure_future(self._solve(feeder, msgs))
+                self.pending.add(task)
+                task.add_done_callback(self.pending.discard)
+
+    async def _solve(self, feeder, messages):
+        ## Push the messages of a feeder to its model and publish the result
+        try:
+            t0 = time.time()
+            sources, error = None, None
+            if feeder not in self.models:
+                error = 'Unknown feeder %s' % feeder
+            else:
+                async with self.locks[feeder]:
+                    t0 = time.time()
+                    try:
+                        batch   = merge(messages)
+                        sources = await asyncio.get_event_loop().run_in_executor(
+                            self.executor, functools.partial(pushBatch, self.models[feeder], batch, self.tune, self.solverArgs))
+                    except Exception as e:
+                        error = repr(e)
+                    self.counts['solves'] += 1
+            if error is not None:
+                self.counts['errors'] += 1
+
+            done   = time.time()
+            result = {'feeder': feeder, 'messages': len(messages), 'sources': sources, 'error': error,
+                      'solveSeconds': done - t0, 'time': done}
+            ## A failing publish callback is counted as an error, as nothing awaits this task
+            try:
+                if self.publish is None:
+                    await self.results.put(result)
+                else:
+                    published = self.publish(result)
+                    if asyncio.iscoroutine(published):
+                        await published
+            except Exception:
+                self.counts['errors'] += 1
+                return
+            self.counts['published'] += 1
+            done = time.time()
+            self.latencies.extend([done - msg['sent'] for msg in messages])
+        finally:
+            self.slots.release()
+            for msg in messages:
+                self.queue.task_done()
+
+async def replay(service, feeds, rows = 1, interval = 0.0):
+    ## Local stand-in producer: submit the samples of each feeder, rows at a time and
+    # round robin over the feeders, every interval seconds.
+    # feeds: {feeder: (aggregate, solar, load)} or (aggregate, solar, load, tuning),
+    #        arrays with one row per sample
+    feeds = dict([(feeder, tuple(arrays) + (None,) * (4 - len(arrays))) for feeder, arrays in feeds.items()])
+    n = max([len(arrays[0]) for arrays in feeds.values()])
+    for start in range(0, n, rows):
+        for feeder, (aggregate, solar, load, tuning) in feeds.items():
+            if start < len(aggregate):
+                await service.submit(feeder, aggregate[start:start + rows], solar[start:start + rows],
+                                     load[start:start + rows], None if tuning is None else tuning[start:start + rows])
+        if interval > 0:
+            await asyncio.sleep(interval)
+
+async def putLine(service, line):
+    ## Put the message of a JSON line on the queue. Lines that cannot be decoded are
+    # counted in the service's errors and skipped, so one bad line does not stop
+    # the producer.
+    try:
+        msg = decode(line)
+    except Exception:
+        service.counts['errors'] += 1
+        return
+    await service.put(msg)
+
+async def tailFile(service, path, poll = 0.1, follow = True):
+    ## Submit the messages of a JSON lines file (see decode), waiting for new lines
+    # to be appended while follow is True, until cancelled
+    with open(path) as f:
+        partial = ''
+        while True:
+            line = f.readline()
+            if line == '':
+                if not follow:
+                    break
+                await asyncio.sleep(poll)
+                continue
+            partial += line
+            if not partial.endswith('\n'):
+                continue
+            if partial.strip():
+                await putLine(service, partial)
+            partial = ''
+
+async def serveSocket(service, host = '127.0.0.1', port = 0):
+    ## Serve a socket taking JSON lines messages (see decode), returns the asyncio
+    # server; port 0 picks a free port (server.sockets[0].getsockname())
+    async def handle(reader, writer):
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                if line.strip():
+                    await putLine(service, line.decode(errors = 'replace'))
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+    return(await asyncio.start_server(handle, host, port))
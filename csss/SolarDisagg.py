@@ -1,18 +1,36 @@
 import csss as CSSS
+from csss import Profiling
+from csss import Backends
+from csss.Registry import boundArrays
 import numpy as np
 import pandas as pd
-from sklearn.linear_model import LinearRegression as LR
+
+def LR():
+    ## sklearn LinearRegression, imported on first use so that loading a realtime
+    # solver (see csss.Storage) does not import sklearn
+    from sklearn.linear_model import LinearRegression
+    return(LinearRegression())
 
 class SolarDisagg_IndvHome(CSSS.CSSS):
-    def __init__(self, netloads, solarregressors, loadregressors, tuningregressors = None, names = None):
+    def __init__(self, netloads, solarregressors, loadregressors, tuningregressors = None, names = None, parameterize = False, stacked = False):
         ## Inputs
         # netloads:         np.array of net loads at each home, with columns corresponding to entries of "names" if available.
         # solarregressors:  np.array of solar regressors (N_s X T)
         # loadregressors:   np.array of load regressors (N_l x T)
+        # parameterize:     compile the problem once and rebind alphas on each re-solve
+        # stacked:          represent the solar of all homes as one source group (N x M variable)
+        # Arrays can also be memory-mapped or HDF5 inputs, or paths to them (see csss.Inputs).
+        # The net loads of each home are column views of a memory-mapped array; HDF5
+        # inputs are read into memory.
+        from csss import Inputs
+        netloads         = Inputs.loadArray(netloads)
+        solarregressors  = Inputs.loadArray(solarregressors)
+        loadregressors   = Inputs.loadArray(loadregressors)
+        tuningregressors = Inputs.loadArray(tuningregressors)
 
         ## Find aggregate net load, and initialize problem.
         agg_net_load = np.sum(netloads, axis = 1)
-        CSSS.CSSS.__init__(self, agg_net_load)
+        CSSS.CSSS.__init__(self, agg_net_load, parameterize)
 
         ## If no names are input, create names based on id in vector.
         self.N, self.M = netloads.shape
@@ -37,17 +55,23 @@ class SolarDisagg_IndvHome(CSSS.CSSS):
         self.tuningRegressors  = tuningregressors
         self.trueValues      = {}
 
-        ## Cycle through each net load, and create sources.
-        for source_name in self.names:
-            self.addSource(regressor=solarregressors, name = source_name, alpha = 1)
-
-            ## Add constraints that solar generation cannot exceed zero or net load.
-            self.addConstraint( self.models[source_name]['source'] <= np.array(self.netloads[source_name]) )
-            self.addConstraint( self.models[source_name]['source'] <= 0 )
+        ## Cycle through each net load, and create sources. The solution buffer is
+        # sized for all sources up front. The upper bounds are new (N x M) arrays in
+        # total, computed without a further copy of the net loads, and the registry
+        # keeps one in-memory copy of each distinct regressor.
+        self.registry.reserve(self.M + 1)
+        if stacked:
+            ## Solar generation cannot exceed zero or net load, as one matrix bound.
+            self.addSourceGroup(solarregressors, self.names, groupName = 'solar', alpha = 1,
+                                ub = np.minimum(netloads, 0))
+        else:
+            for source_name in self.names:
+                ## Solar generation cannot exceed zero or net load, as an upper bound.
+                self.addSource(regressor=solarregressors, name = source_name, alpha = 1,
+                               ub = np.minimum(self.netloads[source_name], 0))
 
-        ## Add the aggregate load source
-        self.addSource(regressor=loadregressors, name = 'AggregateLoad', alpha = 1)
-        self.addConstraint( self.models['AggregateLoad']['source'] > 0 )
+        ## Add the aggregate load source, load cannot be negative.
+        self.addSource(regressor=loadregressors, name = 'AggregateLoad', alpha = 1, lb = 0)
 
     def Solar_var_norm(self):
         return(None)
@@ -73,51 +97,22 @@ class SolarDisagg_IndvHome(CSSS.CSSS):
         return(None)
 
 
-    def calcPerformanceMetrics(self, dropzeros = False):
+    @Profiling.timed('calcPerformanceMetrics')
+    def calcPerformanceMetrics(self, dropzeros = False, window = None, step = None):
         ## Function to calculate performance metrics
         # Dropping zeros is intended to remove nightime solar.
-
-        df = pd.DataFrame()
-        df['models'] = self.models.keys()
-        df['rmse']   = np.zeros(df.shape[0]) * np.nan
-        df['cv']     = np.zeros(df.shape[0]) * np.nan
-        df['mae']    = np.zeros(df.shape[0]) * np.nan
-        df['pmae']   = np.zeros(df.shape[0]) * np.nan
-        df['mbe']    = np.zeros(df.shape[0]) * np.nan
-        df['mean']   = np.zeros(df.shape[0]) * np.nan
-
-        df['cv_pos']     = np.zeros(df.shape[0]) * np.nan
-        df['rmse_pos']   = np.zeros(df.shape[0]) * np.nan
-        df['mae_pos']    = np.zeros(df.shape[0]) * np.nan
-        df['pmae_pos']   = np.zeros(df.shape[0]) * np.nan
-        df['mbe_pos']    = np.zeros(df.shape[0]) * np.nan
-        df['mean_pos']   = np.zeros(df.shape[0]) * np.nan
-        df               = df.set_index('models')
-
-        for name in self.trueValues.keys():
-            truth   = self.trueValues[name]
-            est     = np.array(self.models[name]['source'].value).squeeze()
-
-            ## Calculate metrics.
-            df.loc[name,'mbe']  = np.mean((truth-est))
-            df.loc[name,'mean'] = np.mean((truth))
-            df.loc[name,'rmse'] = np.sqrt(np.mean((truth-est)**2))
-            df.loc[name,'mae']  = np.mean(np.abs((truth-est)))
-            if not (df.loc[name,'mean'] == 0):
-                df.loc[name,'cv']   = df.loc[name,'rmse'] / np.mean(truth)
-                df.loc[name,'pmae'] = df.loc[name,'mae']  / np.mean(truth)
-
-                ## Find metrics for  positive indices only
-                posinds = np.abs(truth) > (0.05 * np.abs(np.mean(truth)))
-                truth = truth[posinds]
-                est   = est[posinds]
-                df.loc[name,'rmse_pos'] = np.sqrt(np.mean((truth-est)**2))
-                df.loc[name,'mae_pos']  = np.mean(np.abs((truth-est)))
-                df.loc[name,'cv_pos']   = df.loc[name,'rmse_pos'] / np.mean(truth)
-                df.loc[name,'pmae_pos'] = df.loc[name,'mae_pos']  / np.mean(truth)
-                df.loc[name,'mbe_pos']  = np.mean((truth-est))
-                df.loc[name,'mean_pos'] = np.mean((truth))
-
+        # With a window length in samples, metrics are computed for every window of
+        # the signals, starting every step samples (default window), and indexed by
+        # ('window', 'models'). See csss.Metrics.
+        names = list(self.trueValues.keys())
+        truth = np.array([np.ravel(self.trueValues[name]) for name in names]).reshape(len(names), self.N)
+        est   = np.array([np.ravel(np.array(self.models[name]['source'].value)) for name in names]).reshape(len(names), self.N)
+
+        from csss import Metrics
+        if window is None:
+            df = Metrics.metricsTable(truth, est, names).reindex(pd.Index(list(self.models.keys()), name = 'models'))
+        else:
+            df = Metrics.windowMetrics(truth, est, names, window, step)
         self.performanceMetrics = df
 
         return(None)
@@ -133,7 +128,7 @@ class SolarDisagg_IndvHome(CSSS.CSSS):
 
 
         ## For each system used for tuning, filter the square residuals.
-        filt_sq_resid_norm = np.ones((self.N,len(tuneSys)))
+        sq_resid_norm = np.ones((len(tuneSys),self.N))
         i=0
         for name in tuneSys:
             truth      = self.trueValues[name].squeeze()
@@ -153,8 +148,9 @@ class SolarDisagg_IndvHome(CSSS.CSSS):
             #sq_resid_demean   = ( resid - filt_resid ) ** 2
             sq_resid = resid_norm ** 2
 
-            filt_sq_resid_norm[:,i] = convolve_cyc( sq_resid , filter_vec )
+            sq_resid_norm[i,:] = sq_resid
             i=i+1
+        filt_sq_resid_norm = convolve_cyc( sq_resid_norm , filter_vec ).T   ## All systems in one call
 
         ## Average the filtered squared residuals
         ave_filt_sq_resid_norm = np.mean(filt_sq_resid_norm, axis = 1)
@@ -198,46 +194,80 @@ class SolarDisagg_IndvHome(CSSS.CSSS):
         self.updateSourceObj('all')
         return(None)
 
+    def save(self, path):
+        ## Save the fitted thetas, variance bounds and variance models to an .npz file,
+        # from which SolarDisagg_IndvHome_Realtime.load builds a realtime solver
+        from csss import Storage
+        Storage.saveFitted(self, path)
+
+    @Profiling.timed('hierarchicalSolve')
+    def hierarchicalSolve(self, groups = None, workers = None, executor = 'process', **solverArgs):
+        ## Solve in two levels instead of one problem over all homes: the solar of
+        # groups of homes and the aggregate load first, then the homes of each group
+        # in parallel, reconciled so the sources add up to the aggregate net load
+        # exactly. groups is a number of groups, a label per home (e.g. transformer)
+        # or lists of home indices, see csss/Hierarchical.py. Uses the alphas and
+        # bounds of the models with sse costs. Returns the objective value.
+        netloads = np.column_stack([np.ravel(self.netloads[name]) for name in self.names])
+        alpha    = np.column_stack([np.broadcast_to(np.ravel(np.array(self.models[name]['alpha'], dtype = float)), (self.N,))
+                                    for name in self.names])
+        ub       = np.column_stack([boundArrays(self.models[name], self.N)[1] for name in self.names])
+        from csss import Hierarchical
+        result   = Hierarchical.hierarchicalDisaggregate(netloads, self.solarRegressors, self.loadRegressors, groups,
+                                                         alpha, self.models['AggregateLoad']['alpha'], ub,
+                                                         workers, executor, **solverArgs)
+
+        sources = dict(zip(self.names, result['solar'].T))
+        thetas  = dict(zip(self.names, result['thetas']))
+        sources['AggregateLoad'] = result['load']
+        thetas['AggregateLoad']  = result['loadTheta']
+        self._storeSolutions(sources, thetas)
+        self.homeGroups = [[self.names[i] for i in homes] for homes in result['groups']]
+        return(result['objective'])
+
+    @Profiling.timed('fitTuneModels')
     def fitTuneModels(self, tuneSys = None, var_lb_fraction = 0.05, tuningRegressors = None):
-        firsttune = True
-
         if tuneSys is None:
             ## If no name for a tuning system is input, use all systems for which
             # a truth is known.
-            tuneSys = self.trueValues.keys()
-            if 'AggregateLoad' in tuneSys: tuneSys.remove('AggregateLoad')
+            tuneSys = [name for name in self.trueValues.keys() if name != 'AggregateLoad']
+        tuneSys = list(tuneSys)
 
         ## Allow user to place new tuning regressors here.
         if tuningRegressors is not None:
             self.tuningRegressors = tuningRegressors
 
-
-        ## Cycle through each tuning system and collect data for a model.
-        for name in tuneSys:
-            truth      = self.trueValues[name].squeeze()
-
-            ## Run a quick regression to collect expected value of
-            # the lienar model given the true solar signal.
-            model       = LR()
-            model.fit(X = self.models[name]['regressor'], y = truth)
-            modelest    = model.predict(X = self.models[name]['regressor'])
-
-            ## Create a rough capacity estimate from the theta values
-            capest_tune     = np.sum(model.coef_)
-            resid_norm = (truth - modelest) / capest_tune
-
-            if firsttune:
-                firsttune = False
-                sq_resid_norm = resid_norm ** 2
-                X = self.tuningRegressors
-            else:
-                sq_resid_norm  = np.concatenate([ sq_resid_norm , resid_norm ** 2] )
-                X = np.concatenate([ X, self.tuningRegressors])
-
-
-        # Build model to predict normalized variances
+        ## Fit the variance models on the normalized residuals of the tuning systems
+        self.fitSolarVariance(self.tuningResiduals(tuneSys))
+        self.fitAggregateVariance(var_lb_fraction)
+
+    def tuningResiduals(self, tuneSys):
+        ## Squared residuals of a quick regression of each true solar signal on its
+        # regressor, normalized by a rough capacity estimate, as an (N x len(tuneSys))
+        # array. Systems sharing a regressor (all homes, normally) are solved together
+        # with one factorization.
+        sq_resid_norm = np.empty((self.N, len(tuneSys)))
+        with Profiling.phase(self, 'varianceFit'):
+            for regressor, cols in _sharedRegressors(self.models, tuneSys):
+                truth = np.column_stack([np.ravel(self.trueValues[tuneSys[i]]) for i in cols])
+                coef, modelest = linearFits(regressor, truth)
+
+                ## Create a rough capacity estimate from the theta values
+                capest_tune = np.sum(coef, axis = 0)
+                sq_resid_norm[:, cols] = ((truth - modelest) / capest_tune) ** 2
+        return(sq_resid_norm)
+
+    def fitSolarVariance(self, sq_resid_norm):
+        # Build model to predict normalized variances. All tuning systems share the
+        # tuning regressors, so the least squares fit to the stacked squared residuals
+        # of every system is the fit to their mean.
         self.Solar_var_norm = LR()
-        self.Solar_var_norm.fit(y = (sq_resid_norm), X = X)
+        with Profiling.phase(self, 'varianceFit'):
+            self.Solar_var_norm.fit(y = np.mean(sq_resid_norm, axis = 1), X = self.tuningRegressors)
+
+    def fitAggregateVariance(self, var_lb_fraction = 0.05):
+        ## Variance lower bounds of every source and the model of the aggregate
+        # variance, which do not depend on the tuning systems
 
         # Set lower bound for each PV system now
         for name, m in self.models.items():
@@ -252,14 +282,25 @@ class SolarDisagg_IndvHome(CSSS.CSSS):
         ## Build model to predict aggregate load
         model = LR()
         X = np.hstack([self.loadRegressors, self.solarRegressors])
-        model.fit(y = self.aggregateSignal, X = X)
-        lin_est = model.predict(X = X)
+        with Profiling.phase(self, 'varianceFit'):
+            model.fit(y = self.aggregateSignal, X = X)
+            lin_est = model.predict(X = X)
 
         ## Collect square residuals and predict them
         total_sq_resid = (self.aggregateSignal - lin_est)**2
         self.Total_NL_var   = LR()
-        self.Total_NL_var.fit(y = total_sq_resid, X = self.tuningRegressors)
-
+        with Profiling.phase(self, 'varianceFit'):
+            self.Total_NL_var.fit(y = total_sq_resid, X = self.tuningRegressors)
+
+    def crossValidate(self, tuneSys = None, var_lb_fraction = 0.05, workers = None, **solverArgs):
+        ## Leave-one-out cross-validation of the tuning systems: for each held out
+        # system, fit the variance models on the others, tune alphas, solve, and score
+        # the held out system. Thetas must be estimated first (constructSolve).
+        # Returns a DataFrame with one row per fold, see csss/Validation.py.
+        from csss import Validation
+        return(Validation.crossValidate(self, tuneSys, var_lb_fraction, workers, **solverArgs))
+
+    @Profiling.timed('tuneAlphas')
     def tuneAlphas(self):
         # Instantiate vectors for the total solar variance and total estiamted net load by the model.
         total_sol_var   = np.zeros(self.N) ## Instantiate vector for total variance of PV signals,
@@ -294,6 +335,7 @@ class SolarDisagg_IndvHome(CSSS.CSSS):
         self.updateSourceObj('all')
         #return(None)
 
+    @Profiling.timed('scaleAlphas')
     def scaleAlphas(self, scale_to = 1.0):
         ## Find the maximum value of alpha
         alpha_max = 0
@@ -312,15 +354,19 @@ class SolarDisagg_IndvHome(CSSS.CSSS):
         return(None)
 
 class SolarDisagg_IndvHome_Realtime(CSSS.CSSS):
-    def __init__(self, sdmod, aggregateNetLoad, solarregressors, loadregressors, tuningregressors = None):
+    def __init__(self, sdmod, aggregateNetLoad, solarregressors, loadregressors, tuningregressors = None, parameterize = False):
         ## Inputs
-        # netloads:         np.array of net loads at each home, with columns corresponding to entries of "names" if available.
+        # sdmod:            fitted SolarDisagg_IndvHome, or a csss.Storage.FittedModel (see load)
+        # aggregateNetLoad: np.array of the aggregate net load
         # solarregressors:  np.array of solar regressors (N_s X T)
         # loadregressors:   np.array of load regressors (N_l x T)
-        CSSS.CSSS.__init__(self, aggregateNetLoad)
+        # parameterize:     compile the problem once and rebind alphas on each re-solve
+        CSSS.CSSS.__init__(self, aggregateNetLoad, parameterize)
+        from csss import Storage
+        fitted = Storage.fittedModel(sdmod)
 
         self.N = len(aggregateNetLoad)
-        self.M = sdmod.M
+        self.M = fitted.M
 
         ## If no tuning regressors are input, use an intercept only
         if tuningregressors is None:
@@ -333,34 +379,127 @@ class SolarDisagg_IndvHome_Realtime(CSSS.CSSS):
         self.trueValues        = {}
 
         ## Can I inherit methods?
-        self.Solar_var_norm = sdmod.Solar_var_norm
-        self.Total_NL_var   = sdmod.Total_NL_var
+        self.Solar_var_norm = fitted.Solar_var_norm
+        self.Total_NL_var   = fitted.Total_NL_var
 
         ## Inherit properties from the fitted class
-        self.names = sdmod.names
+        self.names = fitted.names
 
-        ## Cycle through each net load, and create sources.
-        for source_name in sdmod.names:
-            self.addSource(regressor=solarregressors, name = source_name, alpha = 1)
-            self.models[source_name]['theta'].value = sdmod.models[source_name]['theta'].value
+        ## Cycle through each net load, and create sources with the fitted hyperparameters
+        # (alpha, beta, gamma, cost function and regularizers, see csss.Storage).
+        for source_name in fitted.names:
+            ## Solar generation cannot exceed zero, as an upper bound.
+            args = dict({'alpha': 1}, **fitted.sourceArgs(source_name, self.N))
+            self.addSource(regressor=solarregressors, name = source_name, ub = 0, **args)
 
             ## Assign Capacity estimates and cutoffs for tuning
-            self.models[source_name]['var_lb']  = sdmod.models[source_name]['var_lb']
-
-            ## Add constraints that solar generation cannot exceed zero or net load.
-            self.addConstraint( self.models[source_name]['source'] <= 0 )
-
-        ## Add the aggregate load source
-        self.addSource(regressor=loadregressors, name = 'AggregateLoad', alpha = 1)
-        self.addConstraint( self.models['AggregateLoad']['source'] > 0 )
-        self.models['AggregateLoad']['theta'].value = sdmod.models['AggregateLoad']['theta'].value
-        self.models['AggregateLoad']['var_lb']  = sdmod.models['AggregateLoad']['var_lb']
-        ## FixThetas
-        self.fixThetas()
+            self.models[source_name]['var_lb']  = fitted.varLb[source_name]
+
+        ## Add the aggregate load source, load cannot be negative.
+        args = dict({'alpha': 1}, **fitted.sourceArgs('AggregateLoad', self.N))
+        self.addSource(regressor=loadregressors, name = 'AggregateLoad', lb = 0, **args)
+        self.models['AggregateLoad']['var_lb']  = fitted.varLb['AggregateLoad']
+
+        ## FixThetas to the fitted values, as (order x 1) arrays
+        for name, m in self.models.items():
+            m['theta'] = np.reshape(np.array(fitted.thetas[name], dtype = float), (-1, 1))
         self.updateSourceObj('all')
 
+        ## Streaming estimate of the variance of the aggregate residuals, see trackVariance
+        self.varianceFilter   = None
+        self.filteredVariance = None
+
         ## Copy all true trueValues
 
+    @classmethod
+    def load(cls, path, aggregateNetLoad, solarregressors, loadregressors, tuningregressors = None, parameterize = False):
+        ## Build a realtime solver from a fitted model saved with save / csss.Storage.saveFitted
+        from csss import Storage
+        return(cls(Storage.loadFitted(path), aggregateNetLoad, solarregressors, loadregressors,
+                   tuningregressors, parameterize))
+
+    @Profiling.timed('push')
+    def push(self, newAggregate, newSolarRegressors, newLoadRegressors, newTuningRegressors = None, tune = True, **solverArgs):
+        ## Streaming update of the realtime model.
+        # Appends new samples to the end of the window and drops as many of the oldest,
+        # so the window length N and the cost of each push stay fixed. Alphas are
+        # re-tuned on the new window if tune is True, the problem is re-solved, and
+        # the disaggregated new samples are returned as a dict of arrays per source.
+        # With the thetas fixed the problem usually separates in time, and constructSolve
+        # solves it directly (see csss/Separable.py). If it is solved with cvxpy instead,
+        # e.g. with diff1_ss source regularization or l1 costs, the model is switched to
+        # parameterized mode so the compiled problem is reused, and the solve is warm
+        # started from the previous solution shifted by the new samples.
+        newAggregate = np.ravel(np.array(newAggregate, dtype = float))
+        n = len(newAggregate)
+        if n > self.N:
+            raise ValueError('Cannot push more samples than the window length N = %d' % self.N)
+
+        ## Intercept-only tuning regressors are extended automatically
+        if newTuningRegressors is None:
+            if not np.all(self.tuningRegressors == 1):
+                raise ValueError('New tuning regressors are required')
+            newTuningRegressors = np.ones((n, np.shape(self.tuningRegressors)[1]))
+
+        self.aggregateSignal  = rollWindow(self.aggregateSignal, newAggregate)
+        self.solarRegressors  = rollWindow(self.solarRegressors, newSolarRegressors)
+        self.loadRegressors   = rollWindow(self.loadRegressors, newLoadRegressors)
+        self.tuningRegressors = rollWindow(self.tuningRegressors, newTuningRegressors)
+
+        ## Filter only the squared residuals of the new samples
+        if self.varianceFilter is not None:
+            new_var = self.varianceFilter.update(self._aggregateResidual()[-n:] ** 2)
+            self.filteredVariance = rollWindow(self.filteredVariance, new_var)
+
+        for name, m in self.models.items():
+            m['regressor'] = self.loadRegressors if name == 'AggregateLoad' else self.solarRegressors
+
+        if tune:
+            self.tuneAlphas()
+        else:
+            self.updateSourceObj('all')
+
+        backend = solverArgs.get('backend', 'auto')
+        if not solverArgs.get('native', True):
+            backend = 'cvxpy'
+        elif backend == 'auto':
+            backend = Backends.select(self)
+        if backend == 'cvxpy':
+            self.parameterizeProblem()
+            ## Shift the previous solution and extend it with the model estimate
+            # of the new samples as the starting point of the solve.
+            for name, m in self.models.items():
+                baseline = np.ravel(np.dot(m['regressor'], m['theta']))
+                if m['source'].value is None:
+                    m['source'].value = np.reshape(baseline, (self.N, 1))
+                else:
+                    previous = np.ravel(np.array(m['source'].value))
+                    m['source'].value = np.reshape(rollWindow(previous, baseline[-n:]), (self.N, 1))
+            if 'warmStart' not in solverArgs:
+                solverArgs['warmStart'] = True
+        self.constructSolve(**solverArgs)
+
+        return(dict([(name, np.ravel(np.array(m['source'].value))[-n:]) for name, m in self.models.items()]))
+
+    def _aggregateResidual(self):
+        ## Aggregate signal minus the model estimates of all sources, with the fixed thetas
+        est = np.dot(self.loadRegressors, np.ravel(self.models['AggregateLoad']['theta']))
+        for name in self.names:
+            est = est + np.dot(self.solarRegressors, np.ravel(self.models[name]['theta']))
+        return(np.ravel(self.aggregateSignal) - est)
+
+    def trackVariance(self, filter_vec = np.ones(12)/12.0):
+        ## Start tracking filteredVariance, the squared residuals of the aggregate
+        # signal filtered with filter_vec over the window. The current window is
+        # filtered once; push then filters only the new samples with a causal
+        # streaming filter (csss.Filters.StreamingFilter).
+        from csss import Filters
+        sq_resid = self._aggregateResidual() ** 2
+        self.varianceFilter   = Filters.StreamingFilter(filter_vec)
+        self.filteredVariance = self.varianceFilter.update(sq_resid)
+        return(self.filteredVariance)
+
+    @Profiling.timed('tuneAlphas')
     def tuneAlphas(self):
         # Instantiate vectors for the total solar variance and total estiamted net load by the model.
         total_sol_var   = np.zeros(self.N) ## Instantiate vector for total variance of PV signals,
@@ -383,9 +522,14 @@ class SolarDisagg_IndvHome_Realtime(CSSS.CSSS):
             alpha = sol_var ** -1         ## alpha
             self.models[name]['alpha'] = alpha
 
-        ## Tune load alphas.
+        ## Tune load alphas. The total variance is the filtered squared residuals of the
+        # aggregate signal while they are tracked (see trackVariance), as in tuneAlphas_v1,
+        # and the prediction of the fitted variance model otherwise.
         lb_var            = self.models['AggregateLoad']['var_lb'] ## LOWER BOUND OF VARIANCE, 1%
-        total_var_filt    = self.Total_NL_var.predict(X = self.tuningRegressors) ## Use linear model to predict total variace
+        if self.filteredVariance is not None:
+            total_var_filt = np.ravel(self.filteredVariance)                     ## Streaming variance estimate
+        else:
+            total_var_filt = self.Total_NL_var.predict(X = self.tuningRegressors) ## Use linear model to predict total variace
         load_var_est      = total_var_filt - total_sol_var                     ## Estimate of load variance
         load_var_est[load_var_est < lb_var] = lb_var                           ## Enforce lower bound on variance
         alpha = load_var_est ** -1
@@ -396,6 +540,7 @@ class SolarDisagg_IndvHome_Realtime(CSSS.CSSS):
         self.updateSourceObj('all')
         #return(None)
 
+    @Profiling.timed('scaleAlphas')
     def scaleAlphas(self, scale_to = 1.0):
         ## Find the maximum value of alpha
         alpha_max = 0
@@ -428,70 +573,61 @@ class SolarDisagg_IndvHome_Realtime(CSSS.CSSS):
         self.trueValues[name] = trueValue
         return(None)
 
-    def calcPerformanceMetrics(self, dropzeros = False):
+    @Profiling.timed('calcPerformanceMetrics')
+    def calcPerformanceMetrics(self, dropzeros = False, window = None, step = None):
         ## Function to calculate performance metrics
         # Dropping zeros is intended to remove nightime solar.
-
-        df = pd.DataFrame()
-        df['models'] = self.models.keys()
-        df['rmse']   = np.zeros(df.shape[0]) * np.nan
-        df['cv']     = np.zeros(df.shape[0]) * np.nan
-        df['mae']    = np.zeros(df.shape[0]) * np.nan
-        df['pmae']   = np.zeros(df.shape[0]) * np.nan
-        df['mbe']    = np.zeros(df.shape[0]) * np.nan
-        df['mean']   = np.zeros(df.shape[0]) * np.nan
-
-        df['cv_pos']     = np.zeros(df.shape[0]) * np.nan
-        df['rmse_pos']   = np.zeros(df.shape[0]) * np.nan
-        df['mae_pos']    = np.zeros(df.shape[0]) * np.nan
-        df['pmae_pos']   = np.zeros(df.shape[0]) * np.nan
-        df['mbe_pos']    = np.zeros(df.shape[0]) * np.nan
-        df['mean_pos']   = np.zeros(df.shape[0]) * np.nan
-        df               = df.set_index('models')
-
-        for name in self.trueValues.keys():
-            truth   = self.trueValues[name]
-            est     = np.array(self.models[name]['source'].value).squeeze()
-
-            ## Calculate metrics.
-            df.loc[name,'mbe']  = np.mean((truth-est))
-            df.loc[name,'mean'] = np.mean((truth))
-            df.loc[name,'rmse'] = np.sqrt(np.mean((truth-est)**2))
-            df.loc[name,'mae']  = np.mean(np.abs((truth-est)))
-            if not (df.loc[name,'mean'] == 0):
-                df.loc[name,'cv']   = df.loc[name,'rmse'] / np.mean(truth)
-                df.loc[name,'pmae'] = df.loc[name,'mae']  / np.mean(truth)
-
-                ## Find metrics for  positive indices only
-                posinds = np.abs(truth) > (0.05 * np.abs(np.mean(truth)))
-                truth = truth[posinds]
-                est   = est[posinds]
-                df.loc[name,'rmse_pos'] = np.sqrt(np.mean((truth-est)**2))
-                df.loc[name,'mae_pos']  = np.mean(np.abs((truth-est)))
-                df.loc[name,'cv_pos']   = df.loc[name,'rmse_pos'] / np.mean(truth)
-                df.loc[name,'pmae_pos'] = df.loc[name,'mae_pos']  / np.mean(truth)
-                df.loc[name,'mbe_pos']  = np.mean((truth-est))
-                df.loc[name,'mean_pos'] = np.mean((truth))
-
+        # With a window length in samples, metrics are computed for every window of
+        # the signals, starting every step samples (default window), and indexed by
+        # ('window', 'models'). See csss.Metrics.
+        names = list(self.trueValues.keys())
+        truth = np.array([np.ravel(self.trueValues[name]) for name in names]).reshape(len(names), self.N)
+        est   = np.array([np.ravel(np.array(self.models[name]['source'].value)) for name in names]).reshape(len(names), self.N)
+
+        from csss import Metrics
+        if window is None:
+            df = Metrics.metricsTable(truth, est, names).reindex(pd.Index(list(self.models.keys()), name = 'models'))
+        else:
+            df = Metrics.windowMetrics(truth, est, names, window, step)
         self.performanceMetrics = df
 
         return(None)
 
 
 
-## Function for a cyclic convolution filter, because apparantely there isn't one already in python
+## Group tuning systems by regressor, as (regressor, column indices in names)
+def _sharedRegressors(models, names):
+    groups = {}
+    for i, name in enumerate(names):
+        regressor = models[name]['regressor']
+        groups.setdefault(id(regressor), (regressor, []))[1].append(i)
+    return(list(groups.values()))
+
+## Function for ordinary least squares with an intercept of each column of Y on X,
+# as sklearn's LinearRegression but with one factorization of X for all columns.
+# Returns the coefficients (features x columns) and the fitted values (N x columns).
+def linearFits(X, Y):
+    X = np.asarray(X, dtype = float)
+    Y = np.asarray(Y, dtype = float)
+    X_mean = np.mean(X, axis = 0)
+    Y_mean = np.mean(Y, axis = 0)
+    coef   = np.linalg.lstsq(X - X_mean, Y - Y_mean, rcond = None)[0]
+    est    = np.dot(X - X_mean, coef) + Y_mean
+    return(coef, est)
+
+## Function to append samples to a fixed length window, dropping the oldest ones
+def rollWindow(window, new):
+    window = np.asarray(window)
+    new    = np.asarray(new, dtype = float)
+    if window.ndim > 1:
+        new = new.reshape(-1, window.shape[1])
+    n = new.shape[0]
+    if n >= window.shape[0]:
+        return(new[-window.shape[0]:])
+    return(np.concatenate([window[n:], new]))
+
+## Function for a cyclic convolution filter, because apparantely there isn't one already in python.
+# Filters the last axis of x, so a (series x N) batch is filtered in one call; see csss.Filters.
 def convolve_cyc(x, filt, left = True):
-    if (len(filt) % 2) == 1:
-        pad_l = np.int((len(filt)-1)/2)
-        pad_r = pad_l
-    elif left:
-        pad_l = np.int(len(filt)/2)
-        pad_r = pad_l-1
-    else:
-        pad_r = np.int(len(filt)/2)
-        pad_l = pad_r-1
-
-
-    x = np.concatenate([x[-pad_l:], x, x[:pad_r]])
-    x = np.convolve(x, filt, mode = 'valid')
-    return(x)
+    from csss import Filters
+    return(Filters.cyclicConvolve(x, filt, left))
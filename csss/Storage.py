@@ -0,0 +1,146 @@
+import numpy as np
+
+## Compact storage of fitted SolarDisagg models.
+#
+# A realtime solver only needs plain arrays from a fitted SolarDisagg_IndvHome:
+# the names of the homes, the solar and load thetas, the variance lower bounds,
+# the coefficients of the variance regressions (Solar_var_norm, Total_NL_var), and
+# the hyperparameters of each source (alpha, beta, gamma, cost function and
+# regularizers). saveFitted writes them to one .npz file, and loadFitted reads them
+# back as a FittedModel, from which SolarDisagg_IndvHome_Realtime is built directly,
+# without the original object or any pickled cvxpy expressions.
+#
+# Version 2 added the hyperparameters; version 1 files still load, with the
+# defaults of addSource for them.
+
+FORMAT_VERSION = 2
+
+class LinearPredictor:
+    ## Linear model with the predict method of a fitted sklearn LinearRegression
+
+    def __init__(self, coef, intercept):
+        self.coef_      = np.array(coef, dtype = float)
+        self.intercept_ = np.array(intercept, dtype = float)
+
+    def predict(self, X):
+        return(np.dot(np.asarray(X, dtype = float), self.coef_.T) + self.intercept_)
+
+class FittedModel:
+    ## Plain array description of a fitted SolarDisagg_IndvHome, with the
+    # attributes the realtime solver reads from it
+
+    def __init__(self, names, thetas, varLb, Solar_var_norm, Total_NL_var, hyperparameters = None):
+        self.names          = list(names)
+        self.M              = len(self.names)
+        self.thetas         = thetas  # Fixed theta of each source, including AggregateLoad
+        self.varLb          = varLb   # Variance lower bound of each source
+        self.Solar_var_norm = Solar_var_norm
+        self.Total_NL_var   = Total_NL_var
+        self.hyperparameters = hyperparameters  # Hyperparameters of each source, see hyperparameters
+
+    def sourceArgs(self, name, N):
+        ## Keyword arguments of addSource for the stored hyperparameters of a source.
+        # A time-varying alpha is only used for a window of the same length N; alphas
+        # are retuned on the window by tuneAlphas in any case.
+        if self.hyperparameters is None:
+            return({})
+        hp   = self.hyperparameters[name]
+        args = dict([(key, hp[key]) for key in ['beta', 'gamma', 'costFunction', 'regularizeTheta', 'regularizeSource']])
+        if hp['alpha'].size in [1, N]:
+            args['alpha'] = hp['alpha'] if hp['alpha'].size > 1 else float(hp['alpha'][0])
+        return(args)
+
+def _value(theta):
+    ## Theta of a source model as a flat array, from a variable or a fixed array
+    return(np.ravel(np.array(getattr(theta, 'value', theta), dtype = float)))
+
+def hyperparameters(model):
+    ## Hyperparameters of a source model as plain values. Custom regularizer functions
+    # cannot be stored.
+    for key in ['regularizeTheta', 'regularizeSource']:
+        if callable(model[key]):
+            raise ValueError('Source %s has a custom %s function, which cannot be saved' % (model['name'], key))
+    alpha = np.ravel(np.array(model['alpha'], dtype = float))
+    if np.all(alpha == alpha[0]):
+        alpha = alpha[:1]
+    return({'alpha': alpha,
+            'beta': np.ravel(np.array(model['beta'], dtype = float)),
+            'gamma': float(np.array(model['gamma'], dtype = float).squeeze()),
+            'costFunction': model['costFunction'],
+            'regularizeTheta': model['regularizeTheta'],
+            'regularizeSource': model['regularizeSource']})
+
+def _strings(values):
+    ## Strings, or None as '', as an array
+    return(np.array(['' if v is None else v for v in values], dtype = str))
+
+def _rows(values, n):
+    ## (len(values) x n) array of vectors of length 1 or n
+    return(np.array([np.broadcast_to(v, (n,)) for v in values], dtype = float).reshape(len(values), n))
+
+def fittedModel(sdmod):
+    ## FittedModel of a live SolarDisagg_IndvHome after fitTuneModels, or sdmod
+    # itself if it is a FittedModel already
+    if isinstance(sdmod, FittedModel):
+        return(sdmod)
+    sources = list(sdmod.names) + ['AggregateLoad']
+    thetas  = dict([(name, _value(sdmod.models[name]['theta'])) for name in sources])
+    varLb   = dict([(name, float(sdmod.models[name]['var_lb'])) for name in sources])
+    hyper   = dict([(name, hyperparameters(sdmod.models[name])) for name in sources])
+    return(FittedModel(sdmod.names, thetas, varLb, sdmod.Solar_var_norm, sdmod.Total_NL_var, hyper))
+
+def saveFitted(sdmod, path):
+    ## Write a fitted SolarDisagg_IndvHome (or FittedModel) to an .npz file
+    fitted  = fittedModel(sdmod)
+    names   = fitted.names
+    sources = names + ['AggregateLoad']
+    arrays  = {}
+    if fitted.hyperparameters is not None:
+        ## Alphas as one (sources x L) array, L = 1 if every alpha is constant
+        hp = [fitted.hyperparameters[name] for name in sources]
+        L  = max([h['alpha'].size for h in hp])
+        arrays['alphas']            = _rows([h['alpha'] for h in hp], L)
+        arrays['solarBetas']        = np.array([np.broadcast_to(h['beta'], (fitted.thetas[name].size,))
+                                                for name, h in zip(names, hp)], dtype = float).reshape(len(names), -1)
+        arrays['loadBeta']          = np.broadcast_to(hp[-1]['beta'], (fitted.thetas['AggregateLoad'].size,))
+        arrays['gammas']            = np.array([h['gamma'] for h in hp])
+        arrays['costFunctions']     = _strings([h['costFunction'] for h in hp])
+        arrays['regularizeThetas']  = _strings([h['regularizeTheta'] for h in hp])
+        arrays['regularizeSources'] = _strings([h['regularizeSource'] for h in hp])
+    np.savez(path,
+             version           = FORMAT_VERSION,
+             names             = np.array(names, dtype = str),
+             solarThetas       = np.array([fitted.thetas[name] for name in names]).reshape(len(names), -1),
+             loadTheta         = fitted.thetas['AggregateLoad'],
+             varLb             = np.array([fitted.varLb[name] for name in sources]),
+             solarVarCoef      = np.ravel(fitted.Solar_var_norm.coef_),
+             solarVarIntercept = np.array(fitted.Solar_var_norm.intercept_, dtype = float),
+             totalVarCoef      = np.ravel(fitted.Total_NL_var.coef_),
+             totalVarIntercept = np.array(fitted.Total_NL_var.intercept_, dtype = float),
+             **arrays)
+
+def loadFitted(path):
+    ## Read a FittedModel written by saveFitted
+    with np.load(path) as data:
+        if int(data['version']) > FORMAT_VERSION:
+            raise ValueError('%s was written by a newer version of csss' % path)
+        names  = [str(name) for name in data['names']]
+        thetas = dict(zip(names, data['solarThetas']))
+        thetas['AggregateLoad'] = data['loadTheta']
+        varLb  = dict(zip(names + ['AggregateLoad'], data['varLb'].tolist()))
+        Solar_var_norm = LinearPredictor(data['solarVarCoef'], data['solarVarIntercept'])
+        Total_NL_var   = LinearPredictor(data['totalVarCoef'], data['totalVarIntercept'])
+        ## Hyperparameters, absent from version 1 files and from models saved without them
+        hyper = None
+        if 'alphas' in data.files:
+            betas = list(data['solarBetas']) + [data['loadBeta']]
+            hyper = {}
+            for i, name in enumerate(names + ['AggregateLoad']):
+                alpha = data['alphas'][i]
+                hyper[name] = {'alpha': alpha[:1] if np.all(alpha == alpha[0]) else np.array(alpha),
+                               'beta': np.array(betas[i]),
+                               'gamma': float(data['gammas'][i]),
+                               'costFunction': str(data['costFunctions'][i]),
+                               'regularizeTheta': str(data['regularizeThetas'][i]) or None,
+                               'regularizeSource': str(data['regularizeSources'][i]) or None}
+    return(FittedModel(names, thetas, varLb, Solar_var_norm, Total_NL_var, hyper))
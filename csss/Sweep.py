@@ -0,0 +1,169 @@
+import os
+import json
+import time
+import pickle
+import itertools
+import concurrent.futures
+import numpy as np
+import pandas as pd
+
+## Parallel hyperparameter sweeps for sensitivity studies.
+#
+# A sweep solves a CSSS or SolarDisagg model for each point of a grid (or random
+# sample) of hyperparameters. Keys of a point are 'param', applied to every
+# source, or 'source:param' for one source, e.g.
+#
+#   points = Sweep.grid(**{'alpha': [.5, 1, 2], 'AggregateLoad:gamma': [0, 1]})
+#
+# Each worker process receives one copy of the model and solves a contiguous run
+# of points in order, in parameterized mode with warm starts, so the problem is
+# compiled once per worker and each solve starts from the neighbouring point's
+# solution (regularization path style). Completed points are appended to a JSON
+# lines checkpoint file, and points already in it are skipped when a sweep is run
+# again with the same file.
+
+def grid(**values):
+    ## All combinations of the given values, as a list of points (dicts)
+    keys = sorted(values.keys())
+    return([dict(zip(keys, combo)) for combo in itertools.product(*[values[k] for k in keys])])
+
+def randomSample(n, seed = None, log = False, **ranges):
+    ## n points with each hyperparameter uniform in its (low, high) range, or
+    # log-uniform if log is True
+    rng    = np.random.RandomState(seed)
+    keys   = sorted(ranges.keys())
+    points = []
+    for i in range(n):
+        point = {}
+        for k in keys:
+            low, high = ranges[k]
+            if log:
+                point[k] = float(np.exp(rng.uniform(np.log(low), np.log(high))))
+            else:
+                point[k] = float(rng.uniform(low, high))
+        points.append(point)
+    return(points)
+
+def applyPoint(model, point):
+    ## Assign the hyperparameters of a point to the sources of a model
+    for key, value in point.items():
+        name, _, param = key.rpartition(':')
+        names = list(model.models.keys()) if name == '' else [name]
+        for name in names:
+            model.models[name][param] = value
+            model.updateSourceObj(name)
+
+def _plain(value):
+    ## JSON value of numpy scalars and arrays, e.g. from np.linspace or np.arange grids
+    if isinstance(value, np.generic):
+        return(value.item())
+    elif isinstance(value, np.ndarray):
+        return(value.tolist())
+    raise TypeError('%r is not JSON serializable' % (value,))
+
+def pointKey(point):
+    ## Key identifying a point in a checkpoint file
+    return(json.dumps(point, sort_keys = True, default = _plain))
+
+def readCheckpoint(path):
+    ## Records of the points completed in a checkpoint file, by point key
+    done = {}
+    if path is not None and os.path.exists(path):
+        with open(path) as f:
+            for line in f:
+                line = line.strip()
+                if line:
+                    record = json.loads(line)
+                    done[pointKey(record['point'])] = record
+    return(done)
+
+def portable(model):
+    ## Pickle a model without its compiled problems, caches and profiler, which
+    # hold solver state that cannot be pickled and is rebuilt by the workers
+    saved = {}
+    for attr in ['problem', 'lastProblem', 'solutionCache', 'profiler']:
+        saved[attr] = getattr(model, attr, None)
+        setattr(model, attr, None)
+    try:
+        return(pickle.dumps(model))
+    finally:
+        for attr, value in saved.items():
+            setattr(model, attr, value)
+
+_worker = {}
+
+def _initWorker(data, solverArgs):
+    _worker['model']      = pickle.loads(data)
+    _worker['solverArgs'] = solverArgs
+
+def _metrics(model):
+    ## Performance metrics of each source with a true value, {source: {metric: value}}
+    if not hasattr(model, 'calcPerformanceMetrics') or len(getattr(model, 'trueValues', {})) == 0:
+        return({})
+    model.calcPerformanceMetrics()
+    df = model.performanceMetrics.loc[list(model.trueValues.keys())]
+    return(dict([(name, dict([(col, None if np.isnan(v) else float(v)) for col, v in row.items()]))
+                 for name, row in df.iterrows()]))
+
+def solvePoint(point):
+    ## Solve the worker's model at a point, returns its checkpoint record
+    model = _worker['model']
+    applyPoint(model, point)
+    t0 = time.time()
+    value = model.constructSolve(warmStart = True, **_worker['solverArgs'])
+    seconds = time.time() - t0
+    status = getattr(model.lastProblem, 'status', 'native') if model.lastProblem is not None else 'native'
+    return({'point': point, 'value': None if value is None else float(value), 'status': status,
+            'seconds': seconds, 'metrics': _metrics(model)})
+
+def sweep(model, points, workers = None, checkpoint = None, **solverArgs):
+    ## Solve model at every point, in parallel across `workers` processes, and return
+    # a tidy DataFrame with one row per point and source with true values (one row
+    # per point without true values): the hyperparameters, objective value, solver
+    # status and time, and the metrics of calcPerformanceMetrics.
+    # checkpoint: JSON lines file to append completed points to, and resume from
+    done   = readCheckpoint(checkpoint)
+    todo   = [point for point in points if pointKey(point) not in done]
+    if workers is None:
+        workers = os.cpu_count() or 1
+    workers = max(1, min(workers, len(todo)))
+    data    = portable(model)
+
+    out = None if checkpoint is None else open(checkpoint, 'a')
+    try:
+        if workers == 1:
+            _initWorker(data, solverArgs)
+            results = map(solvePoint, todo)
+            pool    = None
+        else:
+            pool = concurrent.futures.ProcessPoolExecutor(max_workers = workers, initializer = _initWorker,
+                                                          initargs = (data, solverArgs))
+            ## Contiguous runs of points per worker, so warm starts come from neighbours
+            results = pool.map(solvePoint, todo, chunksize = int(np.ceil(len(todo) / float(workers))))
+        for record in results:
+            done[pointKey(record['point'])] = record
+            if out is not None:
+                out.write(json.dumps(record, default = _plain) + '\n')
+                out.flush()
+    finally:
+        if out is not None:
+            out.close()
+        if workers > 1 and pool is not None:
+            pool.shutdown()
+        _worker.clear()
+    return(resultsTable([done[pointKey(point)] for point in points]))
+
+def resultsTable(records):
+    ## Tidy DataFrame of sweep records
+    rows = []
+    for i, record in enumerate(records):
+        base = {'point': i}
+        base.update(record['point'])
+        base.update({'value': record['value'], 'status': record['status'], 'seconds': record['seconds']})
+        if len(record['metrics']) == 0:
+            rows.append(base)
+        for name, metrics in record['metrics'].items():
+            row = dict(base, models = name)
+            row.update(metrics)
+            rows.append(row)
+    return(pd.DataFrame(rows))
@@ -0,0 +1,190 @@
+import os
+import concurrent.futures
+import numpy as np
+import cvxpy as cvp
+
+## Time-decomposed solving of CSSS problems with fixed thetas.
+#
+# Once thetas are fixed, the only couplings across time are the source
+# regularizers and non-separable costs. The problem is
+#   - 'separable' when every source uses the 'sse' or 'l1' cost without source
+#     regularization: each timestep is independent, and the horizon can be split
+#     into blocks that are solved exactly and independently;
+#   - 'banded' when some source also uses 'diff1_ss': neighbouring timesteps are
+#     coupled, so blocks are extended by `overlap` samples on each side and only
+#     their core is kept. The error at the block boundaries decays quickly with
+#     the overlap, and `reconcile` passes re-solve each extended block with the
+#     diff1_ss coupling to the current solution just outside of it added to its
+#     objective (overlapping block Jacobi, or additive Schwarz).
+# Blocks are independent small problems, solved in parallel in a process or
+# thread pool; each is built from plain arrays, so nothing cvxpy is pickled.
+
+def temporalStructure(csssobj):
+    ## 'separable', 'banded', or None if the problem does not decompose in time
+    if len(csssobj.constraints) > 0 or len(csssobj.groups) > 0 or len(csssobj.models) == 0:
+        return(None)
+    structure = 'separable'
+    for name, model in csssobj.models.items():
+        if not isinstance(model['theta'], np.ndarray):
+            return(None)
+        if model['costFunction'].lower() not in ['sse', 'l1']:
+            return(None)
+        if callable(model['regularizeSource']) or str(model['regularizeSource']).lower() not in ['none', 'diff1_ss']:
+            return(None)
+        if model['regularizeSource'] is not None:
+            structure = 'banded'
+    return(structure)
+
+def blockRanges(N, blockLength, overlap = 0):
+    ## (start, stop) of the core and (a, b) of the extended range of each block
+    ranges = []
+    for start in range(0, N, blockLength):
+        stop = min(start + blockLength, N)
+        ranges.append((start, stop, max(start - overlap, 0), min(stop + overlap, N)))
+    return(ranges)
+
+def _slice(value, a, b, N):
+    ## Rows a:b of a scalar or length N hyperparameter
+    value = np.ravel(np.array(value, dtype = float))
+    if value.size == 1:
+        return(float(value[0]))
+    return(value.reshape(N)[a:b])
+
+def blockSpec(csssobj, baselines, a, b, boundary = None):
+    ## Plain array description of the problem restricted to samples a:b. The fixed
+    # model estimate of each source becomes a one-column regressor with theta 1.
+    # boundary optionally holds {name: (left, right)}, the values of diff1_ss sources
+    # at samples a - 1 and b (None outside of the horizon).
+    N = csssobj.N
+    sources = []
+    for name, model in csssobj.models.items():
+        options = {'name': name, 'costFunction': model['costFunction'],
+                   'alpha': _slice(model['alpha'], a, b, N),
+                   'regularizeSource': model['regularizeSource'], 'gamma': float(np.ravel(model['gamma'])[0]),
+                   'lb': None if model['lb'] is None else _slice(model['lb'], a, b, N),
+                   'ub': None if model['ub'] is None else _slice(model['ub'], a, b, N)}
+        sources.append((baselines[name][a:b].reshape(-1, 1), options))
+    return({'aggregate': np.ravel(csssobj.aggregateSignal)[a:b], 'sources': sources, 'boundary': boundary})
+
+def _boundaryRegularizer(left, right, n):
+    ## diff1_ss of a block source of n samples, including the differences to the
+    # samples next to the block
+    def regularizer(source):
+        obj = cvp.sum_squares(cvp.diff(source))
+        if left is not None:
+            obj = obj + cvp.sum_squares(source[0] - left)
+        if right is not None:
+            obj = obj + cvp.sum_squares(source[n - 1] - right)
+        return(obj)
+    return(regularizer)
+
+def solveBlock(spec, solverArgs = None):
+    ## Solve the CSSS problem of a block spec, returns the (sources x samples) solution
+    from csss.CSSS import CSSS
+    block = CSSS(spec['aggregate'])
+    boundary = spec['boundary'] or {}
+    for regressor, options in spec['sources']:
+        if options['name'] in boundary:
+            options = dict(options, regularizeSource = _boundaryRegularizer(boundary[options['name']][0], boundary[options['name']][1],
+                                                                            len(spec['aggregate'])))
+        block.addSource(regressor, **options)
+        block.models[options['name']]['theta'] = np.ones((1, 1))
+    block.updateSourceObj('all')
+    block.constructSolve(**(solverArgs or {}))
+    return(np.array(block.solutionArray()))
+
+def _pool(workers, executor):
+    if workers == 1:
+        return(None)
+    elif executor == 'process':
+        return(concurrent.futures.ProcessPoolExecutor(max_workers = workers))
+    elif executor == 'thread':
+        return(concurrent.futures.ThreadPoolExecutor(max_workers = workers))
+    raise ValueError('executor must be "process" or "thread"')
+
+def _solveAll(pool, specs, solverArgs):
+    if pool is None:
+        return([solveBlock(spec, solverArgs) for spec in specs])
+    return(list(pool.map(solveBlock, specs, [solverArgs] * len(specs))))
+
+def timeBlockSolve(csssobj, blockLength, overlap = None, reconcile = 0, workers = None,
+                   executor = 'process', **solverArgs):
+    ## Solve a CSSS problem with fixed thetas in time blocks of blockLength samples,
+    # in parallel, and store the stitched solution. Returns the objective value of
+    # the stitched solution. overlap defaults to 0 for separable problems and to a
+    # quarter block for banded ones.
+    structure = temporalStructure(csssobj)
+    if structure is None:
+        raise ValueError('Time blocks need fixed thetas, sse or l1 costs, no source regularizer other '
+                         'than diff1_ss, and no constraints or source groups')
+    if overlap is None:
+        overlap = 0 if structure == 'separable' else blockLength // 4
+    if structure == 'separable':
+        overlap   = 0
+        reconcile = 0
+    if workers is None:
+        workers = os.cpu_count() or 1
+
+    N      = csssobj.N
+    names  = list(csssobj.models.keys())
+    ranges = blockRanges(N, blockLength, overlap)
+    baselines = dict([(name, np.ravel(np.dot(model['regressor'], model['theta'])))
+                      for name, model in csssobj.models.items()])
+    workers = min(workers, len(ranges))
+    pool    = _pool(workers, executor)
+    try:
+        ## Overlapping blocks, keeping their cores
+        sources = np.zeros((len(names), N))
+        results = _solveAll(pool, [blockSpec(csssobj, baselines, a, b) for start, stop, a, b in ranges], solverArgs)
+        for (start, stop, a, b), result in zip(ranges, results):
+            sources[:, start:stop] = result[:, start - a:stop - a]
+
+        ## Reconcile the block boundaries, coupling each extended block to the current
+        # solution next to it
+        banded = [j for j, name in enumerate(names) if csssobj.models[name]['regularizeSource'] is not None]
+        for k in range(reconcile):
+            specs = []
+            for start, stop, a, b in ranges:
+                boundary = {}
+                for j in banded:
+                    boundary[names[j]] = (None if a == 0 else float(sources[j, a - 1]),
+                                          None if b == N else float(sources[j, b]))
+                specs.append(blockSpec(csssobj, baselines, a, b, boundary))
+            results = _solveAll(pool, specs, solverArgs)
+            for (start, stop, a, b), result in zip(ranges, results):
+                sources[:, start:stop] = result[:, start - a:stop - a]
+    finally:
+        if pool is not None:
+            pool.shutdown()
+
+    csssobj._storeSolutions(dict(zip(names, sources)), {})
+    return(objectiveValue(csssobj, dict(zip(names, sources)), baselines))
+
+def objectiveValue(csssobj, sources, baselines):
+    ## Objective of a fixed-theta problem at the stitched sources, from the arrays
+    # rather than a cvxpy expression over the whole horizon
+    N   = csssobj.N
+    obj = 0.0
+    for name, model in csssobj.models.items():
+        alpha = np.broadcast_to(np.ravel(np.array(model['alpha'], dtype = float)), (N,))
+        resid = sources[name] - baselines[name]
+        if model['costFunction'].lower() == 'sse':
+            obj = obj + np.sum(alpha * resid ** 2)
+        else:
+            obj = obj + np.sum(np.abs(alpha * resid))
+        if model['regularizeSource'] is not None:
+            obj = obj + float(np.ravel(model['gamma'])[0]) * np.sum(np.diff(sources[name]) ** 2)
+        if model['regularizeTheta'] is not None:
+            ## Constant for fixed thetas, a small expression of the theta only
+            obj = obj + float(csssobj._thetaTerm(model).value)
+    return(obj)
+
+def isTimeBlocks(csssobj):
+    ## Check whether a CSSS problem can be solved in time blocks, see csss/Backends.py
+    return(temporalStructure(csssobj) is not None)
+
+def solveTimeBlocks(csssobj, blockLength = None, **blockArgs):
+    ## Time blocks backend: solve with timeBlockSolve, blockLength is required
+    if blockLength is None:
+        raise ValueError('The timeBlocks backend needs a blockLength')
+    return(timeBlockSolve(csssobj, blockLength, **blockArgs))
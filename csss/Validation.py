@@ -0,0 +1,99 @@
+import os
+import time
+import pickle
+import concurrent.futures
+import numpy as np
+import pandas as pd
+from csss.Sweep import portable
+
+## Leave-one-out cross-validation of the tuning systems of SolarDisagg_IndvHome.
+#
+# Each fold holds out one of the tuning systems, fits the solar variance model on
+# the others, tunes alphas and solves, and scores the held out system against its
+# true value. The parts of fitTuneModels that do not depend on the held out system
+# are computed once for all folds: the normalized squared residuals of every tuning
+# system (one factorization per shared regressor, see tuningResiduals), the
+# variance lower bounds and the aggregate variance model. A fold then only refits
+# Solar_var_norm to the mean of the remaining columns of the residuals.
+#
+# Folds run in a process pool. Each worker receives one copy of the model and
+# solves its folds in parameterized mode, so the problem is compiled once per
+# worker and each fold only rebinds the alphas. Every fold starts from the thetas
+# of the model passed in, so folds do not depend on each other or on their order.
+
+_worker = {}
+
+def _initWorker(data, residuals, tuneSys, thetas, solverArgs):
+    _worker['model']      = pickle.loads(data)
+    _worker['residuals']  = residuals
+    _worker['tuneSys']    = tuneSys
+    _worker['thetas']     = thetas
+    _worker['solverArgs'] = solverArgs
+
+def solveFold(i):
+    ## Fit, tune and solve the worker's model with tuning system i held out,
+    # returns the row of the fold
+    model   = _worker['model']
+    heldOut = _worker['tuneSys'][i]
+    for name, theta in _worker['thetas'].items():
+        model.models[name]['theta'].value = theta
+
+    t0 = time.time()
+    model.fitSolarVariance(np.delete(_worker['residuals'], i, axis = 1))
+    t1 = time.time()
+    model.tuneAlphas()
+    t2 = time.time()
+    value = model.constructSolve(warmStart = True, **_worker['solverArgs'])
+    t3 = time.time()
+
+    status = getattr(model.lastProblem, 'status', 'native') if model.lastProblem is not None else 'native'
+    row = {'heldOut': heldOut, 'tuneSize': len(_worker['tuneSys']) - 1,
+           'value': None if value is None else float(value), 'status': status,
+           'fitSeconds': t1 - t0, 'tuneSeconds': t2 - t1, 'solveSeconds': t3 - t2}
+    model.calcPerformanceMetrics()
+    row.update(model.performanceMetrics.loc[heldOut].to_dict())
+    return(row)
+
+def crossValidate(sdmod, tuneSys = None, var_lb_fraction = 0.05, workers = None, **solverArgs):
+    ## Leave-one-out cross-validation of the tuning systems of a SolarDisagg_IndvHome
+    # with estimated thetas. Returns a DataFrame with one row per held out system:
+    # the number of systems tuned on, objective value and solver status, the time to
+    # fit, tune and solve, and the metrics of calcPerformanceMetrics for the held out
+    # system. The model passed in is not changed.
+    # tuneSys:     systems with true values to cross-validate, default all of them
+    # workers:     processes to run folds in, default one per cpu
+    # solverArgs:  arguments of constructSolve
+    if tuneSys is None:
+        tuneSys = [name for name in sdmod.trueValues.keys() if name != 'AggregateLoad']
+    tuneSys = list(tuneSys)
+    if len(tuneSys) < 2:
+        raise ValueError('Cross-validation needs at least two tuning systems')
+    thetas = {}
+    for name, m in sdmod.models.items():
+        if getattr(m['theta'], 'value', None) is None:
+            raise ValueError('Estimate the thetas (constructSolve) before cross-validating')
+        thetas[name] = np.array(m['theta'].value)
+    if workers is None:
+        workers = os.cpu_count() or 1
+    workers = max(1, min(workers, len(tuneSys)))
+
+    ## Work shared by all folds, computed on a copy of the model
+    copy = pickle.loads(portable(sdmod))
+    residuals = copy.tuningResiduals(tuneSys)
+    copy.fitAggregateVariance(var_lb_fraction)
+    data = portable(copy)
+
+    try:
+        if workers == 1:
+            _initWorker(data, residuals, tuneSys, thetas, solverArgs)
+            rows = [solveFold(i) for i in range(len(tuneSys))]
+        else:
+            pool = concurrent.futures.ProcessPoolExecutor(max_workers = workers, initializer = _initWorker,
+                                                          initargs = (data, residuals, tuneSys, thetas, solverArgs))
+            try:
+                rows = list(pool.map(solveFold, range(len(tuneSys))))
+            finally:
+                pool.shutdown()
+    finally:
+        _worker.clear()
+    return(pd.DataFrame(rows))
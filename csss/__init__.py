@@ -8,5 +8,23 @@ attributes to perform Contextually Supervise Source Separation, and the subset
 of this problem: Solar Disaggregation.
 """
 
+import sys
+import importlib
 from csss.CSSS import *
-import csss.SolarDisagg as SolarDisagg
+
+## Modules that need more than the CSSS class, e.g. pandas and sklearn for
+# SolarDisagg or scipy.sparse for the least squares backend, are imported on first
+# use as csss.<module> (or with import csss.<module>). This needs a module
+# __getattr__ (PEP 562, Python 3.7); older interpreters import them with csss.
+LAZY_MODULES = ['SolarDisagg', 'Metrics', 'Filters', 'Inputs', 'Storage', 'Sweep',
+                'Validation', 'Hierarchical', 'Service', 'LeastSquares', 'Separable',
+                'TimeBlocks', 'ADMM']
+
+if sys.version_info >= (3, 7):
+    def __getattr__(name):
+        if name in LAZY_MODULES:
+            return(importlib.import_module('csss.' + name))
+        raise AttributeError("module 'csss' has no attribute '%s'" % name)
+else:
+    for _module in LAZY_MODULES:
+        importlib.import_module('csss.' + _module)
@@ -0,0 +1,89 @@
+## Tests of the native ADMM engine (csss/ADMM.py) against cvxpy.
+import numpy as np
+import pytest
+
+from csss.CSSS import CSSS
+from csss import ADMM
+
+def boundedSource(N, gamma, order, seed = 0):
+    ## A single bounded source whose unconstrained prox violates the bounds on
+    # about half of the samples
+    rng = np.random.RandomState(seed)
+    t   = np.arange(N) / float(N)
+    X   = np.column_stack([np.ones(N), np.sin(2 * np.pi * t), t][:order]) if order > 0 else np.zeros((N, 0))
+    csssobj = CSSS(np.zeros(N))
+    csssobj.addSource(X, name = 's', alpha = 1 + rng.rand(N), lb = -0.5, ub = 0.5 + 0.2 * t,
+                      regularizeSource = 'diff1_ss' if gamma > 0 else None, gamma = gamma,
+                      regularizeTheta = 'ss', beta = 0.1)
+    if order == 0:
+        csssobj.models['s']['theta'] = np.zeros((0, 1))
+    csssobj.updateSourceObj('all')
+    csssobj._refreshSources()
+    v = 2 * np.sin(6 * np.pi * t) + rng.randn(N) * 0.3
+    return(csssobj, v)
+
+@pytest.mark.parametrize('gamma, order', [(2.0, 2), (0.0, 3), (5.0, 1), (2.0, 0)])
+def test_bounded_prox_is_exact(gamma, order):
+    csssobj, v = boundedSource(40, gamma, order)
+    native = ADMM.sourceProx(csssobj, 's', 1.5)
+    assert isinstance(native, ADMM.SourceProx)
+    s, theta, value = native.update(v)
+    assert np.all(s >= -0.5 - 1e-12) and np.all(s <= 0.5 + 0.2 * np.arange(40) / 40.0 + 1e-12)
+
+    reference = ADMM.CvxpyProx(csssobj, 's', 1.5)
+    expected, expectedTheta, expectedValue = reference.update(v)
+    np.testing.assert_allclose(s, expected, atol = 1e-4)
+    assert value == pytest.approx(expectedValue, rel = 1e-5, abs = 1e-5)
+
+    ## A second update, warm started from the first active set, is exact as well
+    s, theta, value = native.update(v + 0.5)
+    expected, expectedTheta, expectedValue = reference.update(v + 0.5)
+    np.testing.assert_allclose(s, expected, atol = 1e-4)
+
+def homes(N = 36, M = 4):
+    ## M bounded home loads, each peaking at a different hour, and a smooth solar source
+    hour = np.arange(N) % 24
+    sun  = np.clip(np.sin((hour - 6) / 12.0 * np.pi), 0, None).reshape(-1, 1)
+    csssobj = CSSS(M * (1 + .3 * np.cos(2 * np.pi * hour / 24.0)) - 3 * sun[:, 0] + .2 * np.sin(np.arange(N) / 3.0))
+    for i in range(M):
+        peak = np.cos(2 * np.pi * (hour - 4 * i) / 24.0)
+        csssobj.addSource(np.column_stack([np.ones(N), peak]), name = 'home%d' % i, alpha = 1.0 + i, lb = 0,
+                          regularizeTheta = 'ss', beta = .1)
+    csssobj.addSource(sun, name = 'solar', alpha = 2.0, ub = 0, regularizeSource = 'diff1_ss', gamma = 1.0)
+    return(csssobj)
+
+def admmSources(csssobj):
+    return(dict([(name, np.ravel(csssobj.models[name]['admmSource'])) for name in csssobj.models]))
+
+def test_jacobi_matches_gauss_seidel():
+    ## Both schemes converge to the optimum; Jacobi gives the same iterates in
+    # any pool, since each iteration only reads the previous one
+    options = dict(MaxIter = 5000, ABSTOL = 1e-9, RELTOL = 0)
+    gaussSeidel = homes()
+    gaussSeidel.admmSolve(1.0, **options)
+    reference = homes()
+    reference.constructSolve(backend = 'cvxpy')
+
+    jacobi = []
+    for executor, workers in [('thread', 1), ('thread', 2), ('process', 1), ('process', 2)]:
+        csssobj = homes()
+        csssobj.admmSolve(1.0, method = 'jacobi', executor = executor, workers = workers, **options)
+        jacobi.append(admmSources(csssobj))
+    for name, expected in admmSources(gaussSeidel).items():
+        np.testing.assert_allclose(expected, np.ravel(np.array(reference.models[name]['source'].value)), atol = 1e-4)
+        np.testing.assert_allclose(jacobi[0][name], expected, atol = 1e-4)
+        for other in jacobi[1:]:
+            np.testing.assert_allclose(other[name], jacobi[0][name], rtol = 0, atol = 1e-12)
+
+def test_dynamic_schedule_needs_threads():
+    with pytest.raises(ValueError):
+        homes().admmSolve(1.0, method = 'jacobi', executor = 'process', workers = 2, schedule = 'dynamic')
+    csssobj = homes()
+    csssobj.admmSolve(1.0, MaxIter = 20, method = 'jacobi', executor = 'thread', workers = 2, schedule = 'dynamic')
+    assert len(csssobj.admmTiming) > 0
+
+def test_backend_ignores_cvxpy_arguments():
+    csssobj = homes()
+    value = csssobj.constructSolve(backend = 'admm', solver = 'SCS', MaxIter = 50)
+    assert csssobj.lastBackend == 'admm'
+    assert np.isfinite(value)
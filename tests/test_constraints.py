@@ -0,0 +1,31 @@
+## Regression tests of the constraints passed to the solver (CSSS.problemConstraints).
+import numpy as np
+
+from csss.CSSS import CSSS
+
+def problem(y):
+    N = len(y)
+    csssobj = CSSS(y)
+    csssobj.addSource(np.ones((N, 1)), name = 'a', lb = 0)
+    csssobj.addSource(np.column_stack([np.arange(N) / float(N)]), name = 'b', ub = 10)
+    csssobj.addConstraint(csssobj.models['a']['source'] <= 5)
+    return(csssobj)
+
+def test_resolve_does_not_grow_constraints():
+    csssobj = problem(np.linspace(1, 3, 24))
+    before  = csssobj.constraintSummary()
+    for i in range(3):
+        csssobj.constructSolve(backend = 'cvxpy')
+    assert len(csssobj.constraints) == 1
+    assert csssobj.constraintSummary() == before
+    assert csssobj.problemConstraints() is not csssobj.problemConstraints()
+
+def test_resolve_with_new_aggregate_signal():
+    ## The coupling constraint follows the aggregate signal instead of accumulating
+    csssobj = problem(np.linspace(1, 3, 24))
+    csssobj.constructSolve(backend = 'cvxpy')
+    csssobj.aggregateSignal = np.linspace(2, 4, 24)
+    value = csssobj.constructSolve(backend = 'cvxpy')
+    assert np.isfinite(value)
+    total = np.sum([np.ravel(np.array(m['source'].value)) for m in csssobj.models.values()], axis = 0)
+    np.testing.assert_allclose(total, csssobj.aggregateSignal, atol = 1e-4)
@@ -0,0 +1,55 @@
+## Tests of the cyclic and streaming filters (csss/Filters.py) against their
+## definitions, summed term by term.
+import numpy as np
+import pytest
+
+from csss import Filters
+
+def cyclicSum(x, filt, pad_r):
+    ## y[n] = sum_k filt[k] x[(n + pad_r - k) % N]
+    N = len(x)
+    return(np.array([np.sum([filt[k] * x[(n + pad_r - k) % N] for k in range(len(filt))]) for n in range(N)]))
+
+def convolveCyc(x, filt, left = True):
+    ## The former convolve_cyc of csss/SolarDisagg.py, for filters of more than two taps
+    if (len(filt) % 2) == 1:
+        pad_l = int((len(filt) - 1) / 2)
+        pad_r = pad_l
+    elif left:
+        pad_l = int(len(filt) / 2)
+        pad_r = pad_l - 1
+    else:
+        pad_r = int(len(filt) / 2)
+        pad_l = pad_r - 1
+    x = np.concatenate([x[-pad_l:], x, x[:pad_r]])
+    return(np.convolve(x, filt, mode = 'valid'))
+
+SERIES = np.random.RandomState(5).randn(3, 50)
+
+@pytest.mark.parametrize('taps', [1, 4, 7, 12, 49])
+@pytest.mark.parametrize('left', [True, False])
+def test_cyclic_methods_match_sum(taps, left):
+    filt  = np.hanning(taps + 2)[1:-1]
+    pad_l, pad_r = Filters._padding(taps, left)
+    assert pad_l + pad_r == taps - 1
+    for method in ['direct', 'fft']:
+        batch = Filters.cyclicConvolve(SERIES, filt, left = left, method = method)
+        assert batch.shape == SERIES.shape
+        for i, x in enumerate(SERIES):
+            expected = cyclicSum(x, filt, pad_r)
+            np.testing.assert_allclose(batch[i], expected, atol = 1e-12)
+            if taps > 2:
+                np.testing.assert_allclose(batch[i], convolveCyc(x, filt, left), atol = 1e-12)
+            np.testing.assert_allclose(Filters.cyclicConvolve(x, filt, left = left, method = method), expected, atol = 1e-12)
+
+def test_streaming_matches_causal_convolution():
+    ## Chunks of any size give the causal filter of the whole stream
+    filt   = np.array([.5, .3, .2, -.1])
+    stream = Filters.StreamingFilter(filt)
+    chunks = [stream.update(SERIES[:, a:b]) for a, b in [(0, 2), (2, 3), (3, 20), (20, 50)]]
+    expected = np.array([np.convolve(x, filt)[:SERIES.shape[1]] for x in SERIES])
+    np.testing.assert_allclose(np.concatenate(chunks, axis = -1), expected, atol = 1e-12)
+
+    ## With a history, the first outputs use its last samples instead of zeros
+    resumed = Filters.StreamingFilter(filt, history = SERIES[0, :20])
+    np.testing.assert_allclose(resumed.update(SERIES[0, 20:]), expected[0, 20:], atol = 1e-12)
@@ -0,0 +1,44 @@
+## Tests of hierarchical disaggregation (csss/Hierarchical.py): the reconciled
+## sources must add up to the aggregate net load and respect every home's bound.
+import numpy as np
+
+from csss import Hierarchical
+from csss.SolarDisagg import SolarDisagg_IndvHome
+
+N, M = 48, 6
+rng  = np.random.RandomState(3)
+hour = (np.arange(N) % 24).astype(float)
+sun  = np.clip(np.sin((hour - 6) / 12.0 * np.pi), 0, None)
+
+SOLAR_REGRESSORS = np.column_stack([sun * rng.uniform(.8, 1, N)])
+LOAD_REGRESSORS  = np.column_stack([np.ones(N), np.cos(hour / 24.0 * 2 * np.pi)])
+NETLOADS         = 1 + .3 * rng.rand(N, M) - np.outer(sun, rng.uniform(1, 4, M))
+
+def test_partition_covers_every_home_once():
+    for groups in [None, 3, ['a', 'b', 'a', 'c', 'b', 'a'], [[0, 5], [1, 2, 3, 4]]]:
+        parts = Hierarchical.partition(NETLOADS, groups, SOLAR_REGRESSORS, LOAD_REGRESSORS)
+        assert sorted(np.concatenate(parts).tolist()) == list(range(M))
+    labels = Hierarchical.partition(NETLOADS, ['a', 'b', 'a', 'c', 'b', 'a'])
+    assert [p.tolist() for p in labels] == [[0, 2, 5], [1, 4], [3]]
+
+def test_sources_add_up_within_bounds():
+    result = Hierarchical.hierarchicalDisaggregate(NETLOADS, SOLAR_REGRESSORS, LOAD_REGRESSORS, groups = 2, workers = 1)
+    total  = np.sum(result['solar'], axis = 1) + result['load']
+    np.testing.assert_allclose(total, np.sum(NETLOADS, axis = 1), rtol = 0, atol = 1e-10)
+    assert np.all(result['solar'] <= np.minimum(NETLOADS, 0) + 1e-10)
+
+    ## The homes of each group add up to the group's solar
+    for g, homes in enumerate(result['groups']):
+        np.testing.assert_allclose(np.sum(result['solar'][:, homes], axis = 1), result['groupSolar'][:, g], atol = 1e-10)
+
+def test_close_to_monolithic():
+    ## The hierarchical solution is feasible for the monolithic problem, so its
+    # objective is at least the optimum, and close to it for similar homes
+    sd = SolarDisagg_IndvHome(NETLOADS, SOLAR_REGRESSORS, LOAD_REGRESSORS)
+    optimum = sd.constructSolve(backend = 'cvxpy')
+    value   = sd.hierarchicalSolve(groups = 2, workers = 1)
+    assert value >= optimum - 1e-4 * abs(optimum)
+    assert value <= 1.01 * optimum
+
+    total = np.sum([np.ravel(np.array(m['source'].value)) for m in sd.models.values()], axis = 0)
+    np.testing.assert_allclose(total, np.sum(NETLOADS, axis = 1), atol = 1e-10)
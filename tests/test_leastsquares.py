@@ -0,0 +1,77 @@
+## Regression tests of the least squares backend (csss/LeastSquares.py) against the
+## cvxpy backend.
+import numpy as np
+import pytest
+
+from csss.CSSS import CSSS
+from csss import LeastSquares
+
+def sourceValues(csssobj):
+    return(dict([(name, np.ravel(np.array(model['source'].value))) for name, model in csssobj.models.items()]))
+
+def problem(N = 48, seed = 0, collinear = False, alpha = 1.0):
+    ## Three sources with smooth regressors, adding up to a noisy aggregate signal
+    rng = np.random.RandomState(seed)
+    t   = np.arange(N) / float(N)
+    X1  = np.column_stack([np.ones(N), np.sin(2 * np.pi * t)])
+    X2  = np.column_stack([np.ones(N), np.cos(2 * np.pi * t), t])
+    if collinear:
+        X2 = np.column_stack([X2, 2 * X2[:, 1]])
+    y   = np.dot(X1, [1.0, 2.0]) + np.dot(X2[:, :3], [0.5, -1.0, 3.0]) + rng.randn(N) * 0.1
+
+    csssobj = CSSS(y)
+    csssobj.addSource(X1, name = 'a', alpha = alpha, regularizeTheta = None if collinear else 'ss', beta = 0.1)
+    csssobj.addSource(X2, name = 'b', alpha = 1 + rng.rand(N), regularizeSource = 'diff1_ss', gamma = 2.0)
+    csssobj.addSource(np.column_stack([t ** 2]), name = 'c', alpha = 5.0)
+    return(csssobj)
+
+def compareBackends(make, tol = 1e-4):
+    native = make()
+    value  = native.constructSolve()
+    assert native.lastBackend == 'leastSquares'
+    reference = make()
+    expected  = reference.constructSolve(backend = 'cvxpy')
+    assert value == pytest.approx(expected, rel = tol, abs = tol)
+    sources, expectedSources = sourceValues(native), sourceValues(reference)
+    for name in expectedSources:
+        np.testing.assert_allclose(sources[name], expectedSources[name], rtol = tol, atol = tol)
+    return(native)
+
+def test_matches_cvxpy():
+    compareBackends(problem)
+
+def test_matches_cvxpy_fixed_thetas():
+    def make():
+        csssobj = problem(seed = 1)
+        csssobj.constructSolve(backend = 'cvxpy')
+        csssobj.fixThetas()
+        return(csssobj)
+    compareBackends(make)
+
+def test_alpha_zero_is_not_least_squares():
+    ## A source without a fit penalty makes the KKT system singular
+    csssobj = problem(alpha = 0.0)
+    assert not LeastSquares.isLeastSquares(csssobj)
+    csssobj.constructSolve()
+    assert csssobj.lastBackend != 'leastSquares'
+
+def test_collinear_regressors_fall_back():
+    ## Without a theta regularizer collinear regressors make the Schur complement
+    # singular; the solve falls back to cvxpy instead of raising
+    csssobj = problem(collinear = True)
+    assert LeastSquares.solveLeastSquares(csssobj) is None
+    csssobj.constructSolve()
+    assert csssobj.lastBackend == 'cvxpy'
+
+    ## The sources are unique even if the thetas are not
+
+    reference = problem(collinear = True)
+    reference.constructSolve(backend = 'cvxpy')
+    for name, values in sourceValues(reference).items():
+        np.testing.assert_allclose(sourceValues(csssobj)[name], values, rtol = 1e-4, atol = 1e-4)
+
+def test_batch_solve_matches_cvxpy():
+    native    = problem(seed = 2)
+    reference = problem(seed = 2)
+    Y = np.vstack([native.aggregateSignal + shift for shift in [0.0, 1.0, -2.0]])
+    np.testing.assert_allclose(native.batchSolve(Y), reference.batchSolve(Y, native = False), rtol = 1e-4, atol = 1e-4)
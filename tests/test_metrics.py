@@ -0,0 +1,60 @@
+## Tests of the vectorized metrics (csss/Metrics.py) against the per-source loop of
+## calcPerformanceMetrics they replaced.
+import numpy as np
+import pandas as pd
+
+from csss import Metrics
+
+def loopMetrics(trueValues, estimates):
+    ## The former calcPerformanceMetrics, one source at a time with indexing
+    df = pd.DataFrame(index = pd.Index(list(trueValues.keys()), name = 'models'), columns = Metrics.COLUMNS, dtype = float)
+    for name in trueValues.keys():
+        truth = trueValues[name]
+        est   = estimates[name]
+        df.loc[name, 'mbe']  = np.mean((truth - est))
+        df.loc[name, 'mean'] = np.mean((truth))
+        df.loc[name, 'rmse'] = np.sqrt(np.mean((truth - est) ** 2))
+        df.loc[name, 'mae']  = np.mean(np.abs((truth - est)))
+        if not (df.loc[name, 'mean'] == 0):
+            df.loc[name, 'cv']   = df.loc[name, 'rmse'] / np.mean(truth)
+            df.loc[name, 'pmae'] = df.loc[name, 'mae'] / np.mean(truth)
+
+            posinds = np.abs(truth) > (0.05 * np.abs(np.mean(truth)))
+            truth = truth[posinds]
+            est   = est[posinds]
+            df.loc[name, 'rmse_pos'] = np.sqrt(np.mean((truth - est) ** 2))
+            df.loc[name, 'mae_pos']  = np.mean(np.abs((truth - est)))
+            df.loc[name, 'cv_pos']   = df.loc[name, 'rmse_pos'] / np.mean(truth)
+            df.loc[name, 'pmae_pos'] = df.loc[name, 'mae_pos'] / np.mean(truth)
+            df.loc[name, 'mbe_pos']  = np.mean((truth - est))
+            df.loc[name, 'mean_pos'] = np.mean((truth))
+    return(df)
+
+## Solar with zeros at night, a load, a negative source and a zero-mean source
+rng   = np.random.RandomState(11)
+hour  = np.arange(96) % 24
+TRUTH = {'solar': -3 * np.clip(np.sin((hour - 6) / 12.0 * np.pi), 0, None),
+         'load':  1.5 + .5 * np.cos(2 * np.pi * hour / 24.0),
+         'export': -1 - rng.rand(96),
+         'zeroMean': np.tile([1.0, -1.0], 48)}
+EST   = dict([(name, value + .2 * rng.randn(96)) for name, value in TRUTH.items()])
+
+def test_table_matches_loop():
+    names = list(TRUTH.keys())
+    table = Metrics.metricsTable(np.array([TRUTH[n] for n in names]), np.array([EST[n] for n in names]), names)
+    expected = loopMetrics(TRUTH, EST)
+    pd.testing.assert_frame_equal(table[Metrics.COLUMNS], expected[Metrics.COLUMNS], check_exact = False, rtol = 1e-12)
+    assert table.loc['zeroMean', ['cv', 'pmae', 'cv_pos', 'mean_pos']].isnull().all()
+
+def test_windows_match_loop():
+    names = list(TRUTH.keys())
+    truth = np.array([TRUTH[n] for n in names])
+    est   = np.array([EST[n] for n in names])
+    table = Metrics.windowMetrics(truth, est, names, 24, step = 12)
+    starts = sorted(set(table.index.get_level_values('window')))
+    assert starts == list(range(0, 96 - 24 + 1, 12))
+    for start in starts:
+        window = slice(start, start + 24)
+        expected = loopMetrics(dict([(n, TRUTH[n][window]) for n in names]), dict([(n, EST[n][window]) for n in names]))
+        pd.testing.assert_frame_equal(table.loc[start][Metrics.COLUMNS], expected[Metrics.COLUMNS],
+                                      check_exact = False, rtol = 1e-12)
@@ -0,0 +1,64 @@
+## Tests of the sliding window of SolarDisagg_IndvHome_Realtime.push against solving
+## the same window from scratch.
+import numpy as np
+
+from csss.Storage import FittedModel
+from csss.SolarDisagg import SolarDisagg_IndvHome_Realtime
+
+def feeder(N, seed = 0):
+    ## Aggregate net load of two homes with solar and a daily load, and their regressors
+    rng   = np.random.RandomState(seed)
+    hour  = (np.arange(N) % 24).astype(float)
+    sun   = np.clip(np.sin((hour - 6) / 12.0 * np.pi), 0, None)
+    solar = np.column_stack([sun]) * rng.uniform(.8, 1, (N, 1))
+    load  = np.column_stack([np.ones(N), np.cos(hour / 24.0 * 2 * np.pi)])
+    net   = 1 + .5 * load[:, 1] - 3 * solar[:, 0] + .1 * rng.rand(N)
+    return(net, solar, load)
+
+def fitted(regularizeSource = 'diff1_ss'):
+    ## Fitted model with source regularization on the load, which the separable
+    # backend cannot solve
+    names = ['0', '1']
+    hp    = dict([(name, {'alpha': np.array([1.0]), 'beta': np.array([0.0]), 'gamma': 0.0, 'costFunction': 'sse',
+                          'regularizeTheta': None, 'regularizeSource': None}) for name in names])
+    hp['AggregateLoad'] = {'alpha': np.array([2.0]), 'beta': np.array([0.0]), 'gamma': 0.5, 'costFunction': 'sse',
+                           'regularizeTheta': None, 'regularizeSource': regularizeSource}
+    thetas = {'0': [-1.5], '1': [-1.5], 'AggregateLoad': [1.0, 0.5]}
+    varLb  = dict([(name, 0.0) for name in thetas])
+    return(FittedModel(names, thetas, varLb, None, None, hp))
+
+def sources(model):
+    return(dict([(name, np.ravel(np.array(m['source'].value))) for name, m in model.models.items()]))
+
+def test_push_matches_cold_solve():
+    N, n, pushes = 48, 6, 3
+    net, solar, load = feeder(N + n * pushes)
+    rt = SolarDisagg_IndvHome_Realtime(fitted(), net[:N], solar[:N], load[:N])
+    rt.constructSolve()
+    for i in range(pushes):
+        new = slice(N + i * n, N + (i + 1) * n)
+        latest = rt.push(net[new], solar[new], load[new], tune = False)
+    assert rt.lastBackend == 'cvxpy'
+    assert rt.parameterize
+
+    cold = SolarDisagg_IndvHome_Realtime(fitted(), net[-N:], solar[-N:], load[-N:])
+    cold.constructSolve()
+    expected = sources(cold)
+    for name, values in sources(rt).items():
+        np.testing.assert_allclose(values, expected[name], rtol = 1e-3, atol = 1e-3)
+        np.testing.assert_allclose(latest[name], expected[name][-n:], rtol = 1e-3, atol = 1e-3)
+
+def test_separable_push_stays_native():
+    ## Without source regularization push solves the window per timestep
+    N, n = 48, 6
+    net, solar, load = feeder(N + n)
+    rt = SolarDisagg_IndvHome_Realtime(fitted(regularizeSource = None), net[:N], solar[:N], load[:N])
+    rt.constructSolve()
+    rt.push(net[N:], solar[N:], load[N:], tune = False)
+    assert rt.lastBackend == 'separable'
+    assert not rt.parameterize
+
+    cold = SolarDisagg_IndvHome_Realtime(fitted(regularizeSource = None), net[-N:], solar[-N:], load[-N:])
+    cold.constructSolve(backend = 'cvxpy')
+    for name, values in sources(cold).items():
+        np.testing.assert_allclose(sources(rt)[name], values, rtol = 1e-4, atol = 1e-4)
@@ -0,0 +1,57 @@
+## Tests of the model registry (csss/Registry.py): shared storage of regressors,
+## alphas and solutions, also after a model is pickled, e.g. for sweep workers.
+import pickle
+import numpy as np
+import pytest
+
+from csss.CSSS import CSSS
+from csss import Sweep
+
+def threeHomes(N = 24):
+    ## Three homes sharing one solar regressor, one with a time-varying alpha
+    t   = np.arange(N, dtype = float)
+    sun = np.clip(np.sin((t % 24 - 6) / 12.0 * np.pi), 0, None).reshape(-1, 1)
+    csssobj = CSSS(2 - 2.5 * sun[:, 0])
+    csssobj.addSource(sun, name = 'a', alpha = 1.0)
+    csssobj.addSource(sun.copy(), name = 'b', alpha = 1 + t / N)
+    csssobj.addSource(np.ones((N, 1)), name = 'load', alpha = 2.0, regularizeSource = 'diff1_ss', gamma = .5)
+    return(csssobj)
+
+def test_shared_storage():
+    csssobj  = threeHomes()
+    registry = csssobj.registry
+    assert csssobj.models['a']['regressor'] is csssobj.models['b']['regressor']
+    assert len(registry.regressors) == 2
+    assert registry.scalars[csssobj.models['a'].row] == 1.0
+    assert np.shares_memory(csssobj.models['b']['alpha'], registry.alphas)
+
+def test_pickle_rebinds_alphas():
+    csssobj = threeHomes()
+    csssobj.constructSolve(backend = 'cvxpy')
+    ## Pickled without its solved problem, as sent to sweep workers
+    copy = pickle.loads(Sweep.portable(csssobj))
+    registry = copy.registry
+    np.testing.assert_array_equal(registry.sources(), csssobj.registry.sources())
+    for name in ['a', 'b', 'load']:
+        np.testing.assert_array_equal(copy.models[name]['alpha'], csssobj.models[name]['alpha'])
+        assert copy.models[name].registry is registry
+
+    ## Assigning alphas writes into the restored registry, as scalars if constant
+    b = copy.models['b']
+    assert np.shares_memory(b['alpha'], registry.alphas)
+    b['alpha'] = np.linspace(2, 3, copy.N)
+    np.testing.assert_array_equal(registry.alphas[registry.alphaRows[b.row]], np.linspace(2, 3, copy.N))
+    copy.models['a']['alpha'] = 4
+    assert registry.scalars[copy.models['a'].row] == 4.0
+    assert copy.models['a']['alpha'].shape == (copy.N,)
+    assert 'alpha' in copy.models['a'].changed
+
+    ## The copy solves as a fresh model with the same alphas
+    copy.updateSourceObj('all')
+    value = copy.constructSolve(backend = 'cvxpy')
+    fresh = threeHomes()
+    fresh.models['b']['alpha'] = np.linspace(2, 3, fresh.N)
+    fresh.models['a']['alpha'] = 4
+    fresh.updateSourceObj('all')
+    assert value == pytest.approx(fresh.constructSolve(backend = 'cvxpy'), rel = 1e-6)
+    np.testing.assert_allclose(copy.solutionArray(), fresh.solutionArray(), atol = 1e-5)
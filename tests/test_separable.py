@@ -0,0 +1,65 @@
+## Tests of the water-filling solver of separable problems (csss/Separable.py)
+## against cvxpy, one timestep at a time and for a whole fixed-theta problem.
+import cvxpy as cvp
+import numpy as np
+import pytest
+
+from csss.CSSS import CSSS
+from csss import Separable
+
+def columnQP(b, alpha, lb, ub, y):
+    ## The problem of one timestep, solved by cvxpy
+    s = cvp.Variable(len(b))
+    problem = cvp.Problem(cvp.Minimize(cvp.sum_squares(cvp.mul_elemwise(np.sqrt(alpha), s - b))),
+                          [cvp.sum_entries(s) == y, s >= lb, s <= ub])
+    problem.solve()
+    return(np.ravel(np.array(s.value)))
+
+def test_water_fill_matches_qp():
+    ## Four sources over 12 timesteps, with some bounds active at the optimum
+    rng   = np.random.RandomState(7)
+    M, N  = 4, 12
+    b     = rng.randn(M, N) * 2
+    alpha = rng.uniform(.5, 3, (M, N))
+    lb    = np.vstack([-np.ones(N), -np.inf * np.ones(N), b[2] - .1, -5 * np.ones(N)])
+    ub    = np.vstack([np.ones(N), np.inf * np.ones(N), b[2] + .1, np.zeros(N)])
+    y     = np.sum(b, axis = 0) + rng.randn(N) * 3
+
+    sources = Separable.waterFill(b, alpha, lb, ub, y)
+    np.testing.assert_allclose(np.sum(sources, axis = 0), y, atol = 1e-9)
+    assert np.all(sources >= lb - 1e-12) and np.all(sources <= ub + 1e-12)
+    for t in range(N):
+        np.testing.assert_allclose(sources[:, t], columnQP(b[:, t], alpha[:, t], lb[:, t], ub[:, t], y[t]), atol = 1e-5)
+
+def test_water_fill_infeasible():
+    ## The upper bounds of the second timestep add up to less than y
+    b  = np.zeros((2, 2))
+    lb = -np.ones((2, 2))
+    ub = np.ones((2, 2))
+    assert Separable.waterFill(b, np.ones((2, 2)), lb, ub, [0.5, 2.5]) is None
+
+def feeder(N = 30):
+    ## Two bounded solar sources and an unbounded load with fixed thetas
+    hour = np.arange(N) % 24
+    sun  = np.clip(np.sin((hour - 6) / 12.0 * np.pi), 0, None).reshape(-1, 1)
+    load = np.column_stack([np.ones(N), np.cos(hour / 24.0 * 2 * np.pi)])
+    csssobj = CSSS(1.2 + .4 * load[:, 1] - 4.5 * sun[:, 0])
+    csssobj.addSource(sun, name = 'pv1', alpha = 2.0, ub = 0)
+    csssobj.addSource(sun, name = 'pv2', alpha = 1 + hour / 24.0, ub = 0, regularizeTheta = 'ss', beta = .5)
+    csssobj.addSource(load, name = 'load', alpha = 1.0, lb = 0)
+    csssobj.models['pv1']['theta']  = np.array([[-2.0]])
+    csssobj.models['pv2']['theta']  = np.array([[-1.5]])
+    csssobj.models['load']['theta'] = np.array([[1.0], [0.3]])
+    csssobj.updateSourceObj('all')
+    return(csssobj)
+
+def test_solve_separable_matches_cvxpy():
+    native = feeder()
+    value  = native.constructSolve()
+    assert native.lastBackend == 'separable'
+    reference = feeder()
+    expected  = reference.constructSolve(backend = 'cvxpy')
+    assert value == pytest.approx(expected, rel = 1e-5)
+    for name in native.models:
+        np.testing.assert_allclose(np.ravel(np.array(native.models[name]['source'].value)),
+                                   np.ravel(np.array(reference.models[name]['source'].value)), atol = 1e-4)
@@ -0,0 +1,53 @@
+## Tests of saving and loading fitted models (csss/Storage.py): a round trip must
+## give back every array and hyperparameter.
+import numpy as np
+
+from csss import Storage
+
+NAMES = ['home1', 'home2', 'home3']
+N     = 8
+
+def hyper(alpha, regularizeSource = None, costFunction = 'sse', beta = 0.0):
+    return({'alpha': np.ravel(np.array(alpha, dtype = float)), 'beta': np.ravel(np.array(beta, dtype = float)),
+            'gamma': 0.5 if regularizeSource else 0.0, 'costFunction': costFunction,
+            'regularizeTheta': 'ss' if np.any(np.array(beta) != 0) else None, 'regularizeSource': regularizeSource})
+
+## Variance regressions fitted to 1-D targets, as in SolarDisagg_IndvHome.fitTuneModels
+FITTED = Storage.FittedModel(
+    NAMES,
+    {'home1': np.array([-1.2, 0.1]), 'home2': np.array([-0.8, 0.3]), 'home3': np.array([-2.0, 0.0]),
+     'AggregateLoad': np.array([1.5, 0.2, -0.4])},
+    {'home1': 0.01, 'home2': 0.02, 'home3': 0.0, 'AggregateLoad': 0.05},
+    Storage.LinearPredictor([0.5, -0.25], 0.1),
+    Storage.LinearPredictor([2.0, 1.0, 0.5], -0.3),
+    {'home1': hyper(1.0), 'home2': hyper(np.linspace(1, 2, N), beta = [.1, .2]),
+     'home3': hyper(3.0, costFunction = 'l1'), 'AggregateLoad': hyper(2.0, 'diff1_ss', beta = .5)})
+
+def test_round_trip(tmp_path):
+    path = str(tmp_path / 'fitted.npz')
+    Storage.saveFitted(FITTED, path)
+    loaded = Storage.loadFitted(path)
+
+    assert loaded.names == NAMES
+    for name in NAMES + ['AggregateLoad']:
+        np.testing.assert_array_equal(loaded.thetas[name], FITTED.thetas[name])
+        assert loaded.varLb[name] == FITTED.varLb[name]
+        expected, actual = FITTED.hyperparameters[name], loaded.hyperparameters[name]
+        np.testing.assert_array_equal(actual['alpha'], expected['alpha'])
+        np.testing.assert_array_equal(np.broadcast_to(expected['beta'], actual['beta'].shape), actual['beta'])
+        for key in ['gamma', 'costFunction', 'regularizeTheta', 'regularizeSource']:
+            assert actual[key] == expected[key]
+
+    X = np.arange(6, dtype = float).reshape(2, 3)
+    np.testing.assert_allclose(loaded.Solar_var_norm.predict(X[:, :2]), FITTED.Solar_var_norm.predict(X[:, :2]))
+    np.testing.assert_allclose(loaded.Total_NL_var.predict(X), FITTED.Total_NL_var.predict(X))
+
+def test_source_args_of_loaded_model(tmp_path):
+    ## A time-varying alpha is only passed on for a window of its length
+    path = str(tmp_path / 'fitted.npz')
+    Storage.saveFitted(FITTED, path)
+    loaded = Storage.loadFitted(path)
+    np.testing.assert_array_equal(loaded.sourceArgs('home2', N)['alpha'], np.linspace(1, 2, N))
+    assert 'alpha' not in loaded.sourceArgs('home2', N + 1)
+    assert loaded.sourceArgs('home3', N + 1)['alpha'] == 3.0
+    assert loaded.sourceArgs('AggregateLoad', N)['regularizeSource'] == 'diff1_ss'
@@ -0,0 +1,47 @@
+## Tests of hyperparameter sweeps (csss/Sweep.py): each point must match a model
+## solved from scratch at it, and a checkpointed sweep must resume where it stopped.
+import json
+import numpy as np
+import pytest
+
+from csss.CSSS import CSSS
+from csss import Sweep
+
+def smoothing(N = 32):
+    ## A noisy signal split into a smooth part and a bounded remainder
+    t = np.arange(N, dtype = float)
+    csssobj = CSSS(np.sin(t / 4.0) + .3 * np.cos(3 * t))
+    csssobj.addSource(np.ones((N, 1)), name = 'smooth', alpha = 1.0, regularizeSource = 'diff1_ss', gamma = 1.0)
+    csssobj.addSource(np.ones((N, 1)), name = 'rest', alpha = 1.0, lb = -.5, ub = .5)
+    return(csssobj)
+
+def solvedAt(point):
+    csssobj = smoothing()
+    Sweep.applyPoint(csssobj, point)
+    return(csssobj.constructSolve(backend = 'cvxpy'))
+
+## numpy scalars, as from np.linspace grids
+POINTS = Sweep.grid(**{'smooth:gamma': np.linspace(.5, 4, 3), 'rest:alpha': [1, 2]})
+
+def test_sweep_matches_cold_solves(tmp_path):
+    checkpoint = str(tmp_path / 'sweep.jsonl')
+    table = Sweep.sweep(smoothing(), POINTS, workers = 1, checkpoint = checkpoint)
+    assert len(table) == len(POINTS)
+    for i, point in enumerate(POINTS):
+        row = table[table['point'] == i].iloc[0]
+        assert row['smooth:gamma'] == point['smooth:gamma'] and row['rest:alpha'] == point['rest:alpha']
+        assert row['value'] == pytest.approx(solvedAt(point), rel = 1e-4)
+
+def test_checkpoint_resume(tmp_path):
+    checkpoint = str(tmp_path / 'sweep.jsonl')
+    first = Sweep.sweep(smoothing(), POINTS[:4], workers = 1, checkpoint = checkpoint)
+    with open(checkpoint) as f:
+        assert [json.loads(line)['point'] for line in f] == json.loads(json.dumps(POINTS[:4], default = Sweep._plain))
+
+    ## The second run only solves the remaining points, and reports all of them
+    table = Sweep.sweep(smoothing(), POINTS, workers = 1, checkpoint = checkpoint)
+    with open(checkpoint) as f:
+        assert len(f.readlines()) == len(POINTS)
+    assert len(table) == len(POINTS)
+    np.testing.assert_array_equal(table['value'].values[:4], first['value'].values)
+    assert len(Sweep.readCheckpoint(checkpoint)) == len(POINTS)
@@ -0,0 +1,56 @@
+## Tests of time-decomposed solving (csss/TimeBlocks.py) against one cvxpy solve
+## over the whole horizon.
+import numpy as np
+import pytest
+
+from csss.CSSS import CSSS
+from csss import TimeBlocks
+
+def fixedThetas(N, regularizeSource, costFunction = 'sse'):
+    ## A periodic and a trend source with fixed thetas, and an l1 or sse residual
+    t = np.arange(N, dtype = float)
+    periodic = np.column_stack([np.sin(2 * np.pi * t / 24), np.cos(2 * np.pi * t / 24)])
+    trend    = np.column_stack([np.ones(N), t / N])
+    csssobj  = CSSS(np.dot(periodic, [1.0, .5]) + np.dot(trend, [.3, 1.0]) + .2 * np.sin(t / 5.0) ** 3)
+    csssobj.addSource(periodic, name = 'periodic', alpha = 2.0, regularizeSource = regularizeSource, gamma = 4.0,
+                      costFunction = costFunction, regularizeTheta = 'ss', beta = .1)
+    csssobj.addSource(trend, name = 'trend', alpha = 1 + t / N, lb = 0)
+    csssobj.models['periodic']['theta'] = np.array([[.9], [.6]])
+    csssobj.models['trend']['theta']    = np.array([[.3], [1.1]])
+    csssobj.updateSourceObj('all')
+    return(csssobj)
+
+def solution(csssobj):
+    return(np.array(csssobj.solutionArray()))
+
+@pytest.mark.parametrize('costFunction', ['sse', 'l1'])
+def test_separable_blocks_are_exact(costFunction):
+    blocks = fixedThetas(60, None, costFunction)
+    value  = blocks.timeBlockSolve(13, workers = 1)
+    whole  = fixedThetas(60, None, costFunction)
+    expected = whole.constructSolve(backend = 'cvxpy')
+    assert value == pytest.approx(expected, rel = 1e-4, abs = 1e-6)
+    np.testing.assert_allclose(solution(blocks), solution(whole), atol = 1e-4)
+
+def test_banded_blocks_converge_with_reconcile():
+    ## The block boundaries of diff1_ss sources are approximate after the overlapping
+    # solve, and closer to the monolithic solution after reconciling
+    whole    = fixedThetas(72, 'diff1_ss')
+    expected = whole.constructSolve(backend = 'cvxpy')
+    errors   = []
+    for reconcile in [0, 3]:
+        blocks = fixedThetas(72, 'diff1_ss')
+        value  = blocks.timeBlockSolve(18, overlap = 2, reconcile = reconcile, workers = 1)
+        assert value >= expected - 1e-6
+        errors.append(np.max(np.abs(solution(blocks) - solution(whole))))
+    assert errors[1] < errors[0]
+    assert errors[1] < 1e-5
+
+def test_objective_value_matches_cvxpy():
+    ## The numpy objective equals the cvxpy objective at the same sources
+    for regularizeSource, costFunction in [(None, 'sse'), (None, 'l1'), ('diff1_ss', 'sse')]:
+        csssobj = fixedThetas(40, regularizeSource, costFunction)
+        csssobj.constructSolve(backend = 'cvxpy')
+        sources   = dict([(name, np.ravel(np.array(m['source'].value))) for name, m in csssobj.models.items()])
+        baselines = dict([(name, np.ravel(np.dot(m['regressor'], m['theta']))) for name, m in csssobj.models.items()])
+        assert TimeBlocks.objectiveValue(csssobj, sources, baselines) == pytest.approx(csssobj._problemObjective().value, rel = 1e-8)